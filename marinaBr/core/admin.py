@@ -1,8 +1,27 @@
-from django.contrib import admin
-from django.utils.html import format_html
+from datetime import date, timedelta
+
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.html import escape, format_html, format_html_join
 from django.utils.safestring import mark_safe
 
-from core.models import Product, Category, Order, OrderItem, ReadySolution, ReadySolutionItem
+from marinaBr.routers import read_alias, replica_reads
+
+from core.models import (
+    ArchivedOrder, ArchivedOrderItem, Category, DeliverySlot, Order, OrderItem, OrderStatusChange, OutboxEmail, Product,
+    ReadySolution, ReadySolutionItem,
+)
+from core.delivery import release_slots
+from core.exports import InvalidExportFilter, filter_orders, stream_orders_csv
+from core.order_status import apply_transitions, change_status
+from core.production import build_production_plan, write_production_plan_csv
+from core.search import filter_by_search, search_available
+from core.services import ORDER_SUMMARY_ITEMS
 
 
 @admin.register(Category)
@@ -58,11 +77,35 @@ class ProductAdmin(admin.ModelAdmin):
     }
     search_fields = ('title', 'description')
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск через полнотекстовый индекс вместо LIKE по таблице"""
+        if not search_term or not search_available():
+            return super().get_search_results(request, queryset, search_term)
+        return filter_by_search(queryset, search_term), False
+
+
+def status_history(order_id):
+    """Журнал смены статусов заказа (и архивного заказа - номер тот же)"""
+    changes = OrderStatusChange.objects.filter(order_id=order_id).select_related('changed_by')
+    rows = format_html_join(
+        '', '<li>{} — {} → {}{}</li>',
+        (
+            (
+                timezone.localtime(change.changed_at).strftime('%d.%m.%Y %H:%M'),
+                change.get_from_status_display(),
+                change.get_to_status_display(),
+                f' ({change.changed_by})' if change.changed_by else '',
+            )
+            for change in changes
+        ),
+    )
+    return format_html('<ul style="margin: 0;">{}</ul>', rows) if rows else 'Статус не менялся'
+
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
-    fields = ('product', 'quantity', 'price', 'item_total')
-    readonly_fields = ('product', 'quantity', 'price', 'item_total')
+    fields = ('item_type', 'title', 'get_components', 'quantity', 'price', 'item_total')
+    readonly_fields = ('item_type', 'title', 'get_components', 'quantity', 'price', 'item_total')
     extra = 0
     can_delete = False
     
@@ -73,6 +116,11 @@ class OrderItemInline(admin.TabularInline):
             return f'{total} ₽'
         return '-'
     item_total.short_description = 'Сумма'
+    
+    def get_components(self, obj):
+        """Состав готового решения на момент заказа"""
+        return ', '.join(f"{c['title']} × {c['quantity']}" for c in obj.components) or '-'
+    get_components.short_description = 'Состав'
 
 
 @admin.register(Order)
@@ -80,43 +128,45 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer_name', 'customer_phone', 'get_order_items', 'total_price', 'status', 'order_date', 'order_time', 'created_at')
     list_filter = ('status', 'order_date', 'created_at')
     search_fields = ('customer_name', 'customer_phone', 'delivery_address')
-    readonly_fields = ('created_at', 'updated_at', 'total_price', 'get_order_items_detail')
+    readonly_fields = ('created_at', 'updated_at', 'total_price', 'delivery_slot', 'get_order_items_detail', 'get_status_history')
     inlines = [OrderItemInline]
     list_editable = ('status',)  # Позволяет изменять статус прямо из списка
-    actions = ['mark_as_new', 'mark_as_processing', 'mark_as_completed', 'mark_as_cancelled']
+    actions = ['mark_as_new', 'mark_as_processing', 'mark_as_completed', 'mark_as_cancelled', 'export_csv']
     
     fieldsets = (
         ('Информация о клиенте', {
             'fields': ('customer_name', 'customer_phone')
         }),
         ('Детали заказа', {
-            'fields': ('order_date', 'order_time', 'delivery_address', 'total_price', 'status')
+            'fields': ('order_date', 'order_time', 'delivery_slot', 'delivery_address', 'total_price', 'status')
         }),
         ('Содержание заказа', {
             'fields': ('get_order_items_detail',),
             'classes': ('collapse',)
         }),
+        ('История статусов', {
+            'fields': ('get_status_history',),
+            'classes': ('collapse',)
+        }),
         ('Системная информация', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
     
+    def get_status_history(self, obj):
+        return status_history(obj.pk) if obj.pk else '-'
+    get_status_history.short_description = 'История статусов'
+    
     def get_order_items(self, obj):
-        """Показать товары в заказе в списке"""
-        items = obj.items.all()
-        if not items:
+        """Показать товары в заказе в списке (по сводке в заказе, без запросов к строкам)"""
+        if not obj.items_count:
             return '-'
         
-        items_list = []
-        for item in items:
-            items_list.append(f'{item.product.title} × {item.quantity}')
-        
-        # Показываем первые 3 товара, остальные скрываем
-        display_items = items_list[:3]
-        result = ', '.join(display_items)
-        if len(items_list) > 3:
-            result += f' <span style="color: #666;">(+{len(items_list) - 3} еще)</span>'
+        result = escape(obj.items_summary)
+        # В сводке первые 3 товара, остальные только считаем
+        if obj.items_count > ORDER_SUMMARY_ITEMS:
+            result += format_html(' <span style="color: #666;">(+{} еще)</span>', obj.items_count - ORDER_SUMMARY_ITEMS)
         
         return mark_safe(result)
     get_order_items.short_description = 'Товары'
@@ -134,7 +184,11 @@ class OrderAdmin(admin.ModelAdmin):
         for item in items:
             item_total = item.quantity * item.price
             html += f'<tr>'
-            html += f'<td style="padding: 8px; border: 1px solid #ddd;">{item.product.title}</td>'
+            html += f'<td style="padding: 8px; border: 1px solid #ddd;">{escape(item.title)}'
+            if item.components:
+                components = ', '.join(f"{escape(c['title'])} × {c['quantity']}" for c in item.components)
+                html += f'<br><small style="color: #666;">{components}</small>'
+            html += '</td>'
             html += f'<td style="padding: 8px; border: 1px solid #ddd; text-align: center;">{item.quantity}</td>'
             html += f'<td style="padding: 8px; border: 1px solid #ddd; text-align: right;">{item.price} ₽</td>'
             html += f'<td style="padding: 8px; border: 1px solid #ddd; text-align: right;"><strong>{item_total} ₽</strong></td>'
@@ -146,23 +200,214 @@ class OrderAdmin(admin.ModelAdmin):
         return mark_safe(html)
     get_order_items_detail.short_description = 'Содержание заказа'
     
-    # Действия для массового изменения статуса
+    def get_urls(self):
+        urls = [
+            path('production-plan/', self.admin_site.admin_view(self.production_plan_view), name='core_order_production_plan'),
+            path('export/', self.admin_site.admin_view(self.export_view), name='core_order_export'),
+        ]
+        return urls + super().get_urls()
+    
+    def export_view(self, request):
+        """CSV с заказами по фильтрам и поиску списка заказов (status, order_date, created_at, q)"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            # Строки читаются уже после выхода из представления, поэтому база выбирается явно
+            queryset = filter_orders(Order.objects.using(read_alias(prefer_replica=True)), request.GET)
+        except InvalidExportFilter as e:
+            return HttpResponseBadRequest(str(e))
+        queryset, may_have_duplicates = self.get_search_results(request, queryset, request.GET.get('q', ''))
+        if may_have_duplicates:
+            queryset = queryset.distinct()
+        return stream_orders_csv(queryset, f'orders-{date.today()}.csv')
+    
+    def export_csv(self, request, queryset):
+        return stream_orders_csv(queryset.using(read_alias(prefer_replica=True)), f'orders-{date.today()}.csv')
+    export_csv.short_description = 'Выгрузить в CSV'
+    
+    def production_plan_view(self, request):
+        """План производства на выбранные даты, с выгрузкой в CSV"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            date_from = date.fromisoformat(request.GET['date_from'])
+        except (KeyError, ValueError):
+            date_from = date.today() + timedelta(days=1)
+        try:
+            date_to = max(date.fromisoformat(request.GET['date_to']), date_from)
+        except (KeyError, ValueError):
+            date_to = date_from
+        
+        with replica_reads():
+            plan = build_production_plan(date_from, date_to)
+        
+        if request.GET.get('format') == 'csv':
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="production-plan-{date_from}-{date_to}.csv"'
+            response.write('\ufeff')  # BOM, чтобы Excel распознал UTF-8
+            write_production_plan_csv(plan, response)
+            return response
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'План производства',
+            'plan': plan,
+            'date_from': date_from,
+            'date_to': date_to,
+        }
+        return TemplateResponse(request, 'admin/core/order/production_plan.html', context)
+    
+    # Смена статуса из действий, из списка (list_editable) и из формы заказа
+    # идёт через change_status/apply_transitions: проверка перехода,
+    # одно UPDATE на статус и запись в журнал OrderStatusChange
+    def _report_transitions(self, request, result):
+        if result.rejected:
+            statuses = dict(Order.STATUS_CHOICES)
+            details = ', '.join(
+                f'#{order_id} ({statuses[from_status]} → {statuses[to_status]})'
+                for order_id, from_status, to_status in result.rejected[:10]
+            )
+            if len(result.rejected) > 10:
+                details += f' и ещё {len(result.rejected) - 10}'
+            self.message_user(request, f'Переход статуса не разрешён для заказов: {details}', messages.WARNING)
+    
+    def _mark_as(self, request, queryset, status):
+        result = change_status(queryset, status, request.user)
+        self.message_user(
+            request, f'{len(result.changed)} заказ(ов) помечено(ы) как "{dict(Order.STATUS_CHOICES)[status]}"',
+        )
+        self._report_transitions(request, result)
+    
     def mark_as_new(self, request, queryset):
-        queryset.update(status='new')
-        self.message_user(request, f'{queryset.count()} заказ(ов) помечено(ы) как "Новый"')
+        self._mark_as(request, queryset, 'new')
     mark_as_new.short_description = 'Пометить как "Новый"'
     
     def mark_as_processing(self, request, queryset):
-        queryset.update(status='processing')
-        self.message_user(request, f'{queryset.count()} заказ(ов) помечено(ы) как "В обработке"')
+        self._mark_as(request, queryset, 'processing')
     mark_as_processing.short_description = 'Пометить как "В обработке"'
     
     def mark_as_completed(self, request, queryset):
-        queryset.update(status='completed')
-        self.message_user(request, f'{queryset.count()} заказ(ов) помечено(ы) как "Завершен"')
+        self._mark_as(request, queryset, 'completed')
     mark_as_completed.short_description = 'Пометить как "Завершен"'
     
     def mark_as_cancelled(self, request, queryset):
-        queryset.update(status='cancelled')
-        self.message_user(request, f'{queryset.count()} заказ(ов) помечено(ы) как "Отменен"')
-    mark_as_cancelled.short_description = 'Пометить как "Отменен"'
\ No newline at end of file
+        self._mark_as(request, queryset, 'cancelled')
+    mark_as_cancelled.short_description = 'Пометить как "Отменен"'
+    
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'POST' or '_save' not in request.POST:
+            return super().changelist_view(request, extra_context)
+        # Статусы из списка не сохраняются построчно: save_model собирает их,
+        # и они применяются одним apply_transitions
+        request._status_changes = {}
+        with transaction.atomic():
+            response = super().changelist_view(request, extra_context)
+            if request._status_changes:
+                self._report_transitions(request, apply_transitions(request._status_changes, request.user))
+        return response
+    
+    def save_model(self, request, obj, form, change):
+        if not change or 'status' not in form.changed_data:
+            super().save_model(request, obj, form, change)
+            return
+        new_status = obj.status
+        obj.status = form.initial['status']
+        status_changes = getattr(request, '_status_changes', None)
+        if status_changes is not None:
+            # Строка списка: кроме статуса в ней ничего не редактируется
+            status_changes[obj.pk] = new_status
+            return
+        super().save_model(request, obj, form, change)
+        result = change_status(Order.objects.filter(pk=obj.pk), new_status, request.user)
+        self._report_transitions(request, result)
+        obj.refresh_from_db(fields=['status', 'delivery_slot', 'updated_at'])
+    
+    def delete_model(self, request, obj):
+        # Место в окне доставки освобождается вместе с заказом
+        with transaction.atomic():
+            release_slots(Order.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            release_slots(queryset)
+            super().delete_queryset(request, queryset)
+    
+    def log_change(self, request, obj, message):
+        # Смены статуса из списка записываются в OrderStatusChange одной вставкой
+        if getattr(request, '_status_changes', None) is not None:
+            return None
+        return super().log_change(request, obj, message)
+
+
+@admin.register(DeliverySlot)
+class DeliverySlotAdmin(admin.ModelAdmin):
+    list_display = ('date', 'start_time', 'end_time', 'capacity', 'reserved')
+    list_filter = ('date',)
+    list_editable = ('capacity',)
+    readonly_fields = ('reserved',)
+    date_hierarchy = 'date'
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject',)
+    readonly_fields = ('subject', 'body', 'from_email', 'to', 'attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        """Вернуть письма в очередь, в том числе недоставленные"""
+        count = queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        self.message_user(request, f'{count} письм(о/а) возвращено в очередь')
+    retry_now.short_description = 'Отправить повторно'
+
+
+class ArchivedOrderItemInline(OrderItemInline):
+    model = ArchivedOrderItem
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Архив только для просмотра: заказы сюда попадают командой archive_orders"""
+    list_display = ('id', 'customer_name', 'customer_phone', 'total_price', 'status', 'order_date', 'created_at', 'archived_at')
+    list_filter = ('status', 'order_date')
+    search_fields = ('id', 'customer_name', 'customer_phone', 'delivery_address')
+    date_hierarchy = 'order_date'
+    readonly_fields = ('get_status_history',)
+    inlines = [ArchivedOrderItemInline]
+
+    def get_status_history(self, obj):
+        return status_history(obj.pk)
+    get_status_history.short_description = 'История статусов'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OrderStatusChange)
+class OrderStatusChangeAdmin(admin.ModelAdmin):
+    list_display = ('order_id', 'from_status', 'to_status', 'changed_by', 'changed_at')
+    list_filter = ('to_status', 'changed_at')
+    search_fields = ('order_id',)
+    list_select_related = ('changed_by',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
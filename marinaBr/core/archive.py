@@ -0,0 +1,84 @@
+"""
+Архив заказов.
+
+Выполненные и отменённые заказы старше ORDER_ARCHIVE_AFTER_DAYS дней (по дате
+доставки) переносятся из order и order_item в archived_order и
+archived_order_item. Перенос идёт пачками: каждая пачка - своя короткая
+транзакция (копия строк, затем удаление оригиналов), поэтому оформление
+заказов не ждёт, пока переносится весь хвост.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+
+ARCHIVE_STATUSES = ('completed', 'cancelled')
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 500
+
+ARCHIVED_ORDER_FIELDS = (
+    'id', 'customer_name', 'customer_phone', 'order_date', 'order_time', 'delivery_address',
+    'total_price', 'status', 'created_at', 'updated_at',
+)
+ARCHIVED_ITEM_FIELDS = (
+    'order_id', 'item_type', 'product_id', 'ready_solution_id', 'title', 'components', 'quantity', 'price',
+)
+
+
+def archive_cutoff(days=None):
+    """Заказы с датой доставки раньше этой даты попадают в архив"""
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)
+    return timezone.localdate() - timedelta(days=days)
+
+
+def archivable_orders(cutoff):
+    return Order.objects.filter(status__in=ARCHIVE_STATUSES, order_date__lt=cutoff)
+
+
+@retry_on_locked
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Перенести в архив одну пачку заказов.
+
+    Возвращает (заказов, строк). (0, 0) - переносить больше нечего.
+    """
+    with transaction.atomic():
+        # Без ORDER BY: пачка выбирается по индексу (status, order_date), порядок не важен
+        ids = list(archivable_orders(cutoff).order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0, 0
+
+        orders = Order.objects.filter(id__in=ids).values(*ARCHIVED_ORDER_FIELDS)
+        items = OrderItem.objects.filter(order_id__in=ids).order_by('id').values(*ARCHIVED_ITEM_FIELDS)
+        archived_items = [ArchivedOrderItem(**item) for item in items]
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create(archived_items)
+
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__in=ids).delete()
+
+    return len(ids), len(archived_items)
+
+
+def archive_orders(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Перенести в архив все подходящие заказы.
+
+    Генератор: после каждой пачки отдаёт словарь orders, items, seconds.
+    """
+    while True:
+        started = time.monotonic()
+        orders, items = archive_batch(cutoff, batch_size)
+        if not orders:
+            return
+        yield {'orders': orders, 'items': items, 'seconds': time.monotonic() - started}
+        if orders < batch_size:
+            return
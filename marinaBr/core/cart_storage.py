@@ -0,0 +1,187 @@
+"""
+Хранилища корзины.
+
+Корзина вместе с ревизией живёт либо в сессии (SessionCartStorage), либо
+в подписанной cookie (CookieCartStorage). Cookie-хранилище не трогает базу:
+анонимный посетитель может листать витрину и менять корзину без единой
+записи в django_session. Если корзина не помещается в cookie, она
+сохраняется в сессии.
+
+Рядом с корзиной хранится сводка (число строк, количество, сумма) с
+отметками версии каталога и ревизии корзины, для которых она посчитана:
+счётчик в шапке и сумма не требуют запросов к базе, пока отметки актуальны.
+
+Хранилище выбирается настройкой CART_STORAGE и создаётся один раз на запрос.
+Изменения cookie записываются в ответ в CartMiddleware.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core import signing
+from django.utils.module_loading import import_string
+
+
+CART_COOKIE_NAME = 'cart'
+CART_COOKIE_SALT = 'core.cart'
+CART_COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+# Запас до лимита браузеров в 4096 байт на cookie вместе с атрибутами
+CART_COOKIE_MAX_SIZE = 3500
+
+READY_SOLUTION_PREFIX = 'ready_solution_'
+
+SUMMARY_FIELDS = ('lines', 'quantity', 'total_price', 'catalog_version', 'revision')
+
+
+def pack_cart_summary(summary):
+    """Сводка корзины в виде, пригодном для JSON"""
+    if summary is None:
+        return None
+    return [str(summary[field]) if field == 'total_price' else summary[field] for field in SUMMARY_FIELDS]
+
+
+def unpack_cart_summary(packed):
+    """Сводка корзины из упакованного вида. Повреждённая сводка - None"""
+    if not isinstance(packed, list) or len(packed) != len(SUMMARY_FIELDS):
+        return None
+    summary = dict(zip(SUMMARY_FIELDS, packed))
+    try:
+        summary['total_price'] = Decimal(summary['total_price'])
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    return summary
+
+
+class SessionCartStorage:
+    """Корзина в сессии: каждое изменение - запись в хранилище сессий"""
+
+    def __init__(self, request):
+        self.request = request
+        self.cart = request.session.get('cart', {})
+        self.revision = request.session.get('cart_revision', 0)
+        self.summary = unpack_cart_summary(request.session.get('cart_summary'))
+
+    def save(self, cart, revision):
+        self.cart = cart
+        self.revision = revision
+        self.request.session['cart'] = cart
+        self.request.session['cart_revision'] = revision
+        self.request.session.modified = True
+
+    def save_summary(self, summary):
+        self.summary = summary
+        self.request.session['cart_summary'] = pack_cart_summary(summary)
+
+    def update_response(self, response):
+        pass
+
+
+def encode_cart_cookie(cart, revision=0, summary=None):
+    """
+    Компактно упаковать и подписать корзину.
+
+    В cookie хранится только ключ строки и количество: тип готового
+    решения восстанавливается по префиксу ключа.
+    """
+    data = {'c': {key: item.get('quantity', 1) for key, item in cart.items()}, 'r': revision}
+    if summary is not None:
+        data['s'] = pack_cart_summary(summary)
+    return signing.dumps(data, salt=CART_COOKIE_SALT, compress=True)
+
+
+def decode_cart_cookie(value):
+    """Корзина, ревизия и сводка из cookie. Поддельная или устаревшая cookie - None"""
+    try:
+        data = signing.loads(value, salt=CART_COOKIE_SALT, max_age=CART_COOKIE_MAX_AGE)
+        quantities, revision = data['c'], data['r']
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+    cart = {}
+    for key, quantity in quantities.items():
+        if not isinstance(quantity, int):
+            continue
+        cart[key] = {'quantity': quantity}
+        if key.startswith(READY_SOLUTION_PREFIX):
+            cart[key]['type'] = 'ready_solution'
+    summary = unpack_cart_summary(data['s']) if 's' in data else None
+    return cart, revision, summary
+
+
+class CookieCartStorage:
+    """
+    Корзина в подписанной cookie, с сессией как запасным вариантом.
+
+    Сессия читается, только если cookie корзины нет, а cookie сессии есть:
+    так подхватываются корзины, сохранённые до перехода на cookie или не
+    поместившиеся в неё.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.cookie_value = None
+        self.modified = False
+        self.in_session = False
+
+        decoded = None
+        if CART_COOKIE_NAME in request.COOKIES:
+            decoded = decode_cart_cookie(request.COOKIES[CART_COOKIE_NAME])
+        if decoded is None and settings.SESSION_COOKIE_NAME in request.COOKIES and 'cart' in request.session:
+            decoded = (
+                request.session['cart'],
+                request.session.get('cart_revision', 0),
+                unpack_cart_summary(request.session.get('cart_summary')),
+            )
+            self.in_session = True
+
+        self.cart, self.revision, self.summary = decoded or ({}, 0, None)
+
+    def save(self, cart, revision):
+        self.cart = cart
+        self.revision = revision
+        self._write()
+
+    def save_summary(self, summary):
+        self.summary = summary
+        self._write()
+
+    def _write(self):
+        self.modified = True
+
+        value = encode_cart_cookie(self.cart, self.revision, self.summary)
+        if len(value) <= CART_COOKIE_MAX_SIZE:
+            self.cookie_value = value
+            if self.in_session:
+                del self.request.session['cart']
+                self.request.session.pop('cart_revision', None)
+                self.request.session.pop('cart_summary', None)
+                self.in_session = False
+        else:
+            self.cookie_value = None
+            self.request.session['cart'] = self.cart
+            self.request.session['cart_revision'] = self.revision
+            self.request.session['cart_summary'] = pack_cart_summary(self.summary)
+            self.in_session = True
+
+    def update_response(self, response):
+        if not self.modified:
+            return
+        if self.cookie_value is None:
+            response.delete_cookie(CART_COOKIE_NAME, samesite='Lax')
+        else:
+            response.set_cookie(
+                CART_COOKIE_NAME,
+                self.cookie_value,
+                max_age=CART_COOKIE_MAX_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite='Lax',
+            )
+
+
+def get_cart_storage(request):
+    """Хранилище корзины текущего запроса"""
+    storage = getattr(request, '_cart_storage', None)
+    if storage is None:
+        storage_class = import_string(getattr(settings, 'CART_STORAGE', 'core.cart_storage.SessionCartStorage'))
+        storage = request._cart_storage = storage_class(request)
+    return storage
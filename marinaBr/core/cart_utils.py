@@ -1,11 +1,30 @@
+import time
 from decimal import Decimal
+from .cart_storage import READY_SOLUTION_PREFIX, get_cart_storage
+from .catalog import get_catalog_version
 from .models import Product, ReadySolution
 
 
 def get_cart(request):
-    """Получить корзину из сессии"""
-    cart = request.session.get('cart', {})
-    return cart
+    """Получить корзину из хранилища корзины (cookie или сессия)"""
+    return get_cart_storage(request).cart
+
+
+def get_cart_revision(request):
+    """Ревизия корзины: растёт при каждом изменении, 0 для нетронутой корзины"""
+    return get_cart_storage(request).revision
+
+
+def save_cart(request, cart):
+    """
+    Сохранить корзину и сдвинуть её ревизию.
+
+    Ревизия - метка времени изменения в миллисекундах, но не меньше
+    предыдущей ревизии + 1, поэтому её можно использовать и как счётчик,
+    и как дату последнего изменения.
+    """
+    revision = max(int(time.time() * 1000), get_cart_revision(request) + 1)
+    get_cart_storage(request).save(cart, revision)
 
 
 def add_to_cart(request, product_id, quantity=1):
@@ -18,8 +37,7 @@ def add_to_cart(request, product_id, quantity=1):
     else:
         cart[product_id] = {'quantity': quantity}
     
-    request.session['cart'] = cart
-    request.session.modified = True
+    save_cart(request, cart)
     return cart
 
 
@@ -30,8 +48,7 @@ def remove_from_cart(request, product_id):
     
     if product_id in cart:
         del cart[product_id]
-        request.session['cart'] = cart
-        request.session.modified = True
+        save_cart(request, cart)
     
     return cart
 
@@ -46,42 +63,38 @@ def update_cart_item(request, product_id, quantity):
             cart[product_id]['quantity'] = quantity
         else:
             del cart[product_id]
-        request.session['cart'] = cart
-        request.session.modified = True
+        save_cart(request, cart)
     
     return cart
 
 
 def clear_cart(request):
     """Очистить корзину"""
-    request.session['cart'] = {}
-    request.session.modified = True
+    save_cart(request, {})
 
 
 def add_ready_solution_to_cart(request, solution_id, quantity=1):
     """Добавить готовое решение в корзину"""
     cart = get_cart(request)
-    item_key = f'ready_solution_{solution_id}'
+    item_key = f'{READY_SOLUTION_PREFIX}{solution_id}'
     
     if item_key in cart:
         cart[item_key]['quantity'] += quantity
     else:
         cart[item_key] = {'quantity': quantity, 'type': 'ready_solution'}
     
-    request.session['cart'] = cart
-    request.session.modified = True
+    save_cart(request, cart)
     return cart
 
 
 def remove_ready_solution_from_cart(request, solution_id):
     """Удалить готовое решение из корзины"""
     cart = get_cart(request)
-    item_key = f'ready_solution_{solution_id}'
+    item_key = f'{READY_SOLUTION_PREFIX}{solution_id}'
     
     if item_key in cart:
         del cart[item_key]
-        request.session['cart'] = cart
-        request.session.modified = True
+        save_cart(request, cart)
     
     return cart
 
@@ -89,65 +102,227 @@ def remove_ready_solution_from_cart(request, solution_id):
 def update_ready_solution_cart_item(request, solution_id, quantity):
     """Обновить количество готового решения в корзине"""
     cart = get_cart(request)
-    item_key = f'ready_solution_{solution_id}'
+    item_key = f'{READY_SOLUTION_PREFIX}{solution_id}'
     
     if item_key in cart:
         if quantity > 0:
             cart[item_key]['quantity'] = quantity
         else:
             del cart[item_key]
-        request.session['cart'] = cart
-        request.session.modified = True
+        save_cart(request, cart)
     
     return cart
 
 
-def get_cart_items(request):
-    """Получить товары корзины с полной информацией (продукты и готовые решения)"""
-    cart = get_cart(request)
-    cart_items = []
-    total_price = Decimal('0')
-    
+CART_OPERATIONS = ('add', 'update', 'remove')
+CART_ITEM_TYPES = ('product', 'ready_solution')
+
+
+class InvalidCartOperation(ValueError):
+    pass
+
+
+def cart_key(item_type, object_id):
+    """Ключ строки корзины в сессии"""
+    if item_type == 'ready_solution':
+        return f'{READY_SOLUTION_PREFIX}{object_id}'
+    return str(object_id)
+
+
+def _validate_cart_operation(operation):
+    if not isinstance(operation, dict):
+        raise InvalidCartOperation('Операция должна быть объектом')
+
+    op = operation.get('op')
+    item_type = operation.get('type', 'product')
+    object_id = operation.get('id')
+    quantity = operation.get('quantity', 1 if op == 'add' else 0)
+
+    if op not in CART_OPERATIONS:
+        raise InvalidCartOperation(f'Неизвестная операция: {op}')
+    if item_type not in CART_ITEM_TYPES:
+        raise InvalidCartOperation(f'Неизвестный тип: {item_type}')
+    if isinstance(object_id, bool) or not isinstance(object_id, int):
+        raise InvalidCartOperation('id должен быть целым числом')
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 0:
+        raise InvalidCartOperation('quantity должно быть неотрицательным целым числом')
+
+    return op, item_type, object_id, quantity
+
+
+def apply_cart_operations(request, operations):
+    """
+    Применить пачку операций над корзиной и сохранить её один раз.
+
+    Операция: {'op': 'add' | 'update' | 'remove', 'type': 'product' | 'ready_solution',
+    'id': ..., 'quantity': ...}. Сначала проверяются все операции: при ошибке
+    корзина не меняется. Добавленные строки, которых нет на витрине, отбрасываются.
+    Возвращает строки корзины и общую сумму, как get_cart_items.
+    """
+    validated = [_validate_cart_operation(operation) for operation in operations]
+
+    cart = {key: dict(data) for key, data in get_cart(request).items()}
+    added = set()
+    for op, item_type, object_id, quantity in validated:
+        key = cart_key(item_type, object_id)
+        if op == 'add':
+            if quantity == 0:
+                continue
+            if key in cart:
+                cart[key]['quantity'] += quantity
+            else:
+                cart[key] = {'quantity': quantity}
+                if item_type == 'ready_solution':
+                    cart[key]['type'] = 'ready_solution'
+                added.add(key)
+        elif op == 'update' and key in cart and quantity > 0:
+            cart[key]['quantity'] = quantity
+        elif key in cart:
+            # remove или update с нулевым количеством
+            del cart[key]
+
+    cart_items, total_price = resolve_cart_items(cart)
+
+    resolved = {cart_key(item['type'], item[item['type']].id) for item in cart_items}
+    for key in added - resolved:
+        cart.pop(key, None)
+
+    save_cart(request, cart)
+    store_cart_summary(request, cart_items, total_price)
+    return cart_items, total_price
+
+
+def _parse_cart_keys(cart):
+    """Разобрать ключи корзины на id продуктов и id готовых решений"""
+    lines = []
+    product_ids = set()
+    solution_ids = set()
+
     for item_key, item_data in cart.items():
         quantity = item_data.get('quantity', 1)
-        
-        if item_key.startswith('ready_solution_'):
-            # Готовое решение
-            try:
-                solution_id = int(item_key.replace('ready_solution_', ''))
-                solution = ReadySolution.objects.get(id=solution_id, is_published=True)
-                item_total = solution.price * quantity
-                total_price += item_total
-                
-                cart_items.append({
-                    'ready_solution': solution,
-                    'quantity': quantity,
-                    'total': item_total,
-                    'type': 'ready_solution',
-                })
-            except ReadySolution.DoesNotExist:
+        try:
+            if item_key.startswith(READY_SOLUTION_PREFIX):
+                object_id = int(item_key[len(READY_SOLUTION_PREFIX):])
+                solution_ids.add(object_id)
+                lines.append(('ready_solution', object_id, quantity))
+            else:
+                object_id = int(item_key)
+                product_ids.add(object_id)
+                lines.append(('product', object_id, quantity))
+        except ValueError:
+            continue
+
+    return lines, product_ids, solution_ids
+
+
+def resolve_cart_items(cart):
+    """
+    Получить строки корзины и общую сумму по словарю корзины.
+
+    Все продукты и готовые решения загружаются пачкой через in_bulk:
+    не больше двух запросов независимо от количества строк.
+    """
+    lines, product_ids, solution_ids = _parse_cart_keys(cart)
+
+    products = Product.objects.filter(is_published=True).in_bulk(product_ids) if product_ids else {}
+    solutions = ReadySolution.objects.filter(is_published=True).in_bulk(solution_ids) if solution_ids else {}
+
+    cart_items = []
+    total_price = Decimal('0')
+
+    for item_type, object_id, quantity in lines:
+        if item_type == 'ready_solution':
+            solution = solutions.get(object_id)
+            if solution is None:
                 continue
+            item_total = solution.price * quantity
+            cart_items.append({
+                'ready_solution': solution,
+                'quantity': quantity,
+                'total': item_total,
+                'type': 'ready_solution',
+            })
         else:
-            # Обычный продукт
-            try:
-                product_id = int(item_key)
-                product = Product.objects.get(id=product_id, is_published=True)
-                item_total = product.price * quantity
-                total_price += item_total
-                
-                cart_items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'total': item_total,
-                    'type': 'product',
-                })
-            except (Product.DoesNotExist, ValueError):
+            product = products.get(object_id)
+            if product is None:
                 continue
-    
+            item_total = product.price * quantity
+            cart_items.append({
+                'product': product,
+                'quantity': quantity,
+                'total': item_total,
+                'type': 'product',
+            })
+        total_price += item_total
+
     return cart_items, total_price
 
 
+def get_cart_items(request):
+    """
+    Получить товары корзины с полной информацией (продукты и готовые решения).
+
+    Попутно обновляет сводку корзины, если она устарела.
+    """
+    cart = get_cart(request)
+    cart_items, total_price = resolve_cart_items(cart)
+    if cart and not _is_summary_fresh(request):
+        store_cart_summary(request, cart_items, total_price)
+    return cart_items, total_price
+
+
+def _is_summary_fresh(request):
+    storage = get_cart_storage(request)
+    summary = storage.summary
+    return (
+        summary is not None
+        and summary['revision'] == storage.revision
+        and summary['catalog_version'] == get_catalog_version()
+    )
+
+
+def store_cart_summary(request, cart_items, total_price):
+    """Сохранить сводку по уже разобранным строкам корзины"""
+    storage = get_cart_storage(request)
+    summary = {
+        'lines': len(cart_items),
+        'quantity': sum(item['quantity'] for item in cart_items),
+        'total_price': total_price,
+        'catalog_version': get_catalog_version(),
+        'revision': storage.revision,
+    }
+    storage.save_summary(summary)
+    return summary
+
+
+def get_cart_summary(request):
+    """
+    Сводка корзины: число строк, количество и общая сумма.
+
+    Берётся из хранилища корзины, пока совпадают версия каталога и ревизия
+    корзины. Иначе строки загружаются заново и сводка перезаписывается.
+    Для пустой корзины ничего не сохраняется, чтобы не выдавать cookie
+    каждому посетителю.
+    """
+    storage = get_cart_storage(request)
+    if _is_summary_fresh(request):
+        return storage.summary
+    if not storage.cart:
+        return {
+            'lines': 0,
+            'quantity': 0,
+            'total_price': Decimal('0'),
+            'catalog_version': get_catalog_version(),
+            'revision': storage.revision,
+        }
+    return store_cart_summary(request, *resolve_cart_items(storage.cart))
+
+
 def get_cart_total_quantity(request):
     """Получить общее количество товаров в корзине"""
-    cart = get_cart(request)
-    return sum(item.get('quantity', 0) for item in cart.values())
+    return get_cart_summary(request)['quantity']
+
+
+def get_cart_total_price(request):
+    """Получить общую сумму корзины"""
+    return get_cart_summary(request)['total_price']
@@ -0,0 +1,165 @@
+import base64
+import functools
+import json
+import time
+
+from django.core.cache import cache
+from django.db.models import Prefetch, Q
+from django.db.models.functions import Length
+
+from marinaBr.routers import PRIMARY, replica_reads
+
+from .models import Category, Product, ReadySolution, ReadySolutionItem
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_SNAPSHOT_KEY = 'catalog:snapshot:{version}'
+CATALOG_SNAPSHOT_TIMEOUT = 60 * 60 * 24
+CATALOG_REPLICA_VERSION_KEY = 'catalog:replica_version'
+
+
+def _timestamp_ms():
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    """
+    Текущая версия каталога.
+
+    Версия - это метка времени последнего изменения в миллисекундах,
+    поэтому после потери кэша она всегда больше любой выданной ранее.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _timestamp_ms()
+        if not cache.add(CATALOG_VERSION_KEY, version, None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Сдвинуть версию каталога, чтобы старые снимки перестали использоваться"""
+    version = max(_timestamp_ms(), get_catalog_version() + 1)
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def mark_replica_synced(version):
+    """Реплика скопирована с основной базы, когда каталог был в версии version"""
+    cache.set(CATALOG_REPLICA_VERSION_KEY, version, None)
+
+
+def replica_has_catalog():
+    """На реплике есть все изменения каталога до текущей версии"""
+    synced = cache.get(CATALOG_REPLICA_VERSION_KEY)
+    return synced is not None and synced >= get_catalog_version()
+
+
+def use_catalog_replica(view):
+    """
+    use_replica для представлений каталога с валидаторами по версии каталога.
+
+    Пока реплика не догнала версию каталога (sync_replica ещё не скопировал
+    последнее изменение), представление читает основную базу: иначе ETag
+    новой версии достался бы устаревшим данным, и клиент получал бы 304 на них.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not replica_has_catalog():
+            return view(*args, **kwargs)
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def build_ready_solution_menu():
+    """
+    Опубликованные готовые решения, сгруппированные по количеству персон.
+
+    Решения, их состав и продукты загружаются двумя запросами. Упорядоченный
+    состав каждого решения лежит в атрибуте menu_items, шаблону не нужно
+    вызывать get_items.
+    """
+    items = ReadySolutionItem.objects.using(PRIMARY).select_related('product').order_by('order', 'product__title')
+    ready_solutions = list(
+        ReadySolution.objects.using(PRIMARY).filter(is_published=True)
+        .prefetch_related(Prefetch('items', queryset=items, to_attr='menu_items'))
+        .order_by('persons_count', 'title')
+    )
+
+    menu = {}
+    for solution in ready_solutions:
+        menu.setdefault(solution.persons_count, []).append(solution)
+
+    return ready_solutions, menu
+
+
+def build_catalog_snapshot():
+    """
+    Собрать все данные каталога для главной страницы.
+
+    Снимок кэшируется под текущей версией каталога, поэтому читается всегда
+    из основной базы: отставшая реплика закэшировала бы под новой версией
+    старые данные на сутки.
+    """
+    # Исключаем категорию "Готовые решения", если она есть, чтобы избежать дублирования
+    categories = Category.objects.using(PRIMARY).annotate(name_length=Length('title')).exclude(title='Готовые решения').order_by('name_length')
+    products = Product.objects.using(PRIMARY).filter(is_published=True, is_bundle=False).select_related('category').prefetch_related('ingredient_links')
+    ready_solutions, ready_solution_menu = build_ready_solution_menu()
+
+    return {
+        'categories': list(categories),
+        'products': list(products),
+        'ready_solutions': ready_solutions,
+        'ready_solution_menu': ready_solution_menu,
+    }
+
+
+def get_catalog_snapshot():
+    """Снимок каталога для текущей версии: из кэша или собранный заново"""
+    key = CATALOG_SNAPSHOT_KEY.format(version=get_catalog_version())
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_catalog_snapshot()
+        cache.set(key, snapshot, CATALOG_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(title, object_id):
+    """Курсор keyset-пагинации: позиция (title, id) последней выданной записи"""
+    raw = json.dumps([title, object_id], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        title, object_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(title, str) or not isinstance(object_id, int):
+        raise InvalidCursor(cursor)
+    return title, object_id
+
+
+def paginate_keyset(queryset, cursor=None, limit=24):
+    """
+    Страница выборки, упорядоченной по (title, id), без OFFSET.
+
+    queryset должен отдавать словари (values) с ключами title и id.
+    Возвращает записи страницы и курсор следующей страницы или None.
+    """
+    if cursor:
+        title, object_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(title__gt=title) | Q(title=title, id__gt=object_id))
+
+    rows = list(queryset.order_by('title', 'id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['title'], rows[-1]['id'])
+    return rows, next_cursor
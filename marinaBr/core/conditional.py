@@ -0,0 +1,62 @@
+"""
+Валидаторы для условных GET-запросов (ETag / Last-Modified).
+
+Все функции читают только кэш и сессию, поэтому ответ 304 отдаётся
+без единого запроса к каталогу. Last-Modified имеет точность в секунду,
+основным валидатором остаётся ETag.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+
+from .cart_utils import get_cart_revision
+from .catalog import get_catalog_version
+
+
+def _version_datetime(version):
+    return datetime.fromtimestamp(version / 1000, tz=timezone.utc)
+
+
+def _has_pending_messages(request):
+    """Есть непоказанные сообщения: страницу нужно отрисовать заново"""
+    return len(get_messages(request)) > 0
+
+
+def cart_info_etag(request):
+    """Цены зависят от каталога, количество - от корзины"""
+    return f'cart-{get_catalog_version()}-{get_cart_revision(request)}'
+
+
+def cart_info_last_modified(request):
+    return _version_datetime(max(get_catalog_version(), get_cart_revision(request)))
+
+
+def index_etag(request):
+    """
+    Главная зависит от каталога, счётчика корзины и CSRF-токена формы.
+
+    При непоказанных сообщениях валидатора нет - страница всегда рендерится.
+    """
+    if _has_pending_messages(request):
+        return None
+    # get_token заводит секрет, если его ещё нет, - тот же, что уйдёт в cookie ответа
+    get_token(request)
+    csrf_hash = hashlib.md5(request.META['CSRF_COOKIE'].encode(), usedforsecurity=False).hexdigest()[:8]
+    return f'index-{get_catalog_version()}-{get_cart_revision(request)}-{csrf_hash}'
+
+
+def index_last_modified(request):
+    if _has_pending_messages(request):
+        return None
+    return _version_datetime(max(get_catalog_version(), get_cart_revision(request)))
+
+
+def catalog_api_etag(request, *args, **kwargs):
+    """Ответы API каталога зависят только от версии каталога"""
+    return f'catalog-api-{get_catalog_version()}'
+
+
+def catalog_api_last_modified(request, *args, **kwargs):
+    return _version_datetime(get_catalog_version())
@@ -1,12 +1,32 @@
-from .cart_utils import get_cart_total_quantity, get_cart_items
+from django.utils.functional import SimpleLazyObject, new_method_proxy
+
+from .cart_utils import get_cart_total_quantity, get_cart_total_price
+
+
+class LazyCartValue(SimpleLazyObject):
+    """Ленивое значение, которое шаблоны могут форматировать как число"""
+    __format__ = new_method_proxy(format)
+
+
+def is_admin_request(request):
+    """Запрос обрабатывается админкой"""
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match is not None and 'admin' in resolver_match.namespaces
 
 
 def cart(request):
-    """Context processor для корзины"""
-    cart_total = get_cart_total_quantity(request)
-    cart_items, total_price = get_cart_items(request)
-    
+    """
+    Context processor для корзины.
+
+    Значения ленивые: хранилище корзины читается только если шаблон
+    действительно обращается к cart_total или cart_total_price. Оба значения
+    берутся из сводки корзины, база нужна только если сводка устарела.
+    В админке корзина не нужна вовсе.
+    """
+    if is_admin_request(request):
+        return {}
+
     return {
-        'cart_total': cart_total,
-        'cart_total_price': total_price,
+        'cart_total': LazyCartValue(lambda: get_cart_total_quantity(request)),
+        'cart_total_price': LazyCartValue(lambda: get_cart_total_price(request)),
     }
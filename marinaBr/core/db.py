@@ -0,0 +1,84 @@
+"""
+Настройка соединений SQLite для продакшена.
+
+Каждому новому соединению выставляются PRAGMA из settings.SQLITE_PRAGMAS:
+журнал WAL (читатели не ждут писателя), synchronous=NORMAL, кэш страниц и
+mmap. Ожидание блокировки задаёт OPTIONS['timeout'], а соединения живут
+CONN_MAX_AGE секунд, так что PRAGMA выполняются не на каждый запрос.
+
+Даже с WAL транзакция, которая сначала читала, а потом пишет, получает
+"database is locked" сразу, без ожидания, если другой писатель успел
+закоммитить. Такие транзакции повторяются декоратором retry_on_locked.
+"""
+import functools
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 1
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Обработчик connection_created: PRAGMA для нового соединения SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(error):
+    return 'locked' in str(error)
+
+
+def retry_on_locked(func=None, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY):
+    """
+    Повторить функцию, если SQLite ответил "database is locked".
+
+    Функция должна сама открывать транзакцию (transaction.atomic) и быть
+    безопасной для повтора: при ошибке её транзакция откатывается целиком.
+    Внутри чужой транзакции повтор бессмыслен, там ошибка поднимается сразу.
+    Пауза растёт вдвое с каждой попыткой, со случайным разбросом, чтобы
+    потоки не просыпались одновременно.
+    """
+    if func is None:
+        return functools.partial(retry_on_locked, attempts=attempts, base_delay=base_delay)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_locked_error(e) or connection.in_atomic_block or attempt == attempts - 1:
+                    raise
+            delay = min(base_delay * 2 ** attempt, RETRY_MAX_DELAY)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+    return wrapper
+
+
+def copy_database(source, target, pages=1024):
+    """
+    Скопировать базу SQLite source в файл target через backup API.
+
+    Писатели source не останавливаются: если база меняется посреди копирования,
+    backup начинает заново, так что копия всегда согласованная. Читатели
+    target ждут (timeout) только момента замены страниц. Возвращает число
+    страниц базы.
+    """
+    progress = []
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target, timeout=20)
+    try:
+        src.backup(dst, pages=pages, progress=lambda status, remaining, total: progress.append(total))
+    finally:
+        dst.close()
+        src.close()
+    return progress[-1] if progress else 0
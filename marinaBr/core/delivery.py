@@ -0,0 +1,131 @@
+"""
+Окна доставки.
+
+Каждый заказ занимает место в окне (DeliverySlot), в которое попадает его
+order_time. Место занимается одним условным UPDATE ... WHERE reserved < capacity
+внутри транзакции оформления заказа: два одновременных оформления не могут
+занять последнее место оба. Если на дату окна не заведены, доставка на неё
+не ограничивается.
+
+Доступность окон для выбора даты и времени в корзине кэшируется по датам.
+Кэш даты сбрасывается, когда место занимают или освобождают, и при
+изменении окон.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, Subquery, Value, When
+
+from .models import DeliverySlot, Order
+
+
+AVAILABILITY_TIMEOUT = 60 * 10
+AVAILABILITY_MAX_DAYS = 31
+
+
+class DeliverySlotError(ValueError):
+    pass
+
+
+def _availability_key(day):
+    return f'delivery:availability:{day.isoformat()}'
+
+
+def invalidate_availability(days):
+    """
+    Сбросить кэш доступности на даты.
+
+    Кэш сбрасывается сразу и ещё раз после коммита, как снимок каталога:
+    карта, собранная другим запросом до коммита, не переживёт транзакцию.
+    """
+    keys = [_availability_key(day) for day in set(days)]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def reserve_slot(order_date, order_time):
+    """
+    Занять место в окне, в которое попадает время заказа.
+
+    Вызывается внутри транзакции оформления. Возвращает id окна или None, если
+    на дату окна не заведены. Если время вне окон или окно заполнено,
+    поднимается DeliverySlotError.
+    """
+    slots = DeliverySlot.objects.filter(
+        date=order_date, start_time__lte=order_time, end_time__gt=order_time,
+    ).order_by('start_time', 'id')
+    # Окна на дату не пересекаются (DeliverySlot.clean), но если пересечение
+    # всё же есть, место занимается только в первом из них - в том, что
+    # запишется в заказ и освободится release_slots.
+    # Запись - первый запрос: транзакция сразу берёт блокировку на запись,
+    # а не повышает её после чтения (в SQLite такое повышение у параллельных
+    # транзакций заканчивается "database is locked" без ожидания)
+    first_slot = Subquery(slots.values('id')[:1])
+    if not DeliverySlot.objects.filter(id=first_slot, reserved__lt=F('capacity')).update(reserved=F('reserved') + 1):
+        day_slots = DeliverySlot.objects.filter(date=order_date).values_list('start_time', 'end_time')
+        if not day_slots:
+            return None
+        if any(start <= order_time < end for start, end in day_slots):
+            raise DeliverySlotError('Это время уже занято, выберите другое')
+        raise DeliverySlotError('На это время доставка не выполняется, выберите другое время')
+
+    slot_id = slots.values_list('id', flat=True).first()
+    invalidate_availability([order_date])
+    return slot_id
+
+
+def release_slots(orders):
+    """
+    Освободить места, занятые заказами (при отмене и удалении).
+
+    orders - queryset заказов. Три запроса при любом числе заказов и окон:
+    подсчёт по окнам, одно UPDATE окон с CASE по id и одно UPDATE заказов.
+    """
+    with transaction.atomic():
+        held = list(
+            orders.filter(delivery_slot__isnull=False)
+            .values_list('delivery_slot', 'delivery_slot__date')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        if not held:
+            return 0
+        DeliverySlot.objects.filter(id__in=[slot_id for slot_id, _, _ in held]).update(
+            reserved=F('reserved') - Case(*(When(id=slot_id, then=Value(count)) for slot_id, _, count in held)),
+        )
+        Order.objects.filter(id__in=orders.values('id'), delivery_slot__isnull=False).update(delivery_slot=None)
+        invalidate_availability(day for _, day, _ in held)
+    return sum(count for _, _, count in held)
+
+
+def get_availability(date_from, date_to):
+    """
+    Окна доставки на даты с date_from по date_to включительно.
+
+    Возвращает {дата: [{'start', 'end', 'capacity', 'remaining'}]} только для
+    дат, на которые заведены окна. Даты, которых нет в кэше, читаются одним
+    запросом по индексу (date, start_time).
+    """
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    keys = {_availability_key(day): day for day in days}
+    cached = cache.get_many(keys)
+
+    availability = {keys[key]: slots for key, slots in cached.items()}
+    missing = [day for day in days if _availability_key(day) not in cached]
+    if missing:
+        loaded = {day: [] for day in missing}
+        slots = DeliverySlot.objects.filter(date__range=(missing[0], missing[-1])).order_by('date', 'start_time')
+        for slot in slots:
+            if slot.date in loaded:
+                loaded[slot.date].append({
+                    'start': slot.start_time.strftime('%H:%M'),
+                    'end': slot.end_time.strftime('%H:%M'),
+                    'capacity': slot.capacity,
+                    'remaining': slot.remaining,
+                })
+        cache.set_many({_availability_key(day): slots for day, slots in loaded.items()}, AVAILABILITY_TIMEOUT)
+        availability.update(loaded)
+
+    return {day: availability[day] for day in days if availability[day]}
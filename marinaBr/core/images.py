@@ -0,0 +1,146 @@
+"""
+Уменьшенные копии фотографий товаров и готовых решений.
+
+Рядом с оригиналом сохраняются копии шириной IMAGE_WIDTHS в WebP и JPEG:
+photo.jpg -> photo.w320.webp, photo.w320.jpg и т.д. Копии шире оригинала не
+делаются: у фото уже самой узкой копии их нет вовсе, и страница выводит
+оригинал - иначе srcset обещал бы браузеру 320w, которых в файле нет.
+Последним пишется photo.variants.json с шириной оригинала и списком копий:
+по нему видно, что фото уже обработано, даже если копий нет, а srcset
+дополняется оригиналом с его настоящей шириной.
+
+Копии создаются при сохранении модели (сигнал post_save) и командой
+build_image_variants для уже загруженных фото, а тег {% responsive_image %}
+выводит их через <picture> со srcset.
+"""
+import hashlib
+import json
+import logging
+import os
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Product, ReadySolution
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WIDTHS = (320, 640, 1024)
+IMAGE_FIELDS = {
+    Product: ('imageMain', 'imageSecond', 'imageThird'),
+    ReadySolution: ('image_main',),
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+VARIANTS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def variant_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}.w{width}.{extension}'
+
+
+def _variants_key(name):
+    # Имя файла может содержать пробелы и кириллицу, ключ кэша - нет
+    return f'images:variants:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def reset_variants_cache(name):
+    cache.delete(_variants_key(name))
+
+
+def manifest_name(name):
+    root, _ = os.path.splitext(name)
+    return f'{root}.variants.json'
+
+
+def has_variants(storage, name):
+    # Описание копий сохраняется последним: есть оно - есть и копии
+    return storage.exists(manifest_name(name))
+
+
+def read_manifest(storage, name):
+    """{'width': ширина оригинала, 'widths': [ширины копий]} или None, если фото не обработано"""
+    try:
+        with storage.open(manifest_name(name)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(storage, name, content):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(content))
+
+
+def _save(storage, name, image, image_format, **options):
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    _write(storage, name, buffer.getvalue())
+
+
+def build_variants(name, storage=default_storage):
+    """Сохранить копии фото name. Возвращает ширины сохранённых копий"""
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    widths = [width for width in IMAGE_WIDTHS if width <= image.width]
+    for width in sorted(widths, reverse=True):
+        resized = image
+        if width < image.width:
+            resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        _save(storage, variant_name(name, width, 'webp'), resized, 'WEBP', quality=WEBP_QUALITY, method=4)
+        if has_alpha:
+            # В JPEG нет прозрачности: прозрачное - на белом фоне
+            background = Image.new('RGB', resized.size, 'white')
+            background.paste(resized, mask=resized.getchannel('A'))
+            resized = background
+        _save(storage, variant_name(name, width, 'jpg'), resized, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    _write(storage, manifest_name(name), json.dumps({'width': image.width, 'widths': widths}).encode())
+    reset_variants_cache(name)
+    return widths
+
+
+def build_instance_variants(instance, force=False):
+    """Копии всех фото товара или готового решения, которых ещё нет"""
+    for field_name in IMAGE_FIELDS[type(instance)]:
+        image = getattr(instance, field_name)
+        if not image or (not force and has_variants(image.storage, image.name)):
+            continue
+        try:
+            build_variants(image.name, image.storage)
+        except OSError as e:
+            # Фото без файла или нечитаемое не мешает сохранить товар,
+            # страница покажет оригинал
+            logger.warning('Не удалось сделать копии %s: %s', image.name, e)
+
+
+def image_variants(image):
+    """
+    Копии фото и ширина оригинала: ([(ширина, url WebP, url JPEG)], ширина).
+
+    Копии - по возрастанию ширины; для необработанного фото - ([], None).
+    Описание копий кэшируется по имени файла, чтобы страница не читала
+    его с диска при каждой отрисовке; build_variants сбрасывает кэш.
+    """
+    key = _variants_key(image.name)
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = read_manifest(image.storage, image.name) or {}
+        cache.set(key, manifest, VARIANTS_CACHE_TIMEOUT)
+    if not manifest:
+        return [], None
+    variants = [
+        (width, image.storage.url(variant_name(image.name, width, 'webp')), image.storage.url(variant_name(image.name, width, 'jpg')))
+        for width in manifest['widths']
+    ]
+    return variants, manifest['width']
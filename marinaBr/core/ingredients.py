@@ -0,0 +1,66 @@
+"""
+Нормализованный состав продуктов.
+
+Product.ingredientsList остаётся источником правды для админки, а
+ингредиенты раскладываются в таблицы ingredient и product_ingredient.
+Фильтры "с ингредиентом" и "без ингредиента" работают по индексам этих
+таблиц, а не по строкам состава.
+"""
+from django.db.models import Exists, OuterRef
+
+from .models import Ingredient, ProductIngredient
+
+
+def normalize_ingredient(name):
+    """Ключ ингредиента: нижний регистр, е вместо ё, одиночные пробелы"""
+    return ' '.join(name.lower().replace('ё', 'е').split())
+
+
+def parse_ingredients(ingredients_list):
+    """Разобрать строку состава в пары (название как есть, нормализованное название)"""
+    parsed = []
+    seen = set()
+    for label in (ingredients_list or '').split(';'):
+        label = label.strip()
+        name = normalize_ingredient(label)
+        if name and name not in seen:
+            seen.add(name)
+            parsed.append((label, name))
+    return parsed
+
+
+def sync_product_ingredients(product):
+    """Пересобрать связи продукта с ингредиентами по ingredientsList. True, если состав изменился"""
+    parsed = parse_ingredients(product.ingredientsList)
+    current = list(ProductIngredient.objects.filter(product_id=product.pk).order_by('position').values_list('label', 'ingredient__name'))
+    if current == parsed:
+        return False
+
+    names = [name for _, name in parsed]
+    Ingredient.objects.bulk_create([Ingredient(name=name) for name in names], ignore_conflicts=True)
+    ingredient_ids = dict(Ingredient.objects.filter(name__in=names).values_list('name', 'id'))
+
+    ProductIngredient.objects.filter(product_id=product.pk).delete()
+    ProductIngredient.objects.bulk_create([
+        ProductIngredient(product_id=product.pk, ingredient_id=ingredient_ids[name], label=label, position=position)
+        for position, (label, name) in enumerate(parsed)
+    ])
+    return True
+
+
+def filter_by_ingredients(queryset, include=(), exclude=()):
+    """
+    Отфильтровать продукты по составу.
+
+    include - все перечисленные ингредиенты должны быть в составе,
+    exclude - ни одного из перечисленных. Названия сравниваются после
+    нормализации, поиск идёт по уникальному индексу ingredient.name.
+    """
+    for name in {normalize_ingredient(name) for name in include} - {''}:
+        queryset = queryset.filter(Exists(ProductIngredient.objects.filter(product=OuterRef('pk'), ingredient__name=name)))
+
+    excluded = {normalize_ingredient(name) for name in exclude} - {''}
+    if excluded:
+        queryset = queryset.exclude(Exists(ProductIngredient.objects.filter(product=OuterRef('pk'), ingredient__name__in=excluded)))
+
+    return queryset
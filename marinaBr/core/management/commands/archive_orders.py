@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import ARCHIVE_BATCH_SIZE, archivable_orders, archive_cutoff, archive_orders
+from core.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = 'Перенести старые выполненные и отменённые заказы в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Возраст заказа в днях (по умолчанию ORDER_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Заказов в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, что будет перенесено')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days не может быть отрицательным')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+
+        cutoff = archive_cutoff(options['days'])
+        self.stdout.write(f'Заказы с датой доставки до {cutoff.isoformat()}')
+
+        if options['dry_run']:
+            orders = archivable_orders(cutoff)
+            items = OrderItem.objects.filter(order__in=orders).count()
+            self.stdout.write(f'Будет перенесено заказов: {orders.count()}, строк: {items}')
+            return
+
+        total_orders = total_items = 0
+        total_seconds = 0.0
+        for number, batch in enumerate(archive_orders(cutoff, options['batch_size']), 1):
+            total_orders += batch['orders']
+            total_items += batch['items']
+            total_seconds += batch['seconds']
+            self.stdout.write(
+                f"Пачка {number}: заказов {batch['orders']}, строк {batch['items']}, {batch['seconds']:.2f} с"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено заказов: {total_orders}, строк: {total_items}, {total_seconds:.2f} с'
+        ))
@@ -0,0 +1,64 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core.images import IMAGE_FIELDS, build_variants, has_variants, reset_variants_cache
+from core.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Сделать уменьшенные копии (WebP и JPEG) для уже загруженных фото товаров и готовых решений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Процессов для обработки фото')
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии, даже если они уже есть')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть больше нуля')
+
+        names = set()
+        for model, fields in IMAGE_FIELDS.items():
+            for row in model.objects.values_list(*fields):
+                names.update(name for name in row if name)
+        missing = sorted(name for name in names if not default_storage.exists(name))
+        names = sorted(
+            name for name in names - set(missing)
+            if options['force'] or not has_variants(default_storage, name)
+        )
+        for name in missing:
+            self.stderr.write(f'Нет файла: {name}')
+        self.stdout.write(f'Фото без копий: {len(names)}')
+
+        started = time.monotonic()
+        done = failed = 0
+        # Каждый процесс настраивает Django сам: при запуске через spawn он не наследует настройку
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            futures = {pool.submit(build_variants, name): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {e}')
+                else:
+                    done += 1
+                    # Кэш процесса-обработчика может быть не общим с кэшем сайта
+                    reset_variants_cache(futures[future])
+
+        if done:
+            # Карточки товаров кэшируются целиком: перерисовать их с новыми копиями
+            cache.delete_many([
+                make_template_fragment_key('product_card', [product_id, updated_at.timestamp()])
+                for product_id, updated_at in Product.objects.values_list('id', 'updated_at')
+            ])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {done}, с ошибками: {failed}, {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.production import build_production_plan, write_production_plan_csv
+
+
+class Command(BaseCommand):
+    help = 'План производства: сколько каждого продукта приготовить на даты доставки (CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Первая дата, ГГГГ-ММ-ДД (по умолчанию завтра)')
+        parser.add_argument('--to', dest='date_to', help='Последняя дата включительно (по умолчанию равна --from)')
+        parser.add_argument('--output', help='Файл для CSV (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else date.today() + timedelta(days=1)
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else date_from
+        except ValueError as e:
+            raise CommandError(f'Неверная дата: {e}')
+        if date_to < date_from:
+            raise CommandError('--to раньше --from')
+
+        plan = build_production_plan(date_from, date_to)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8-sig') as file:
+                write_production_plan_csv(plan, file)
+            self.stderr.write(self.style.SUCCESS(f'Строк плана: {len(plan)}, записано в {options["output"]}'))
+        else:
+            write_production_plan_csv(plan, self.stdout)
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import rebuild_search_index, search_available
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать полнотекстовый индекс продуктов (SQLite FTS5)'
+
+    def handle(self, *args, **options):
+        if not search_available():
+            raise CommandError('Полнотекстовый индекс доступен только на SQLite')
+
+        started = time.perf_counter()
+        count = rebuild_search_index()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано продуктов: {count} за {elapsed:.2f} с'))
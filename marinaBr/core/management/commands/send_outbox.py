@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import OUTBOX_BATCH_SIZE, send_outbox_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправлять письма из очереди email_outbox (запускается как отдельный долгоживущий процесс)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE, help='Писем на одно SMTP-соединение')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь один раз и выйти')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        try:
+            while True:
+                sent, failed = send_outbox_batch(batch_size)
+                if sent or failed:
+                    self.stdout.write(f'Отправлено: {sent}, отложено: {failed}')
+                if sent + failed == batch_size:
+                    # Очередь, возможно, ещё не пуста
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Остановлено')
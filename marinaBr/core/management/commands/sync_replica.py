@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog import get_catalog_version, mark_replica_synced
+from core.db import copy_database
+
+
+class Command(BaseCommand):
+    help = 'Обновить локальную реплику (копию db.sqlite3 для чтения витрины и отчётов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5, help='Пауза в секундах между копиями')
+        parser.add_argument('--once', action='store_true', help='Скопировать один раз и выйти')
+
+    def handle(self, *args, **options):
+        databases = settings.DATABASES
+        if 'replica' not in databases:
+            raise CommandError('В settings.DATABASES нет базы replica')
+        source, target = databases['default']['NAME'], databases['replica']['NAME']
+        if source == target:
+            raise CommandError('Реплика совпадает с основной базой')
+
+        try:
+            while True:
+                started = time.monotonic()
+                # Версия до копирования: всё, что изменилось раньше, уже в копии
+                version = get_catalog_version()
+                pages = copy_database(source, target)
+                mark_replica_synced(version)
+                self.stdout.write(f'Скопировано страниц: {pages}, {time.monotonic() - started:.2f} с')
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Остановлено')
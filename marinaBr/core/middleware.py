@@ -0,0 +1,13 @@
+class CartMiddleware:
+    """Записать изменения корзины в ответ (для cookie-хранилища)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # Не get_cart_storage: хранилище создаётся, только если запрос трогал корзину
+        storage = getattr(request, '_cart_storage', None)
+        if storage is not None:
+            storage.update_response(response)
+        return response
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    # FTS5 есть только в SQLite, на других СУБД поиск работает через icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+            title, description, ingredients, ingredients_list,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+    schema_editor.execute('''
+        INSERT INTO product_search (rowid, title, description, ingredients, ingredients_list)
+        SELECT id, title, COALESCE(description, ''), COALESCE(ingredients, ''), COALESCE("ingredientsList", '')
+        FROM product
+    ''')
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
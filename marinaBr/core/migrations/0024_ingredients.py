@@ -0,0 +1,70 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_ingredients(apps, schema_editor):
+    """Разложить существующие ingredientsList по новым таблицам"""
+    Product = apps.get_model('core', 'Product')
+    Ingredient = apps.get_model('core', 'Ingredient')
+    ProductIngredient = apps.get_model('core', 'ProductIngredient')
+
+    links = []
+    for product_id, ingredients_list in Product.objects.exclude(ingredientsList=None).values_list('id', 'ingredientsList'):
+        seen = set()
+        for label in ingredients_list.split(';'):
+            label = label.strip()
+            name = ' '.join(label.lower().replace('ё', 'е').split())
+            if name and name not in seen:
+                seen.add(name)
+                links.append((product_id, label, name, len(seen) - 1))
+
+    names = {name for _, _, name, _ in links}
+    Ingredient.objects.bulk_create([Ingredient(name=name) for name in names], ignore_conflicts=True)
+    ingredient_ids = dict(Ingredient.objects.values_list('name', 'id'))
+    ProductIngredient.objects.bulk_create([
+        ProductIngredient(product_id=product_id, ingredient_id=ingredient_ids[name], label=label, position=position)
+        for product_id, label, name, position in links
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Название')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент',
+                'verbose_name_plural': 'Ингредиенты',
+                'db_table': 'ingredient',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=255, verbose_name='Как указано в составе')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='Порядок')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_links', to='core.ingredient', verbose_name='Ингредиент')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_links', to='core.product', verbose_name='Продукт')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент продукта',
+                'verbose_name_plural': 'Ингредиенты продуктов',
+                'db_table': 'product_ingredient',
+                'ordering': ['position'],
+                'unique_together': {('product', 'ingredient')},
+            },
+        ),
+        migrations.RunPython(populate_ingredients, migrations.RunPython.noop),
+    ]
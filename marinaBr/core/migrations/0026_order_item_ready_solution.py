@@ -0,0 +1,58 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_titles(apps, schema_editor):
+    """
+    Проставить названия существующим строкам.
+
+    Старые строки готовых решений хранились как первый продукт решения и
+    неотличимы от обычных товаров, поэтому остаются строками товаров.
+    """
+    OrderItem = apps.get_model('core', 'OrderItem')
+    Product = apps.get_model('core', 'Product')
+    OrderItem.objects.filter(title='').update(
+        title=models.Subquery(Product.objects.filter(pk=models.OuterRef('product_id')).values('title')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='components',
+            field=models.JSONField(blank=True, default=list, help_text='Состав готового решения на момент заказа: [{"product_id", "title", "quantity"}]', verbose_name='Состав'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='item_type',
+            field=models.CharField(choices=[('product', 'Товар'), ('ready_solution', 'Готовое решение')], default='product', max_length=20, verbose_name='Тип'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='ready_solution',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='core.readysolution', verbose_name='Готовое решение'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='title',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Название'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.product', verbose_name='Товар'),
+        ),
+        migrations.RunPython(fill_titles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('item_type', 'product'), _negated=True), ('product__isnull', False), _connector='OR'), name='order_item_product_line_has_product'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_order_item_ready_solution'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliverySlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('start_time', models.TimeField(verbose_name='Начало')),
+                ('end_time', models.TimeField(verbose_name='Конец')),
+                ('capacity', models.PositiveIntegerField(help_text='Сколько заказов можно принять в это окно', verbose_name='Вместимость')),
+                ('reserved', models.PositiveIntegerField(default=0, verbose_name='Занято')),
+            ],
+            options={
+                'verbose_name': 'Окно доставки',
+                'verbose_name_plural': 'Окна доставки',
+                'db_table': 'delivery_slot',
+                'ordering': ['date', 'start_time'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryslot',
+            constraint=models.CheckConstraint(check=models.Q(('reserved__lte', models.F('capacity'))), name='delivery_slot_not_overbooked'),
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryslot',
+            constraint=models.CheckConstraint(check=models.Q(('start_time__lt', models.F('end_time'))), name='delivery_slot_start_before_end'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='deliveryslot',
+            unique_together={('date', 'start_time')},
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='core.deliveryslot', verbose_name='Окно доставки'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_delivery_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Номер заказа')),
+                ('customer_name', models.CharField(max_length=255, verbose_name='Имя клиента')),
+                ('customer_phone', models.CharField(max_length=20, verbose_name='Телефон')),
+                ('order_date', models.DateField(verbose_name='Дата заказа')),
+                ('order_time', models.TimeField(verbose_name='Время заказа')),
+                ('delivery_address', models.TextField(verbose_name='Адрес доставки')),
+                ('total_price', models.DecimalField(decimal_places=0, max_digits=10, verbose_name='Общая сумма')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('processing', 'В обработке'), ('completed', 'Завершен'), ('cancelled', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(verbose_name='Создан')),
+                ('updated_at', models.DateTimeField(verbose_name='Обновлен')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')),
+            ],
+            options={
+                'verbose_name': 'Заказ в архиве',
+                'verbose_name_plural': 'Архив заказов',
+                'db_table': 'archived_order',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('product', 'Товар'), ('ready_solution', 'Готовое решение')], max_length=20, verbose_name='Тип')),
+                ('product_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID товара')),
+                ('ready_solution_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID готового решения')),
+                ('title', models.CharField(max_length=255, verbose_name='Название')),
+                ('components', models.JSONField(blank=True, default=list, verbose_name='Состав')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=0, max_digits=10, verbose_name='Цена')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='core.archivedorder', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Товар в архивном заказе',
+                'verbose_name_plural': 'Товары в архивных заказах',
+                'db_table': 'archived_order_item',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:37
+
+from itertools import groupby
+
+from django.db import migrations, models
+
+
+SUMMARY_ITEMS = 3
+
+
+def fill_summaries(apps, schema_editor):
+    """Сводка строк для уже оформленных заказов (как services.summarize_items)"""
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    lines = OrderItem.objects.order_by('order_id', 'id').values_list('order_id', 'title', 'quantity').iterator()
+    orders = []
+    for order_id, items in groupby(lines, key=lambda line: line[0]):
+        items = list(items)
+        summary = ', '.join(f'{title} × {quantity}' for _, title, quantity in items[:SUMMARY_ITEMS])
+        orders.append(Order(id=order_id, items_count=len(items), items_summary=summary[:255]))
+        if len(orders) == 500:
+            Order.objects.bulk_update(orders, ['items_count', 'items_summary'])
+            orders = []
+    Order.objects.bulk_update(orders, ['items_count', 'items_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_summary',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Товары'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
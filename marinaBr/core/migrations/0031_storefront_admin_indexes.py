@@ -0,0 +1,41 @@
+# Generated by Django 4.2.20 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_order_status_change'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date', 'status'], name='order_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_bundle', False), ('is_published', True)), fields=['title', 'id'], name='product_storefront_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_bundle', False), ('is_published', True)), fields=['category', 'title', 'id'], name='product_storefront_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='readysolution',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['persons_count', 'title', 'id'], name='ready_solution_published_idx'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
 # from django.urls import reverse
 
@@ -38,16 +40,34 @@ class Product(models.Model):
     
     # Для готовых решений - количество персон (10, 15 и т.д.)
     persons_count = models.PositiveIntegerField(blank=True, null=True, verbose_name='Количество персон', help_text='Только для готовых решений')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлен')
 
     class Meta:
         db_table = 'product'
         verbose_name = 'Продукт'
         verbose_name_plural = 'Продукты'
+        indexes = [
+            # Витрина и API каталога: опубликованные товары без наборов
+            # в порядке keyset-пагинации (title, id), в том числе по категории
+            models.Index(
+                fields=['title', 'id'],
+                condition=models.Q(is_published=True, is_bundle=False),
+                name='product_storefront_idx',
+            ),
+            models.Index(
+                fields=['category', 'title', 'id'],
+                condition=models.Q(is_published=True, is_bundle=False),
+                name='product_storefront_cat_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
     
     def get_ingredients_list(self):
+        # Если состав подгружен prefetch_related('ingredient_links'), строку не разбираем
+        if 'ingredient_links' in getattr(self, '_prefetched_objects_cache', {}):
+            return [link.label for link in self.ingredient_links.all()]
         if self.ingredientsList:
             return [ingredient.strip() for ingredient in self.ingredientsList.split(';')]
         return []
@@ -59,6 +79,38 @@ class Product(models.Model):
         return []
 
 
+class Ingredient(models.Model):
+    """Ингредиент с нормализованным названием (нижний регистр, без лишних пробелов)"""
+    name = models.CharField(max_length=255, unique=True, verbose_name='Название')
+
+    class Meta:
+        db_table = 'ingredient'
+        verbose_name = 'Ингредиент'
+        verbose_name_plural = 'Ингредиенты'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class ProductIngredient(models.Model):
+    """Ингредиент в составе продукта, собирается из Product.ingredientsList"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='ingredient_links', verbose_name='Продукт')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='product_links', verbose_name='Ингредиент')
+    label = models.CharField(max_length=255, verbose_name='Как указано в составе')
+    position = models.PositiveIntegerField(default=0, verbose_name='Порядок')
+
+    class Meta:
+        db_table = 'product_ingredient'
+        verbose_name = 'Ингредиент продукта'
+        verbose_name_plural = 'Ингредиенты продуктов'
+        ordering = ['position']
+        unique_together = ['product', 'ingredient']
+
+    def __str__(self):
+        return f'{self.product.title} → {self.label}'
+
+
 class ProductBundleItem(models.Model):
     """Компоненты готового решения"""
     bundle = models.ForeignKey(
@@ -123,6 +175,14 @@ class ReadySolution(models.Model):
         verbose_name_plural = 'Готовые решения'
         ordering = ['persons_count', 'title']
         unique_together = [('title', 'persons_count'), ('slug', 'persons_count')]
+        indexes = [
+            # Меню на главной (persons_count, title) и API с фильтром по персонам
+            models.Index(
+                fields=['persons_count', 'title', 'id'],
+                condition=models.Q(is_published=True),
+                name='ready_solution_published_idx',
+            ),
+        ]
     
     def __str__(self):
         return f'{self.title} ({self.persons_count} чел.)'
@@ -161,6 +221,46 @@ class ReadySolutionItem(models.Model):
         return f'{self.ready_solution.title} → {self.product.title} x{self.quantity}'
 
 
+class DeliverySlot(models.Model):
+    """Окно доставки на дату с ограничением по числу заказов"""
+    date = models.DateField(verbose_name='Дата')
+    start_time = models.TimeField(verbose_name='Начало')
+    end_time = models.TimeField(verbose_name='Конец')
+    capacity = models.PositiveIntegerField(verbose_name='Вместимость', help_text='Сколько заказов можно принять в это окно')
+    reserved = models.PositiveIntegerField(default=0, verbose_name='Занято')
+
+    class Meta:
+        db_table = 'delivery_slot'
+        verbose_name = 'Окно доставки'
+        verbose_name_plural = 'Окна доставки'
+        ordering = ['date', 'start_time']
+        # Уникальный индекс (date, start_time) заодно обслуживает выборку по диапазону дат
+        unique_together = [('date', 'start_time')]
+        constraints = [
+            models.CheckConstraint(check=models.Q(reserved__lte=models.F('capacity')), name='delivery_slot_not_overbooked'),
+            models.CheckConstraint(check=models.Q(start_time__lt=models.F('end_time')), name='delivery_slot_start_before_end'),
+        ]
+
+    def __str__(self):
+        return f'{self.date:%d.%m.%Y} {self.start_time:%H:%M}-{self.end_time:%H:%M}'
+
+    def clean(self):
+        if self.capacity < self.reserved:
+            raise ValidationError({'capacity': f'Уже занято {self.reserved} мест'})
+        if self.start_time and self.end_time and self.start_time >= self.end_time:
+            raise ValidationError({'end_time': 'Окно должно заканчиваться позже, чем начинается'})
+        if self.date and self.start_time and self.end_time:
+            overlapping = DeliverySlot.objects.filter(
+                date=self.date, start_time__lt=self.end_time, end_time__gt=self.start_time,
+            ).exclude(pk=self.pk).first()
+            if overlapping:
+                raise ValidationError(f'Окно пересекается с окном {overlapping}')
+
+    @property
+    def remaining(self):
+        return max(self.capacity - self.reserved, 0)
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('new', 'Новый'),
@@ -176,6 +276,17 @@ class Order(models.Model):
     delivery_address = models.TextField(verbose_name='Адрес доставки')
     total_price = models.DecimalField(max_digits=10, decimal_places=0, verbose_name='Общая сумма')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new', verbose_name='Статус')
+    delivery_slot = models.ForeignKey(
+        DeliverySlot,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='orders',
+        verbose_name='Окно доставки'
+    )
+    # Сводка строк для списка заказов в админке, заполняется при оформлении
+    items_count = models.PositiveIntegerField(default=0, verbose_name='Позиций')
+    items_summary = models.CharField(max_length=255, blank=True, default='', verbose_name='Товары')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлен')
     
@@ -184,14 +295,81 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            # Список заказов в админке: весь, по статусу и по дате доставки
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # План производства и фильтр по дате: диапазон дат и статусы
+            models.Index(fields=['order_date', 'status'], name='order_date_status_idx'),
+            # Перенос в архив: выполненные и отменённые старше даты
+            models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+        ]
     
     def __str__(self):
         return f'Заказ #{self.id} от {self.customer_name}'
 
 
+class OrderStatusChange(models.Model):
+    """
+    Запись журнала смены статуса заказа.
+
+    order_id - номер заказа без внешнего ключа: журнал остаётся, когда заказ
+    переносится в архив (ArchivedOrder.id совпадает с номером заказа).
+    """
+    order_id = models.BigIntegerField(db_index=True, verbose_name='Номер заказа')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Был статус')
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Стал статус')
+    changed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Кто изменил'
+    )
+    changed_at = models.DateTimeField(auto_now_add=True, verbose_name='Когда')
+
+    class Meta:
+        db_table = 'order_status_change'
+        verbose_name = 'Смена статуса заказа'
+        verbose_name_plural = 'Журнал статусов заказов'
+        ordering = ['-changed_at', '-id']
+
+    def __str__(self):
+        return f'Заказ #{self.order_id}: {self.get_from_status_display()} → {self.get_to_status_display()}'
+
+
 class OrderItem(models.Model):
+    """
+    Строка заказа: продукт или готовое решение.
+
+    Название и состав готового решения сохраняются в строке на момент заказа,
+    поэтому содержимое заказа читается без обращения к каталогу, даже если
+    решение потом изменили или удалили.
+    """
+    ITEM_TYPE_CHOICES = [
+        ('product', 'Товар'),
+        ('ready_solution', 'Готовое решение'),
+    ]
+
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', verbose_name='Заказ')
-    product = models.ForeignKey(Product, on_delete=models.PROTECT, verbose_name='Товар')
+    item_type = models.CharField(max_length=20, choices=ITEM_TYPE_CHOICES, default='product', verbose_name='Тип')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, null=True, blank=True, verbose_name='Товар')
+    ready_solution = models.ForeignKey(
+        ReadySolution,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='order_items',
+        verbose_name='Готовое решение'
+    )
+    title = models.CharField(max_length=255, blank=True, default='', verbose_name='Название')
+    components = models.JSONField(
+        default=list,
+        blank=True,
+        verbose_name='Состав',
+        help_text='Состав готового решения на момент заказа: [{"product_id", "title", "quantity"}]'
+    )
     quantity = models.PositiveIntegerField(verbose_name='Количество')
     price = models.DecimalField(max_digits=10, decimal_places=0, verbose_name='Цена')
     
@@ -199,6 +377,93 @@ class OrderItem(models.Model):
         db_table = 'order_item'
         verbose_name = 'Товар в заказе'
         verbose_name_plural = 'Товары в заказе'
+        constraints = [
+            models.CheckConstraint(
+                check=~models.Q(item_type='product') | models.Q(product__isnull=False),
+                name='order_item_product_line_has_product',
+            ),
+        ]
     
     def __str__(self):
-        return f'{self.product.title} x{self.quantity}'
\ No newline at end of file
+        return f'{self.title} x{self.quantity}'
+
+
+class OutboxEmail(models.Model):
+    """Письмо в очереди на отправку: пишется в транзакции запроса, отправляется командой send_outbox"""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('sent', 'Отправлено'),
+        ('dead', 'Не доставлено'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    from_email = models.CharField(max_length=255, blank=True, verbose_name='Отправитель')
+    to = models.JSONField(verbose_name='Получатели')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        db_table = 'email_outbox'
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} ({self.get_status_display()})'
+
+
+class ArchivedOrder(models.Model):
+    """
+    Заказ, перенесённый из order командой archive_orders.
+
+    id совпадает с id исходного заказа. Ссылок на каталог и окна доставки
+    нет: архив не мешает удалять товары и окна.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='Номер заказа')
+    customer_name = models.CharField(max_length=255, verbose_name='Имя клиента')
+    customer_phone = models.CharField(max_length=20, verbose_name='Телефон')
+    order_date = models.DateField(verbose_name='Дата заказа')
+    order_time = models.TimeField(verbose_name='Время заказа')
+    delivery_address = models.TextField(verbose_name='Адрес доставки')
+    total_price = models.DecimalField(max_digits=10, decimal_places=0, verbose_name='Общая сумма')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='Статус')
+    created_at = models.DateTimeField(verbose_name='Создан')
+    updated_at = models.DateTimeField(verbose_name='Обновлен')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Перенесён в архив')
+
+    class Meta:
+        db_table = 'archived_order'
+        verbose_name = 'Заказ в архиве'
+        verbose_name_plural = 'Архив заказов'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Заказ #{self.id} от {self.customer_name} (архив)'
+
+
+class ArchivedOrderItem(models.Model):
+    """Строка архивного заказа, копия OrderItem со снимком названия и состава"""
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items', verbose_name='Заказ')
+    item_type = models.CharField(max_length=20, choices=OrderItem.ITEM_TYPE_CHOICES, verbose_name='Тип')
+    product_id = models.BigIntegerField(null=True, blank=True, verbose_name='ID товара')
+    ready_solution_id = models.BigIntegerField(null=True, blank=True, verbose_name='ID готового решения')
+    title = models.CharField(max_length=255, verbose_name='Название')
+    components = models.JSONField(default=list, blank=True, verbose_name='Состав')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.DecimalField(max_digits=10, decimal_places=0, verbose_name='Цена')
+
+    class Meta:
+        db_table = 'archived_order_item'
+        verbose_name = 'Товар в архивном заказе'
+        verbose_name_plural = 'Товары в архивных заказах'
+
+    def __str__(self):
+        return f'{self.title} x{self.quantity}'
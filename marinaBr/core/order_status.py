@@ -0,0 +1,81 @@
+"""
+Смена статуса заказов.
+
+Разрешённые переходы задаёт ALLOWED_TRANSITIONS. Заказы переводятся пачкой:
+одно UPDATE на каждый целевой статус и одна вставка в журнал
+OrderStatusChange на всю пачку, так что число запросов не зависит от числа
+заказов. При отмене заказа освобождается его место в окне доставки.
+"""
+from collections import defaultdict, namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .delivery import release_slots
+from .models import Order, OrderStatusChange
+
+
+ALLOWED_TRANSITIONS = {
+    'new': ('processing', 'completed', 'cancelled'),
+    'processing': ('new', 'completed', 'cancelled'),
+    # Выполненный по ошибке заказ можно вернуть в работу; отменённый - нет:
+    # его место в окне доставки уже освобождено
+    'completed': ('processing',),
+    'cancelled': (),
+}
+
+TransitionResult = namedtuple('TransitionResult', 'changed rejected')
+
+
+def is_allowed(from_status, to_status):
+    return to_status in ALLOWED_TRANSITIONS.get(from_status, ())
+
+
+@retry_on_locked
+def _apply(orders, target_for, user):
+    changed_by = user if getattr(user, 'is_authenticated', False) else None
+    targets = defaultdict(list)
+    audit = []
+    rejected = []
+
+    with transaction.atomic():
+        for order_id, status in orders.select_for_update().values_list('id', 'status').order_by('id'):
+            to_status = target_for(order_id)
+            if status == to_status:
+                continue
+            if not is_allowed(status, to_status):
+                rejected.append((order_id, status, to_status))
+                continue
+            targets[to_status].append(order_id)
+            audit.append(OrderStatusChange(order_id=order_id, from_status=status, to_status=to_status, changed_by=changed_by))
+
+        now = timezone.now()
+        for to_status, ids in targets.items():
+            if to_status == 'cancelled':
+                release_slots(Order.objects.filter(id__in=ids))
+            Order.objects.filter(id__in=ids).update(status=to_status, updated_at=now)
+        OrderStatusChange.objects.bulk_create(audit)
+
+    return TransitionResult([change.order_id for change in audit], rejected)
+
+
+def change_status(orders, to_status, user=None):
+    """
+    Перевести заказы из queryset orders в статус to_status.
+
+    Возвращает TransitionResult: changed - номера изменённых заказов, rejected -
+    (номер, статус, to_status) для запрещённых переходов. Заказы, уже
+    стоящие в to_status, не попадают ни туда, ни туда.
+    """
+    if to_status not in ALLOWED_TRANSITIONS:
+        raise ValueError(f'Неизвестный статус: {to_status}')
+    return _apply(orders, lambda order_id: to_status, user)
+
+
+def apply_transitions(changes, user=None):
+    """То же для разных статусов: changes - {номер заказа: новый статус}"""
+    unknown = set(changes.values()) - set(ALLOWED_TRANSITIONS)
+    if unknown:
+        raise ValueError(f'Неизвестный статус: {", ".join(sorted(unknown))}')
+    return _apply(Order.objects.filter(id__in=changes), changes.get, user)
@@ -0,0 +1,120 @@
+"""
+Очередь исходящих писем.
+
+Представления не ходят в SMTP: они записывают письмо в таблицу email_outbox
+в той же транзакции, что и заказ или заявку. Команда send_outbox забирает
+письма пачками и отправляет их через одно SMTP-соединение на пачку.
+
+Письмо, которое не удалось отправить, откладывается с экспоненциально
+растущей паузой. После OUTBOX_MAX_ATTEMPTS неудачных попыток оно получает
+статус dead и больше не отправляется, пока его не вернут в очередь из админки.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import OutboxEmail
+
+
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_BACKOFF_BASE = 30
+OUTBOX_BACKOFF_MAX = 60 * 60 * 6
+# На время отправки письма пачки откладываются: если отправитель упадёт,
+# они вернутся в очередь, а не потеряются
+OUTBOX_LEASE = 60 * 5
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    """Поставить письмо в очередь. Вызывается внутри транзакции запроса"""
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
+        to=list(to),
+        next_attempt_at=timezone.now(),
+    )
+
+
+def notify_admin(subject, body):
+    """Поставить в очередь письмо администратору. Без ADMIN_EMAIL - None"""
+    admin_email = getattr(settings, 'ADMIN_EMAIL', settings.DEFAULT_FROM_EMAIL)
+    if not admin_email:
+        return None
+    return enqueue_email(subject, body, [admin_email])
+
+
+def retry_delay(attempts):
+    """Пауза перед следующей попыткой после attempts неудачных"""
+    return timedelta(seconds=min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX))
+
+
+@retry_on_locked
+def claim_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """Забрать письма, которым пора уходить, и отложить их на время отправки"""
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if emails:
+            OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(
+                next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE),
+            )
+    return emails
+
+
+def _mark_failed(email, error, now):
+    email.attempts += 1
+    email.last_error = error
+    if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        email.status = 'dead'
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def send_outbox_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Отправить одну пачку писем через одно соединение.
+
+    Возвращает (отправлено, не отправлено). Ошибка одного письма не мешает
+    остальным; если не удалось открыть соединение, откладывается вся пачка.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent_ids = []
+    failed = []
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        failed = [(email, f'Не удалось подключиться: {e}') for email in emails]
+    else:
+        try:
+            for email in emails:
+                message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    failed.append((email, str(e) or e.__class__.__name__))
+                else:
+                    sent_ids.append(email.id)
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    if sent_ids:
+        OutboxEmail.objects.filter(id__in=sent_ids).update(status='sent', sent_at=now, last_error='')
+    for email, error in failed:
+        _mark_failed(email, error, now)
+
+    return len(sent_ids), len(failed)
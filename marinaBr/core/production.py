@@ -0,0 +1,106 @@
+"""
+План производства для кухни.
+
+Для каждой даты доставки (Order.order_date) считается, сколько каждого
+продукта нужно приготовить по всем заказам, кроме отменённых. Наборы
+(Product.is_bundle) раскладываются через ProductBundleItem.quantity, готовые
+решения - через их состав на момент заказа (OrderItem.components, снимок
+ReadySolutionItem.quantity).
+
+Весь план - три агрегирующих запроса и запрос названий. Строки заказов не
+перебираются в Python: раскладываются только уже сгруппированные по дате
+варианты состава готовых решений.
+"""
+import csv
+from collections import defaultdict
+
+from django.db.models import F, Sum
+
+from .models import Order, OrderItem, Product, ProductBundleItem
+
+
+PLAN_STATUSES = tuple(status for status, _ in Order.STATUS_CHOICES if status != 'cancelled')
+PLAN_CSV_HEADER = ('Дата', 'ID товара', 'Товар', 'Отдельно', 'В наборах', 'В готовых решениях', 'Всего')
+
+
+def _plan_lines(date_from, date_to):
+    return OrderItem.objects.filter(order__order_date__range=(date_from, date_to), order__status__in=PLAN_STATUSES)
+
+
+def build_production_plan(date_from, date_to=None):
+    """
+    План на даты с date_from по date_to включительно.
+
+    Возвращает список словарей date, product_id, title, direct, in_bundles,
+    in_ready_solutions, quantity, упорядоченный по дате и названию продукта.
+    """
+    date_to = date_to or date_from
+    totals = defaultdict(lambda: [0, 0, 0])
+
+    # Отдельные продукты, наборы пока не раскладываются
+    direct = (
+        _plan_lines(date_from, date_to)
+        .filter(item_type='product', product__is_bundle=False)
+        .values_list('order__order_date', 'product_id')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+    )
+    for order_date, product_id, quantity in direct:
+        totals[order_date, product_id][0] += quantity
+
+    # Наборы: количество набора в заказе умножается на количество компонента в одном JOIN
+    bundled = (
+        ProductBundleItem.objects
+        .filter(
+            bundle__is_bundle=True,
+            bundle__orderitem__item_type='product',
+            bundle__orderitem__order__order_date__range=(date_from, date_to),
+            bundle__orderitem__order__status__in=PLAN_STATUSES,
+        )
+        .values_list('bundle__orderitem__order__order_date', 'product_id')
+        .annotate(quantity=Sum(F('quantity') * F('bundle__orderitem__quantity')))
+        .order_by()
+    )
+    for order_date, product_id, quantity in bundled:
+        totals[order_date, product_id][1] += quantity
+
+    # Готовые решения: строки с одинаковым составом схлопываются в базе,
+    # в Python раскладываются только варианты состава на каждую дату
+    solutions = (
+        _plan_lines(date_from, date_to)
+        .filter(item_type='ready_solution')
+        .values_list('order__order_date', 'components')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+    )
+    for order_date, components, quantity in solutions:
+        for component in components:
+            totals[order_date, component['product_id']][2] += component['quantity'] * quantity
+
+    titles = dict(Product.objects.filter(id__in={product_id for _, product_id in totals}).values_list('id', 'title'))
+
+    plan = [
+        {
+            'date': order_date,
+            'product_id': product_id,
+            'title': titles.get(product_id, f'Товар #{product_id}'),
+            'direct': counts[0],
+            'in_bundles': counts[1],
+            'in_ready_solutions': counts[2],
+            'quantity': sum(counts),
+        }
+        for (order_date, product_id), counts in totals.items()
+    ]
+    plan.sort(key=lambda row: (row['date'], row['title']))
+    return plan
+
+
+def write_production_plan_csv(plan, file):
+    """Записать план в CSV (разделитель ;, чтобы Excel открыл без импорта)"""
+    writer = csv.writer(file, delimiter=';')
+    writer.writerow(PLAN_CSV_HEADER)
+    for row in plan:
+        writer.writerow((
+            row['date'].isoformat(), row['product_id'], row['title'],
+            row['direct'], row['in_bundles'], row['in_ready_solutions'], row['quantity'],
+        ))
@@ -0,0 +1,122 @@
+"""
+Полнотекстовый поиск по продуктам на SQLite FTS5.
+
+Виртуальная таблица product_search хранит копию текстовых полей продукта,
+rowid совпадает с id продукта. Таблица обновляется сигналами при сохранении
+и удалении продукта и пересобирается командой rebuild_search_index.
+На других СУБД поиск откатывается к обычному icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+SEARCH_TABLE = 'product_search'
+
+# Веса колонок для bm25: title, description, ingredients, ingredients_list
+SEARCH_WEIGHTS = (10.0, 1.0, 2.0, 2.0)
+
+POPULATE_SEARCH_TABLE_SQL = f'''
+    INSERT INTO {SEARCH_TABLE} (rowid, title, description, ingredients, ingredients_list)
+    SELECT id, title, COALESCE(description, ''), COALESCE(ingredients, ''), COALESCE("ingredientsList", '')
+    FROM product
+'''
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(text):
+    """
+    Превратить пользовательский ввод в запрос FTS5.
+
+    Каждое слово ищется по префиксу, все слова должны встретиться.
+    Спецсимволы FTS5 отбрасываются, поэтому ввод не ломает запрос.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def index_product(product):
+    """Обновить запись продукта в поисковом индексе"""
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, ingredients, ingredients_list) '
+            'VALUES (%s, %s, %s, %s, %s)',
+            [product.pk, product.title, product.description or '', product.ingredients or '', product.ingredientsList or ''],
+        )
+
+
+def remove_product(product_id):
+    """Удалить продукт из поискового индекса"""
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_search_index():
+    """Пересобрать индекс целиком по таблице product. Возвращает число записей"""
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(POPULATE_SEARCH_TABLE_SQL)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_product_ids(text, limit=None, storefront=False):
+    """
+    id продуктов, подходящих под запрос, от самых релевантных.
+
+    storefront=True оставляет только опубликованные продукты витрины (не наборы).
+    """
+    match = build_match_query(text)
+    if match is None:
+        return []
+
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    sql = f'SELECT {SEARCH_TABLE}.rowid FROM {SEARCH_TABLE}'
+    if storefront:
+        sql += f' JOIN product ON product.id = {SEARCH_TABLE}.rowid'
+    sql += f' WHERE {SEARCH_TABLE} MATCH %s'
+    if storefront:
+        sql += ' AND product.is_published AND NOT product.is_bundle'
+    sql += f' ORDER BY bm25({SEARCH_TABLE}, {weights})'
+    params = [match]
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def filter_by_search(queryset, text):
+    """Отфильтровать выборку продуктов подзапросом к индексу, без выгрузки id в Python"""
+    match = build_match_query(text)
+    if match is None:
+        return queryset.none()
+    return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match]))
+
+
+def search_products(text, limit=20):
+    """Опубликованные продукты витрины по запросу, упорядоченные по релевантности"""
+    if not search_available():
+        return list(Product.objects.filter(is_published=True, is_bundle=False, title__icontains=text)[:limit])
+
+    ids = search_product_ids(text, limit=limit, storefront=True)
+    products = Product.objects.select_related('category').in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
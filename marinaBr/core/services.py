@@ -0,0 +1,139 @@
+"""
+Оформление заказа.
+
+Заказ, все его строки, место в окне доставки и письмо администратору
+в очереди email_outbox записываются в одной транзакции: при ошибке в базе
+не остаётся заказа без товаров, без уведомления или занятого зря места.
+Цены фиксируются по одной пачке запросов к витрине, строки заказа
+вставляются одним bulk_create, а их сводка для списка заказов в админке
+сохраняется в самом заказе.
+"""
+from django.db import transaction
+
+from .cart_utils import resolve_cart_items
+from .db import retry_on_locked
+from .delivery import reserve_slot
+from .models import Order, OrderItem, ReadySolutionItem
+from .outbox import notify_admin
+
+
+ORDER_FIELDS = ('customer_name', 'customer_phone', 'order_date', 'order_time', 'delivery_address')
+ORDER_SUMMARY_ITEMS = 3
+
+
+class EmptyCartError(ValueError):
+    pass
+
+
+def _solution_components(solution_ids):
+    """Состав каждого готового решения одним запросом, в порядке отображения"""
+    components = {}
+    items = (
+        ReadySolutionItem.objects
+        .filter(ready_solution_id__in=solution_ids)
+        .order_by('ready_solution_id', 'order', 'product__title')
+        .values_list('ready_solution_id', 'product_id', 'product__title', 'quantity')
+    )
+    for solution_id, product_id, title, quantity in items:
+        components.setdefault(solution_id, []).append({'product_id': product_id, 'title': title, 'quantity': quantity})
+    return components
+
+
+def summarize_items(order_items):
+    """Order.items_count и Order.items_summary: число строк и первые ORDER_SUMMARY_ITEMS из них"""
+    summary = ', '.join(f'{item.title} × {item.quantity}' for item in order_items[:ORDER_SUMMARY_ITEMS])
+    return len(order_items), summary[:Order._meta.get_field('items_summary').max_length]
+
+
+def _order_line_text(item):
+    if item['type'] == 'ready_solution':
+        return f"- {item['ready_solution'].title} (готовое решение) x{item['quantity']} = {item['total']} ₽"
+    return f"- {item['product'].title} x{item['quantity']} = {item['total']} ₽"
+
+
+def order_notification(order, lines):
+    """Тема и текст письма администратору о новом заказе"""
+    subject = f'Новый заказ #{order.id} с сайта Maria Br'
+    message = f"""
+Новый заказ с сайта:
+
+Номер заказа: #{order.id}
+Имя клиента: {order.customer_name}
+Телефон: {order.customer_phone}
+Дата заказа: {order.order_date}
+Время заказа: {order.order_time}
+Адрес доставки: {order.delivery_address}
+
+Товары:
+{chr(10).join(_order_line_text(item) for item in lines)}
+
+Общая сумма: {order.total_price} ₽
+
+Статус: {order.get_status_display()}
+"""
+    return subject, message
+
+
+@retry_on_locked
+def place_order(cart, customer_data):
+    """
+    Оформить заказ по корзине.
+
+    customer_data - очищенные данные OrderForm. Строки, которых уже нет на
+    витрине, пропускаются; если не осталось ни одной, поднимается
+    EmptyCartError. Место в окне доставки занимается в той же транзакции,
+    занятое окно - DeliverySlotError. Готовое решение записывается одной
+    строкой с его названием и составом на момент заказа.
+
+    Возвращает заказ с атрибутом lines - строками корзины по зафиксированным
+    ценам, для письма и страницы подтверждения.
+    """
+    with transaction.atomic():
+        # Окно занимается первым запросом транзакции, до чтения каталога (см. reserve_slot)
+        delivery_slot_id = reserve_slot(customer_data['order_date'], customer_data['order_time'])
+        cart_items = resolve_cart_items(cart)[0]
+
+        if not cart_items:
+            raise EmptyCartError('Корзина пуста')
+
+        solution_ids = [item['ready_solution'].id for item in cart_items if item['type'] == 'ready_solution']
+        components = _solution_components(solution_ids) if solution_ids else {}
+
+        order_items = []
+        for item in cart_items:
+            if item['type'] == 'ready_solution':
+                solution = item['ready_solution']
+                order_items.append(OrderItem(
+                    item_type='ready_solution',
+                    ready_solution=solution,
+                    title=solution.title,
+                    components=components.get(solution.id, []),
+                    quantity=item['quantity'],
+                    price=solution.price,
+                ))
+            else:
+                product = item['product']
+                order_items.append(OrderItem(
+                    product=product,
+                    title=product.title,
+                    quantity=item['quantity'],
+                    price=product.price,
+                ))
+
+        items_count, items_summary = summarize_items(order_items)
+        order = Order.objects.create(
+            total_price=sum(item['total'] for item in cart_items),
+            status='new',
+            delivery_slot_id=delivery_slot_id,
+            items_count=items_count,
+            items_summary=items_summary,
+            **{field: customer_data[field] for field in ORDER_FIELDS},
+        )
+        for order_item in order_items:
+            order_item.order = order
+        OrderItem.objects.bulk_create(order_items)
+
+        order.lines = cart_items
+        notify_admin(*order_notification(order, order.lines))
+
+    return order
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+from .catalog import bump_catalog_version
+from .db import configure_sqlite
+from .images import IMAGE_FIELDS, build_instance_variants
+from .delivery import invalidate_availability
+from .ingredients import sync_product_ingredients
+from .models import Category, DeliverySlot, Product, ProductBundleItem, ReadySolution, ReadySolutionItem
+from .search import index_product, remove_product
+
+
+CATALOG_MODELS = (Product, Category, ReadySolution, ReadySolutionItem, ProductBundleItem)
+
+
+def invalidate_catalog(sender, **kwargs):
+    """
+    Сбросить снимок каталога после изменения.
+
+    Версия сдвигается сразу и ещё раз после коммита: снимок, собранный
+    другим запросом до коммита, не переживёт транзакцию.
+    """
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog, sender=model, dispatch_uid=f'invalidate_catalog_delete_{model.__name__}')
+
+
+def update_search_index(sender, instance, **kwargs):
+    """Обновить продукт в полнотекстовом индексе в той же транзакции"""
+    index_product(instance)
+
+
+def delete_from_search_index(sender, instance, **kwargs):
+    remove_product(instance.pk)
+
+
+post_save.connect(update_search_index, sender=Product, dispatch_uid='update_search_index')
+post_delete.connect(delete_from_search_index, sender=Product, dispatch_uid='delete_from_search_index')
+
+
+def update_product_ingredients(sender, instance, raw=False, **kwargs):
+    """Разложить ingredientsList по таблицам ингредиентов"""
+    if not raw:
+        sync_product_ingredients(instance)
+
+
+post_save.connect(update_product_ingredients, sender=Product, dispatch_uid='update_product_ingredients')
+
+
+def invalidate_slot_availability(sender, instance, **kwargs):
+    """Сбросить кэш доступности на дату изменённого окна доставки"""
+    invalidate_availability([instance.date])
+
+
+post_save.connect(invalidate_slot_availability, sender=DeliverySlot, dispatch_uid='invalidate_slot_availability_save')
+post_delete.connect(invalidate_slot_availability, sender=DeliverySlot, dispatch_uid='invalidate_slot_availability_delete')
+
+
+def build_image_variants(sender, instance, raw=False, **kwargs):
+    """Сделать уменьшенные копии новых фото сразу при загрузке"""
+    if not raw:
+        build_instance_variants(instance)
+
+
+for model in IMAGE_FIELDS:
+    post_save.connect(build_image_variants, sender=model, dispatch_uid=f'build_image_variants_{model.__name__}')
+
+
+connection_created.connect(configure_sqlite, dispatch_uid='configure_sqlite')
@@ -0,0 +1,36 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from core.images import image_variants
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', **attrs):
+    """
+    <picture> с копиями фото: WebP и JPEG на выбор браузеру, ленивая загрузка.
+
+    {% responsive_image product.imageMain alt=product.title sizes="(min-width: 890px) 25vw, 50vw" %}
+    Пока копий нет (фото загружено до их появления или уже самой узкой копии),
+    выводится оригинал. Оригинал шире копий - последний вариант srcset.
+    """
+    variants, original_width = image_variants(image)
+    if not variants:
+        return format_html(
+            '<img src="{}" alt="{}" loading="lazy" decoding="async"{}>', image.url, alt, flatatt(attrs),
+        )
+    webp_candidates = [f'{webp} {width}w' for width, webp, _ in variants]
+    jpeg_candidates = [f'{jpeg} {width}w' for width, _, jpeg in variants]
+    if original_width > variants[-1][0]:
+        webp_candidates.append(f'{image.url} {original_width}w')
+        jpeg_candidates.append(f'{image.url} {original_width}w')
+    webp_srcset = ', '.join(webp_candidates)
+    jpeg_srcset = ', '.join(jpeg_candidates)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async"{}></picture>',
+        webp_srcset, sizes, variants[-1][2], jpeg_srcset, sizes, alt, flatatt(attrs),
+    )
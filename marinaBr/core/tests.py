@@ -1,3 +1,2177 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import statistics
+import threading
+import time
+from collections import Counter
+from datetime import date, time as dt_time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core import mail
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.db.models import Q, Sum
+from django.http import HttpResponse
+from django.template import Context, RequestContext, Template
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from marinaBr.routers import STICKY_COOKIE_NAME
+
+from .archive import archivable_orders, archive_batch, archive_orders
+from .cart_storage import CART_COOKIE_MAX_SIZE, CART_COOKIE_NAME, CookieCartStorage, decode_cart_cookie, encode_cart_cookie
+from .cart_utils import get_cart_items
+from .catalog import get_catalog_version, mark_replica_synced
+from .db import copy_database, retry_on_locked
+from .conditional import index_etag, index_last_modified
+from .context_processors import cart as cart_context_processor
+from .delivery import DeliverySlotError, get_availability, reserve_slot
+from .exports import iter_order_rows
+from .images import build_variants, variant_name
+from .order_status import apply_transitions, change_status
+from .ingredients import filter_by_ingredients, parse_ingredients
+from .outbox import OUTBOX_MAX_ATTEMPTS, enqueue_email, retry_delay, send_outbox_batch
+from .production import PLAN_STATUSES, build_production_plan
+from .search import build_match_query, rebuild_search_index, search_product_ids, search_products
+from .services import EmptyCartError, place_order
+from .models import ArchivedOrder, ArchivedOrderItem, Category, DeliverySlot, Ingredient, Order, OrderItem, OrderStatusChange, OutboxEmail, Product, ProductBundleItem, ReadySolution, ReadySolutionItem
+
+
+# Бенчмарки долгие и по умолчанию пропускаются:
+# BENCHMARKS=1 python manage.py test --tag=benchmark
+BENCHMARKS = os.environ.get('BENCHMARKS') == '1'
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CacheIsolatedTestCase(TestCase):
+    """Тесты со своим кэшем в памяти, очищаемым перед каждым тестом"""
+
+    def setUp(self):
+        cache.clear()
+
+
+def make_catalog(products_count=1, solutions_count=0):
+    """Создать тестовый каталог: категорию, продукты и готовые решения"""
+    category = Category.objects.create(title='Закуски', slug='zakuski')
+    products = Product.objects.bulk_create([
+        Product(title=f'Продукт {i}', slug=f'product-{i}', price=Decimal(100 + i), category=category)
+        for i in range(products_count)
+    ])
+    solutions = []
+    for i in range(solutions_count):
+        solution = ReadySolution.objects.create(
+            title=f'Меню {i}',
+            slug=f'menu-{i}',
+            price=Decimal(1000 + i),
+            persons_count=10 if i % 2 == 0 else 15,
+        )
+        if products:
+            ReadySolutionItem.objects.create(ready_solution=solution, product=products[0], quantity=2)
+        solutions.append(solution)
+    return category, products, solutions
+
+
+def make_request(cart):
+    request = RequestFactory().get('/')
+    request.COOKIES[CART_COOKIE_NAME] = encode_cart_cookie(cart)
+    request.session = {}
+    return request
+
+
+def set_client_cart(client, cart):
+    client.cookies[CART_COOKIE_NAME] = encode_cart_cookie(cart)
+
+
+def get_client_cart(client):
+    return decode_cart_cookie(client.cookies[CART_COOKIE_NAME].value)[0]
+
+
+def get_client_cart_summary(client):
+    return decode_cart_cookie(client.cookies[CART_COOKIE_NAME].value)[2]
+
+
+class CartItemsTests(CacheIsolatedTestCase):
+    def test_single_line_cart(self):
+        _, products, _ = make_catalog(products_count=1)
+        request = make_request({str(products[0].id): {'quantity': 3}})
+
+        with self.assertNumQueries(1):
+            cart_items, total_price = get_cart_items(request)
+
+        self.assertEqual(len(cart_items), 1)
+        self.assertEqual(cart_items[0]['product'], products[0])
+        self.assertEqual(cart_items[0]['type'], 'product')
+        self.assertEqual(cart_items[0]['total'], products[0].price * 3)
+        self.assertEqual(total_price, products[0].price * 3)
+
+    def test_fifty_line_cart_costs_same_queries_as_one_line(self):
+        _, products, _ = make_catalog(products_count=50)
+        cart = {str(product.id): {'quantity': 1} for product in products}
+
+        with self.assertNumQueries(1):
+            cart_items, total_price = get_cart_items(make_request(cart))
+
+        self.assertEqual(len(cart_items), 50)
+        self.assertEqual(total_price, sum(product.price for product in products))
+
+    def test_mixed_cart_uses_two_queries(self):
+        _, products, solutions = make_catalog(products_count=50, solutions_count=10)
+        cart = {str(product.id): {'quantity': 2} for product in products}
+        for solution in solutions:
+            cart[f'ready_solution_{solution.id}'] = {'quantity': 1, 'type': 'ready_solution'}
+
+        with self.assertNumQueries(2):
+            cart_items, total_price = get_cart_items(make_request(cart))
+
+        self.assertEqual(len(cart_items), 60)
+        expected = sum(p.price * 2 for p in products) + sum(s.price for s in solutions)
+        self.assertEqual(total_price, expected)
+
+    def test_keeps_cart_order(self):
+        _, products, solutions = make_catalog(products_count=2, solutions_count=1)
+        cart = {
+            str(products[1].id): {'quantity': 1},
+            f'ready_solution_{solutions[0].id}': {'quantity': 1, 'type': 'ready_solution'},
+            str(products[0].id): {'quantity': 1},
+        }
+
+        cart_items, _ = get_cart_items(make_request(cart))
+
+        self.assertEqual(
+            [item.get('product') or item.get('ready_solution') for item in cart_items],
+            [products[1], solutions[0], products[0]],
+        )
+
+    def test_skips_unpublished_missing_and_malformed_keys(self):
+        _, products, solutions = make_catalog(products_count=2, solutions_count=1)
+        Product.objects.filter(id=products[1].id).update(is_published=False)
+        cart = {
+            str(products[0].id): {'quantity': 1},
+            str(products[1].id): {'quantity': 1},
+            '999999': {'quantity': 1},
+            'garbage': {'quantity': 1},
+            'ready_solution_garbage': {'quantity': 1},
+            f'ready_solution_{solutions[0].id}': {'quantity': 2},
+        }
+
+        cart_items, total_price = get_cart_items(make_request(cart))
+
+        self.assertEqual(len(cart_items), 2)
+        self.assertEqual(total_price, products[0].price + solutions[0].price * 2)
+
+    def test_empty_cart_runs_no_queries(self):
+        with self.assertNumQueries(0):
+            cart_items, total_price = get_cart_items(make_request({}))
+
+        self.assertEqual(cart_items, [])
+        self.assertEqual(total_price, Decimal('0'))
+
+
+def db_writes(queries):
+    return [q['sql'] for q in queries if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')]
+
+
+def product_lookups(queries):
+    """Запросы, которые выбирают продукты корзины по id"""
+    return [q['sql'] for q in queries if 'FROM "product" WHERE' in q['sql'] and '"product"."id" IN' in q['sql']]
+
+
+class CartContextProcessorTests(CacheIsolatedTestCase):
+    def test_values_are_lazy(self):
+        _, products, _ = make_catalog(products_count=3)
+        request = make_request({str(product.id): {'quantity': 2} for product in products})
+
+        with self.assertNumQueries(0):
+            context = cart_context_processor(request)
+
+        # В cookie нет сводки: строки загружаются один раз на оба значения
+        with self.assertNumQueries(1):
+            self.assertEqual(context['cart_total'], 6)
+            self.assertTrue(context['cart_total'] > 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(context['cart_total_price'], sum(p.price * 2 for p in products))
+
+    def test_total_price_renders_when_template_uses_it(self):
+        _, products, _ = make_catalog(products_count=1)
+        request = make_request({str(products[0].id): {'quantity': 2}})
+        template = Template('{{ cart_total }}/{{ cart_total_price }}')
+
+        with self.assertNumQueries(1):
+            rendered = template.render(RequestContext(request, {}, [cart_context_processor]))
+
+        self.assertEqual(rendered, f'2/{products[0].price * 2}')
+
+    def test_index_does_not_resolve_cart_lines(self):
+        _, products, _ = make_catalog(products_count=50)
+        set_client_cart(self.client, {str(product.id): {'quantity': 1} for product in products})
+        # Первый запрос сохраняет сводку корзины в cookie
+        self.client.get(reverse('cart_info'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('index'))
+
+        self.assertContains(response, '<span class="cart-badge">50</span>', html=True)
+        self.assertEqual(product_lookups(ctx.captured_queries), [])
+
+    def test_admin_skips_cart(self):
+        _, products, _ = make_catalog(products_count=50)
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        set_client_cart(self.client, {str(product.id): {'quantity': 1} for product in products})
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:core_order_changelist'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('cart_total', response.context)
+        self.assertEqual(product_lookups(ctx.captured_queries), [])
+
+        set_client_cart(self.client, {})
+        with self.assertNumQueries(len(ctx.captured_queries)):
+            self.client.get(reverse('admin:core_order_changelist'))
+
+
+class CatalogSnapshotTests(CacheIsolatedTestCase):
+    def test_warm_index_runs_no_queries(self):
+        make_catalog(products_count=30, solutions_count=4)
+        self.client.get(reverse('index'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+
+        self.assertEqual(len(response.context['products']), 30)
+        self.assertEqual([c.title for c in response.context['categories']], ['Закуски'])
+
+    def test_product_save_invalidates_snapshot(self):
+        _, products, _ = make_catalog(products_count=2)
+        self.client.get(reverse('index'))
+        version = get_catalog_version()
+
+        products[0].title = 'Новое название'
+        products[0].save()
+
+        self.assertGreater(get_catalog_version(), version)
+        self.assertContains(self.client.get(reverse('index')), 'Новое название')
+
+    def test_catalog_models_bump_version_on_save_and_delete(self):
+        category, products, solutions = make_catalog(products_count=2, solutions_count=1)
+        bundle = Product.objects.create(title='Набор', slug='nabor', category=category, is_bundle=True)
+
+        changes = [
+            lambda: Category.objects.create(title='Десерты', slug='deserty'),
+            lambda: ProductBundleItem.objects.create(bundle=bundle, product=products[0]),
+            lambda: ReadySolutionItem.objects.create(ready_solution=solutions[0], product=products[1]),
+            lambda: solutions[0].save(),
+            lambda: ReadySolutionItem.objects.filter(product=products[1]).delete(),
+            lambda: bundle.delete(),
+        ]
+        for change in changes:
+            version = get_catalog_version()
+            change()
+            self.assertGreater(get_catalog_version(), version)
+
+    def test_unpublished_products_are_hidden_after_change(self):
+        _, products, _ = make_catalog(products_count=2)
+        self.client.get(reverse('index'))
+
+        products[1].is_published = False
+        products[1].save()
+
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['products'], [products[0]])
+
+
+class ReadySolutionMenuTests(CacheIsolatedTestCase):
+    def cold_index_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_index_query_count_does_not_grow_with_solutions(self):
+        category, products, _ = make_catalog(products_count=5, solutions_count=2)
+        baseline = self.cold_index_queries()
+
+        for i in range(2, 20):
+            solution = ReadySolution.objects.create(title=f'Меню {i}', price=1000, persons_count=10 if i % 2 else 15)
+            ReadySolutionItem.objects.bulk_create([
+                ReadySolutionItem(ready_solution=solution, product=product, order=order)
+                for order, product in enumerate(products)
+            ])
+
+        self.assertEqual(self.cold_index_queries(), baseline)
+
+    def test_solutions_grouped_by_persons_with_ordered_items(self):
+        category, products, _ = make_catalog(products_count=3)
+        solution = ReadySolution.objects.create(title='Фуршет', price=5000, persons_count=15)
+        ReadySolutionItem.objects.create(ready_solution=solution, product=products[2], order=0)
+        ReadySolutionItem.objects.create(ready_solution=solution, product=products[0], order=1)
+        ReadySolutionItem.objects.create(ready_solution=solution, product=products[1], order=1)
+
+        response = self.client.get(reverse('index'))
+
+        self.assertEqual(response.context['ready_solutions_10'], [])
+        self.assertEqual(response.context['ready_solutions_15'], [solution])
+        menu_items = response.context['ready_solutions_15'][0].menu_items
+        self.assertEqual([item.product for item in menu_items], [products[2], products[0], products[1]])
+
+
+def product_card_key(product):
+    return make_template_fragment_key('product_card', [product.id, product.updated_at.timestamp()])
+
+
+class ProductCardCacheTests(CacheIsolatedTestCase):
+    def test_cards_are_cached_per_product(self):
+        _, products, _ = make_catalog(products_count=3)
+        products = list(Product.objects.order_by('id'))
+        self.client.get(reverse('index'))
+
+        for product in products:
+            self.assertIsNotNone(cache.get(product_card_key(product)))
+
+    def test_unchanged_card_comes_from_cache(self):
+        make_catalog(products_count=2)
+        products = list(Product.objects.order_by('id'))
+        self.client.get(reverse('index'))
+        cache.set(product_card_key(products[0]), '<li>из кэша</li>')
+
+        response = self.client.get(reverse('index'))
+
+        self.assertContains(response, '<li>из кэша</li>', html=True)
+        self.assertContains(response, products[1].title)
+
+    def test_edited_product_is_rerendered(self):
+        make_catalog(products_count=2)
+        products = list(Product.objects.order_by('id'))
+        self.client.get(reverse('index'))
+        cache.set(product_card_key(products[0]), '<li>из кэша</li>')
+
+        products[0].description = 'Свежее описание'
+        products[0].save()
+        response = self.client.get(reverse('index'))
+
+        self.assertNotContains(response, 'из кэша')
+        self.assertContains(response, 'Свежее описание')
+
+
+@tag('benchmark')
+@skipUnless(BENCHMARKS, 'BENCHMARKS=1 для запуска')
+class ProductCardCacheBenchmark(TestCase):
+    """Карточки в файловом кэше, как в настройках сайта, а не в памяти"""
+    products_count = 500
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(CACHES={
+            'default': {**settings.CACHES['default'], 'LOCATION': directory.name},
+        }))
+
+    def test_cold_vs_warm_index_render(self):
+        category = Category.objects.create(title='Закуски', slug='zakuski')
+        Product.objects.bulk_create([
+            Product(
+                title=f'Продукт {i}',
+                price=100 + i,
+                category=category,
+                description='Описание ' * 20,
+                ingredientsList='; '.join(f'ингредиент {j}' for j in range(8)),
+                availableFrom=5 if i % 3 == 0 else None,
+                priceAdditional=150 if i % 4 == 0 else None,
+                priceFor=i % 2 == 0,
+            )
+            for i in range(self.products_count)
+        ])
+        self.client.get(reverse('index'))
+
+        def render():
+            started = time.perf_counter()
+            self.client.get(reverse('index'))
+            return time.perf_counter() - started
+
+        cold = []
+        for _ in range(5):
+            cache.clear()
+            self.client.get(reverse('index'))  # снимок каталога без карточек
+            cache.delete_many([product_card_key(p) for p in Product.objects.all()])
+            cold.append(render())
+        warm = [render() for _ in range(5)]
+
+        print(f'\n{self.products_count} карточек: холодный рендер {min(cold) * 1000:.1f} мс, тёплый {min(warm) * 1000:.1f} мс')
+        self.assertLess(min(warm), min(cold))
+
+
+CATALOG_TABLES = ('"product"', '"category"', '"ready_solution"', '"ready_solution_item"')
+
+
+def catalog_queries(queries):
+    return [q['sql'] for q in queries if any(f'FROM {table}' in q['sql'] for table in CATALOG_TABLES)]
+
+
+class ConditionalGetTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.products, _ = make_catalog(products_count=3, solutions_count=2)
+
+    def assertNotModified(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(catalog_queries(ctx.captured_queries), [])
+        return response
+
+    def test_index_etag_returns_304_without_catalog_queries(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            self.assertNotModified(reverse('index'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_index_last_modified_returns_304(self):
+        response = self.client.get(reverse('index'))
+        self.assertNotModified(reverse('index'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+    def test_index_etag_changes_with_catalog(self):
+        etag = self.client.get(reverse('index'))['ETag']
+
+        self.products[0].title = 'Другое название'
+        self.products[0].save()
+
+        response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Другое название')
+
+    def test_index_etag_changes_with_cart(self):
+        etag = self.client.get(reverse('index'))['ETag']
+
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]), {'quantity': 2})
+
+        response = self.client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<span class="cart-badge">2</span>', html=True)
+
+    def test_index_has_no_validators_with_pending_messages(self):
+        request = make_request({})
+        request._messages = CookieStorage(request)
+        self.assertIsNotNone(index_etag(request))
+
+        messages.success(request, 'Заказ оформлен')
+
+        self.assertIsNone(index_etag(request))
+        self.assertIsNone(index_last_modified(request))
+
+    def test_cart_info_returns_304_until_cart_changes(self):
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]))
+        response = self.client.get(reverse('cart_info'))
+        self.assertEqual(response.json()['cart_total'], 1)
+
+        self.assertNotModified(reverse('cart_info'), HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]))
+        response = self.client.get(reverse('cart_info'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cart_total'], 2)
+
+    def test_cart_info_etag_changes_with_prices(self):
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]))
+        etag = self.client.get(reverse('cart_info'))['ETag']
+
+        self.products[0].price = 999
+        self.products[0].save()
+
+        response = self.client.get(reverse('cart_info'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_price'], '999')
+
+
+class CatalogApiTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category, self.products, self.solutions = make_catalog(products_count=25, solutions_count=5)
+        self.other = Category.objects.create(title='Десерты', slug='deserty')
+        self.cake = Product.objects.create(title='Торт', slug='tort', price=900, category=self.other)
+
+    def fetch_all(self, url, **params):
+        results, cursor, pages = [], None, 0
+        while True:
+            query = dict(params, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            results += data['results']
+            pages += 1
+            cursor = data['next_cursor']
+            if cursor is None:
+                return results, pages
+
+    def test_products_paginated_by_keyset(self):
+        results, pages = self.fetch_all(reverse('catalog_products_api'), limit=10)
+
+        expected = sorted(self.products + [self.cake], key=lambda p: (p.title, p.id))
+        self.assertEqual([r['id'] for r in results], [p.id for p in expected])
+        self.assertEqual(pages, 3)
+
+    def test_products_filtered_by_category_slug(self):
+        response = self.client.get(reverse('catalog_products_api'), {'category': 'deserty'})
+
+        self.assertEqual(response.json(), {
+            'results': [{
+                'id': self.cake.id,
+                'title': 'Торт',
+                'slug': 'tort',
+                'category': 'deserty',
+                'price': '900',
+                'price_additional': None,
+                'price_for_one': False,
+                'available_from': None,
+                'description': None,
+                'ingredients': None,
+                'ingredients_list': [],
+                'image': None,
+            }],
+            'next_cursor': None,
+        })
+
+    def test_page_is_one_query_without_offset(self):
+        first = self.client.get(reverse('catalog_products_api'), {'limit': 5}).json()
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('catalog_products_api'), {'limit': 5, 'cursor': first['next_cursor']})
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+
+    def test_unpublished_and_bundles_are_hidden(self):
+        Product.objects.filter(id=self.cake.id).update(is_published=False)
+        Product.objects.create(title='Набор', slug='nabor', category=self.other, is_bundle=True)
+
+        response = self.client.get(reverse('catalog_products_api'), {'category': 'deserty'})
+
+        self.assertEqual(response.json()['results'], [])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('catalog_products_api'), {'cursor': 'не курсор'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ready_solutions_with_items(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('catalog_ready_solutions_api'), {'persons': 10})
+
+        results = response.json()['results']
+        self.assertEqual([r['id'] for r in results], [s.id for s in self.solutions if s.persons_count == 10])
+        self.assertEqual(results[0]['items'], [{'product_id': self.products[0].id, 'title': 'Продукт 0', 'quantity': 2}])
+
+    def test_cache_headers_and_304(self):
+        response = self.client.get(reverse('catalog_products_api'))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog_products_api'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ProductSearchTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(title='Закуски', slug='zakuski')
+        self.pirozhki = Product.objects.create(
+            title='Пирожки с капустой', slug='pirozhki', category=self.category,
+            description='Домашние пирожки', ingredientsList='тесто; капуста; лук',
+        )
+        self.salad = Product.objects.create(
+            title='Салат оливье', slug='olivie', category=self.category,
+            description='Классический салат', ingredients='картофель, морковь, колбаса, горошек',
+        )
+        self.tart = Product.objects.create(
+            title='Тарталетки', slug='tartaletki', category=self.category,
+            description='С капустой и грибами',
+        )
+
+    def test_match_query_is_sanitized(self):
+        self.assertEqual(build_match_query('Пирожки "с" капуст*'), '"пирожки"* "с"* "капуст"*')
+        self.assertIsNone(build_match_query('  *"() '))
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(search_product_ids('капуст'), [self.pirozhki.id, self.tart.id])
+        self.assertEqual(search_product_ids('горош'), [self.salad.id])
+        self.assertEqual(search_product_ids('салат оливье'), [self.salad.id])
+
+    def test_index_follows_save_and_delete(self):
+        self.salad.title = 'Салат мимоза'
+        self.salad.save()
+        self.assertEqual(search_product_ids('мимоза'), [self.salad.id])
+        self.assertEqual(search_product_ids('оливье'), [])
+
+        self.salad.delete()
+        self.assertEqual(search_product_ids('мимоза'), [])
+
+    def test_rebuild_command(self):
+        Product.objects.bulk_create([Product(title='Канапе с сыром', category=self.category)])
+        self.assertEqual(search_product_ids('канапе'), [])
+
+        call_command('rebuild_search_index', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(len(search_product_ids('канапе')), 1)
+        self.assertEqual(len(search_product_ids('капуст')), 2)
+
+    def test_storefront_hides_unpublished(self):
+        self.pirozhki.is_published = False
+        self.pirozhki.save()
+
+        self.assertEqual(search_products('капуст'), [self.tart])
+
+    def test_search_endpoint(self):
+        response = self.client.get(reverse('search'), {'q': 'оливье'})
+
+        self.assertEqual(response.json(), {
+            'query': 'оливье',
+            'results': [{'id': self.salad.id, 'title': 'Салат оливье', 'slug': 'olivie', 'category': 'zakuski', 'price': '0'}],
+        })
+        self.assertEqual(self.client.get(reverse('search')).json()['results'], [])
+
+    def test_admin_search_uses_index(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:core_product_changelist'), {'q': 'капуст'})
+
+        self.assertEqual(set(response.context['cl'].result_list), {self.pirozhki, self.tart})
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        self.assertTrue(any('MATCH' in sql for sql in sqls))
+        self.assertFalse(any('LIKE' in sql for sql in sqls))
+
+
+@tag('benchmark')
+@skipUnless(BENCHMARKS, 'BENCHMARKS=1 для запуска')
+class ProductSearchBenchmark(TestCase):
+    products_count = 100_000
+
+    def test_search_on_large_catalog(self):
+        words = ['капуста', 'сыр', 'ветчина', 'грибы', 'курица', 'лосось', 'томаты', 'зелень', 'оливки', 'креветки']
+        category = Category.objects.create(title='Закуски', slug='zakuski')
+        Product.objects.bulk_create([
+            Product(
+                title=f'Закуска {i} {words[i % 10]}',
+                category=category,
+                description=f'Описание {words[(i * 7) % 10]} и {words[(i * 3) % 10]}',
+                ingredientsList='; '.join(words[(i + j) % 10] for j in range(4)),
+            )
+            for i in range(self.products_count)
+        ], batch_size=5000)
+
+        started = time.perf_counter()
+        rebuild_search_index()
+        rebuild_time = time.perf_counter() - started
+
+        timings = []
+        for query in ['капуст', 'лосось креветки', 'сыр грибы зелень', 'закуска 4242']:
+            started = time.perf_counter()
+            products = search_products(query, limit=20)
+            timings.append(time.perf_counter() - started)
+            self.assertTrue(products)
+
+        print(f'\nFTS5 на {self.products_count} продуктах: индекс {rebuild_time:.2f} с, '
+              f'поиск {", ".join(f"{t * 1000:.1f}" for t in timings)} мс')
+        self.assertLess(max(timings), 0.5)
+
+
+class IngredientIndexTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(title='Закуски', slug='zakuski')
+        self.brownie = Product.objects.create(
+            title='Брауни', slug='brauni', category=self.category, ingredientsList='Шоколад; Грецкие орехи; сливочное масло',
+        )
+        self.tart = Product.objects.create(
+            title='Тарталетки', slug='tartaletki', category=self.category, ingredientsList='тесто; Сыр;  сливочное   масло ',
+        )
+        self.salad = Product.objects.create(title='Салат', slug='salat', category=self.category, ingredientsList='огурцы; зелень')
+
+    def test_parse_normalizes_and_deduplicates(self):
+        self.assertEqual(
+            parse_ingredients(' Мёд ; мед; ; Сливочное  масло'),
+            [('Мёд', 'мед'), ('Сливочное  масло', 'сливочное масло')],
+        )
+
+    def test_ingredients_are_shared_between_products(self):
+        self.assertEqual(Ingredient.objects.filter(name='сливочное масло').count(), 1)
+        self.assertEqual(
+            list(self.tart.ingredient_links.values_list('label', flat=True)),
+            ['тесто', 'Сыр', 'сливочное   масло'],
+        )
+
+    def test_links_follow_ingredients_list_changes(self):
+        self.salad.ingredientsList = 'огурцы; укроп'
+        self.salad.save()
+
+        self.assertEqual(list(self.salad.ingredient_links.values_list('ingredient__name', flat=True)), ['огурцы', 'укроп'])
+
+        self.salad.ingredientsList = ''
+        self.salad.save()
+        self.assertFalse(self.salad.ingredient_links.exists())
+
+    def test_unchanged_list_is_not_rewritten(self):
+        link_ids = set(self.brownie.ingredient_links.values_list('id', flat=True))
+
+        self.brownie.price = 500
+        self.brownie.save()
+
+        self.assertEqual(set(self.brownie.ingredient_links.values_list('id', flat=True)), link_ids)
+
+    def test_include_and_exclude_filters(self):
+        products = Product.objects.order_by('title')
+
+        self.assertEqual(list(filter_by_ingredients(products, include=['Сливочное масло'])), [self.brownie, self.tart])
+        self.assertEqual(list(filter_by_ingredients(products, include=['сливочное масло', 'сыр'])), [self.tart])
+        self.assertEqual(list(filter_by_ingredients(products, exclude=['грецкие орехи'])), [self.salad, self.tart])
+        self.assertEqual(list(filter_by_ingredients(products, include=['сливочное масло'], exclude=['Сыр'])), [self.brownie])
+
+    def test_filter_uses_ingredient_index(self):
+        queryset = filter_by_ingredients(Product.objects.all(), include=['сыр'], exclude=['грецкие орехи'])
+        with connection.cursor() as cursor:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+
+        self.assertNotIn('SCAN ingredient', plan)
+        self.assertNotIn('SCAN product_ingredient', plan)
+
+    def test_catalog_api_filters_by_ingredients(self):
+        response = self.client.get(reverse('catalog_products_api'), {'with': 'сливочное масло', 'without': 'грецкие орехи'})
+
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.tart.id])
+
+    def test_prefetched_lists_need_no_parsing_queries(self):
+        products = list(Product.objects.order_by('title').prefetch_related('ingredient_links'))
+
+        with self.assertNumQueries(0):
+            lists = [product.get_ingredients_list() for product in products]
+
+        self.assertEqual(lists[0], ['Шоколад', 'Грецкие орехи', 'сливочное масло'])
+
+
+class CartBatchTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.products, self.solutions = make_catalog(products_count=10, solutions_count=2)
+        cart = {str(product.id): {'quantity': 1} for product in self.products}
+        cart[f'ready_solution_{self.solutions[0].id}'] = {'quantity': 1, 'type': 'ready_solution'}
+        set_client_cart(self.client, cart)
+
+    def post_batch(self, operations):
+        return self.client.post(reverse('cart_batch'), json.dumps({'operations': operations}), content_type='application/json')
+
+    def test_ten_edits_in_one_request_without_db_writes(self):
+        operations = [{'op': 'update', 'type': 'product', 'id': product.id, 'quantity': 3} for product in self.products]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_batch(operations)
+
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['cart_total'], 31)
+        expected_total = sum(p.price * 3 for p in self.products) + self.solutions[0].price
+        self.assertEqual(data['total_price'], str(expected_total))
+        self.assertEqual(data['items'][0], {
+            'type': 'product', 'id': self.products[0].id, 'quantity': 3, 'item_total': str(self.products[0].price * 3),
+        })
+        self.assertEqual(db_writes(ctx.captured_queries), [])
+        self.assertEqual(get_client_cart(self.client)[str(self.products[0].id)], {'quantity': 3})
+
+    def test_mixed_operations(self):
+        response = self.post_batch([
+            {'op': 'remove', 'type': 'product', 'id': self.products[0].id},
+            {'op': 'update', 'type': 'product', 'id': self.products[1].id, 'quantity': 0},
+            {'op': 'add', 'type': 'product', 'id': self.products[2].id, 'quantity': 2},
+            {'op': 'add', 'type': 'ready_solution', 'id': self.solutions[1].id},
+            {'op': 'update', 'type': 'ready_solution', 'id': self.solutions[0].id, 'quantity': 4},
+        ])
+
+        items = {(item['type'], item['id']): item['quantity'] for item in response.json()['items']}
+        self.assertNotIn(('product', self.products[0].id), items)
+        self.assertNotIn(('product', self.products[1].id), items)
+        self.assertEqual(items[('product', self.products[2].id)], 3)
+        self.assertEqual(items[('ready_solution', self.solutions[1].id)], 1)
+        self.assertEqual(items[('ready_solution', self.solutions[0].id)], 4)
+        self.assertEqual(self.client.get(reverse('cart_info')).json()['cart_total'], 7 + 3 + 1 + 4)
+
+    def test_unknown_products_are_not_added(self):
+        response = self.post_batch([{'op': 'add', 'type': 'product', 'id': 999999, 'quantity': 1}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('999999', get_client_cart(self.client))
+
+    def test_invalid_operation_leaves_cart_untouched(self):
+        cart_before = get_client_cart(self.client)
+
+        for payload in [
+            [{'op': 'update', 'type': 'product', 'id': self.products[0].id, 'quantity': 5}, {'op': 'explode', 'id': 1}],
+            [{'op': 'update', 'type': 'product', 'id': 'abc', 'quantity': 1}],
+            [{'op': 'update', 'type': 'product', 'id': self.products[0].id, 'quantity': -1}],
+        ]:
+            response = self.post_batch(payload)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+
+        self.assertEqual(self.client.post(reverse('cart_batch'), 'не json', content_type='application/json').status_code, 400)
+        self.assertEqual(get_client_cart(self.client), cart_before)
+
+
+class CartStorageTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.products, self.solutions = make_catalog(products_count=3, solutions_count=1)
+
+    def test_cookie_round_trip(self):
+        cart = {str(self.products[0].id): {'quantity': 2}, f'ready_solution_{self.solutions[0].id}': {'quantity': 1, 'type': 'ready_solution'}}
+
+        self.assertEqual(decode_cart_cookie(encode_cart_cookie(cart, 42)), (cart, 42, None))
+
+    def test_tampered_cookie_is_ignored(self):
+        value = encode_cart_cookie({str(self.products[0].id): {'quantity': 2}})
+        self.client.cookies[CART_COOKIE_NAME] = value[:-2] + 'xx'
+
+        self.assertEqual(self.client.get(reverse('cart_info')).json()['cart_total'], 0)
+
+    def test_anonymous_cart_editing_writes_nothing_to_db(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('index'))
+            self.client.post(reverse('add_to_cart', args=[self.products[0].id]), {'quantity': 2})
+            self.client.post(reverse('add_ready_solution_to_cart', args=[self.solutions[0].id]))
+            self.client.post(reverse('update_cart_item', args=[self.products[0].id]), {'quantity': 5})
+            self.client.post(reverse('remove_ready_solution_from_cart', args=[self.solutions[0].id]))
+            response = self.client.get(reverse('cart'))
+
+        self.assertEqual(db_writes(ctx.captured_queries), [])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertEqual(response.context['cart_items'][0]['quantity'], 5)
+
+    def test_oversized_cart_falls_back_to_session(self):
+        # Ключи несуществующих товаров: корзина не влезает в cookie
+        cart = {str(1_000_000 + i * 7919): {'quantity': i} for i in range(1500)}
+        self.assertGreater(len(encode_cart_cookie(cart)), CART_COOKIE_MAX_SIZE)
+        request = make_request({})
+        request.session = self.client.session
+        storage = CookieCartStorage(request)
+
+        storage.save(cart, 7)
+        response = HttpResponse()
+        storage.update_response(response)
+
+        self.assertEqual(request.session['cart'], cart)
+        self.assertEqual(response.cookies[CART_COOKIE_NAME].value, '')
+
+    def test_legacy_session_cart_moves_to_cookie(self):
+        session = self.client.session
+        session['cart'] = {str(self.products[0].id): {'quantity': 3}}
+        session['cart_revision'] = 5
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        self.assertEqual(self.client.get(reverse('cart_info')).json()['cart_total'], 3)
+
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]))
+
+        self.assertEqual(get_client_cart(self.client), {str(self.products[0].id): {'quantity': 4}})
+        self.assertNotIn('cart', self.client.session)
+
+    @override_settings(CART_STORAGE='core.cart_storage.SessionCartStorage')
+    def test_session_storage(self):
+        self.client.post(reverse('add_to_cart', args=[self.products[0].id]), {'quantity': 2})
+
+        self.assertEqual(self.client.session['cart'], {str(self.products[0].id): {'quantity': 2}})
+        self.assertNotIn(CART_COOKIE_NAME, self.client.cookies)
+        self.assertEqual(self.client.get(reverse('cart_info')).json()['cart_total'], 2)
+
+
+
+class CartSummaryTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.products, self.solutions = make_catalog(products_count=3, solutions_count=1)
+        set_client_cart(self.client, {
+            str(self.products[0].id): {'quantity': 2},
+            f'ready_solution_{self.solutions[0].id}': {'quantity': 1, 'type': 'ready_solution'},
+        })
+
+    def cart_info(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(reverse('cart_info')).json()
+        return data, len(ctx.captured_queries)
+
+    def test_summary_is_stored_and_reused(self):
+        expected = {'cart_total': 3, 'total_price': str(self.products[0].price * 2 + self.solutions[0].price)}
+
+        self.assertEqual(self.cart_info(), (expected, 2))
+        summary = get_client_cart_summary(self.client)
+        self.assertEqual((summary['lines'], summary['quantity']), (2, 3))
+
+        self.assertEqual(self.cart_info(), (expected, 0))
+
+    def test_catalog_change_invalidates_summary(self):
+        self.cart_info()
+        cache.set('catalog:version', get_catalog_version() + 1)
+        Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('1'))
+
+        data, queries = self.cart_info()
+
+        self.assertEqual(queries, 2)
+        self.assertEqual(data['total_price'], str(Decimal('2') + self.solutions[0].price))
+
+    def test_cart_change_invalidates_summary(self):
+        self.cart_info()
+        self.client.post(reverse('remove_ready_solution_from_cart', args=[self.solutions[0].id]))
+
+        self.assertEqual(self.cart_info()[0], {'cart_total': 2, 'total_price': str(self.products[0].price * 2)})
+
+    def test_batch_stores_fresh_summary(self):
+        self.client.post(reverse('cart_batch'), {'operations': [
+            {'op': 'update', 'id': self.products[0].id, 'quantity': 5},
+        ]}, content_type='application/json')
+
+        self.assertEqual(self.cart_info()[1], 0)
+        self.assertEqual(get_client_cart_summary(self.client)['quantity'], 6)
+
+    def test_empty_cart_sets_no_cookie(self):
+        client = Client()
+
+        self.assertEqual(client.get(reverse('cart_info')).json()['cart_total'], 0)
+        self.assertNotIn(CART_COOKIE_NAME, client.cookies)
+
+
+ORDER_FORM_DATA = {
+    'customer_name': 'Тест',
+    'customer_phone': '+79990000000',
+    'order_date': '2030-01-01',
+    'order_time': '12:00',
+    'delivery_address': 'Ленина, 1',
+}
+
+
+class OrderPlacementTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.products, self.solutions = make_catalog(products_count=30, solutions_count=2)
+        self.customer = {
+            'customer_name': 'Тест',
+            'customer_phone': '+79990000000',
+            'order_date': date(2030, 1, 1),
+            'order_time': dt_time(12, 0),
+            'delivery_address': 'Ленина, 1',
+        }
+
+    def make_cart(self, products_count):
+        cart = {str(product.id): {'quantity': 2} for product in self.products[:products_count]}
+        cart.update({f'ready_solution_{s.id}': {'quantity': 1, 'type': 'ready_solution'} for s in self.solutions})
+        return cart
+
+    def test_prices_are_snapshotted(self):
+        order = place_order(self.make_cart(3), self.customer)
+
+        expected_total = sum(p.price * 2 for p in self.products[:3]) + sum(s.price for s in self.solutions)
+        self.assertEqual(order.total_price, expected_total)
+        self.assertEqual(len(order.lines), 5)
+        items = set(order.items.values_list('item_type', 'product_id', 'ready_solution_id', 'price'))
+        self.assertIn(('ready_solution', None, self.solutions[0].id, self.solutions[0].price), items)
+        self.assertIn(('product', self.products[2].id, None, self.products[2].price), items)
+
+    def test_ready_solution_line_keeps_snapshot(self):
+        order = place_order(self.make_cart(0), self.customer)
+        solution = self.solutions[0]
+        solution.title = 'Переименованное меню'
+        solution.save()
+        solution.items.all().delete()
+        line = order.items.get(ready_solution=solution)
+
+        self.assertEqual(line.title, 'Меню 0')
+        self.assertEqual(line.components, [{'product_id': self.products[0].id, 'title': 'Продукт 0', 'quantity': 2}])
+
+        ReadySolution.objects.filter(pk=solution.pk).delete()
+        line.refresh_from_db()
+        self.assertIsNone(line.ready_solution_id)
+        self.assertEqual(line.title, 'Меню 0')
+
+    def test_admin_shows_solution_components(self):
+        order = place_order(self.make_cart(1), self.customer)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        response = self.client.get(reverse('admin:core_order_change', args=[order.id]))
+
+        self.assertContains(response, 'Меню 1')
+        self.assertContains(response, 'Продукт 0 × 2')
+
+    def test_order_keeps_items_summary(self):
+        order = place_order(self.make_cart(3), self.customer)
+        order.refresh_from_db()
+
+        self.assertEqual(order.items_count, 5)
+        self.assertEqual(order.items_summary, 'Продукт 0 × 2, Продукт 1 × 2, Продукт 2 × 2')
+
+    def test_changelist_queries_do_not_grow_with_orders(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:core_order_changelist')
+        place_order(self.make_cart(5), self.customer)
+
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(url)
+        for _ in range(99):
+            place_order(self.make_cart(5), self.customer)
+        with CaptureQueriesContext(connection) as page:
+            response = self.client.get(url)
+
+        self.assertContains(response, 'Продукт 0 × 2, Продукт 1 × 2, Продукт 2 × 2 <span style="color: #666;">(+4 еще)</span>', count=100)
+        self.assertEqual(len(page.captured_queries), len(one.captured_queries))
+        self.assertFalse([q for q in page.captured_queries if 'order_item' in q['sql']])
+
+    def test_query_count_does_not_grow_with_lines(self):
+        with CaptureQueriesContext(connection) as small:
+            place_order(self.make_cart(1), self.customer)
+        with CaptureQueriesContext(connection) as large:
+            place_order(self.make_cart(30), self.customer)
+
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        # Попытка занять окно, заказ, строки заказа одним INSERT и письмо в очередь
+        self.assertEqual(len(db_writes(large.captured_queries)), 4)
+        self.assertEqual(OrderItem.objects.filter(order__in=Order.objects.all()).count(), 3 + 32)
+
+    def test_failure_rolls_back_order(self):
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                place_order(self.make_cart(3), self.customer)
+
+        self.assertFalse(Order.objects.exists())
+
+    def test_unavailable_cart_raises(self):
+        with self.assertRaises(EmptyCartError):
+            place_order({'999999': {'quantity': 1}}, self.customer)
+
+        self.assertFalse(Order.objects.exists())
+
+    def test_view_places_order_and_clears_cart(self):
+        set_client_cart(self.client, self.make_cart(2))
+
+        response = self.client.post(reverse('create_order'), ORDER_FORM_DATA)
+
+        self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+        order = Order.objects.get()
+        self.assertEqual(order.items.count(), 4)
+        self.assertEqual(get_client_cart(self.client), {})
+        # Письмо не отправляется в запросе, а ждёт в очереди
+        self.assertEqual(mail.outbox, [])
+        self.assertIn(f'#{order.id}', OutboxEmail.objects.get().subject)
+
+    def test_failure_rolls_back_notification(self):
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                place_order(self.make_cart(3), self.customer)
+
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+class FlakyEmailBackend(BaseEmailBackend):
+    """Тестовый SMTP: считает соединения и роняет письма с «сбой» в теме"""
+    opened = 0
+    refuse_connection = False
+
+    def open(self):
+        if FlakyEmailBackend.refuse_connection:
+            raise SMTPException('connection refused')
+        FlakyEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'сбой' in message.subject:
+                raise SMTPException('451 try again later')
+            mail.outbox.append(message)
+        return len(messages)
+
+
+@override_settings(EMAIL_BACKEND='core.tests.FlakyEmailBackend', ADMIN_EMAIL='admin@example.com')
+class EmailOutboxTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        FlakyEmailBackend.opened = 0
+        FlakyEmailBackend.refuse_connection = False
+
+    def test_batch_uses_one_connection(self):
+        for i in range(5):
+            enqueue_email(f'Письмо {i}', 'Текст', ['a@example.com'])
+
+        self.assertEqual(send_outbox_batch(batch_size=3), (3, 0))
+        self.assertEqual(send_outbox_batch(batch_size=3), (2, 0))
+
+        self.assertEqual(FlakyEmailBackend.opened, 2)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(OutboxEmail.objects.filter(status='sent').count(), 5)
+
+    def test_failed_email_is_retried_with_backoff(self):
+        failing = enqueue_email('сбой', 'Текст', ['a@example.com'])
+        enqueue_email('Письмо', 'Текст', ['a@example.com'])
+
+        self.assertEqual(send_outbox_batch(), (1, 1))
+
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('pending', 1))
+        self.assertIn('451', failing.last_error)
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+        # Пауза ещё не прошла
+        self.assertEqual(send_outbox_batch(), (0, 0))
+        self.assertGreater(retry_delay(3), retry_delay(2))
+
+    def test_email_is_dead_lettered(self):
+        failing = enqueue_email('сбой', 'Текст', ['a@example.com'])
+
+        for _ in range(OUTBOX_MAX_ATTEMPTS):
+            OutboxEmail.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+            send_outbox_batch()
+
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ('dead', OUTBOX_MAX_ATTEMPTS))
+        OutboxEmail.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox_batch(), (0, 0))
+
+    def test_connection_failure_defers_whole_batch(self):
+        FlakyEmailBackend.refuse_connection = True
+        enqueue_email('Письмо 1', 'Текст', ['a@example.com'])
+        enqueue_email('Письмо 2', 'Текст', ['a@example.com'])
+
+        self.assertEqual(send_outbox_batch(), (0, 2))
+        self.assertEqual(set(OutboxEmail.objects.values_list('attempts', flat=True)), {1})
+
+    def test_contact_form_is_queued(self):
+        response = self.client.post(reverse('index'), {'name': 'Иван', 'phone': '+79990000000', 'question': 'Доставка?'})
+
+        self.assertEqual(response.status_code, 200)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.to, ['admin@example.com'])
+        self.assertIn('Доставка?', email.body)
+        self.assertEqual(mail.outbox, [])
+
+    def test_command_drains_queue(self):
+        for i in range(3):
+            enqueue_email(f'Письмо {i}', 'Текст', ['a@example.com'])
+
+        call_command('send_outbox', '--once', '--batch-size=2', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboxEmail.objects.filter(status='pending').exists())
+
+
+def make_order(order_date, status='new'):
+    return Order.objects.create(
+        customer_name='Тест', customer_phone='+79990000000', order_date=order_date,
+        order_time=dt_time(12, 0), delivery_address='Ленина, 1', total_price=0, status=status,
+    )
+
+
+class ProductionCatalogMixin:
+    """Продукты, набор из двух продуктов и состав готового решения"""
+
+    def setUp(self):
+        super().setUp()
+        category, self.products, _ = make_catalog(products_count=3)
+        self.bundle = Product.objects.create(title='Набор', slug='nabor', price=500, category=category, is_bundle=True)
+        ProductBundleItem.objects.create(bundle=self.bundle, product=self.products[0], quantity=2)
+        ProductBundleItem.objects.create(bundle=self.bundle, product=self.products[1], quantity=1)
+        self.day = date(2030, 1, 1)
+        self.components = [
+            {'product_id': self.products[1].id, 'title': 'Продукт 1', 'quantity': 3},
+            {'product_id': self.products[2].id, 'title': 'Продукт 2', 'quantity': 1},
+        ]
+
+    def add_lines(self, order, product_quantity=1, bundle_quantity=1, solution_quantity=1):
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[0], title='Продукт 0', quantity=product_quantity, price=100),
+            OrderItem(order=order, product=self.bundle, title='Набор', quantity=bundle_quantity, price=500),
+            OrderItem(order=order, item_type='ready_solution', title='Меню', components=self.components,
+                      quantity=solution_quantity, price=1000),
+        ])
+
+
+class ProductionPlanTests(ProductionCatalogMixin, CacheIsolatedTestCase):
+    def test_expands_bundles_and_ready_solutions(self):
+        self.add_lines(make_order(self.day), product_quantity=1, bundle_quantity=2, solution_quantity=1)
+        self.add_lines(make_order(self.day), product_quantity=3, bundle_quantity=1, solution_quantity=2)
+        self.add_lines(make_order(self.day, status='cancelled'), product_quantity=100)
+        self.add_lines(make_order(self.day + timedelta(days=1)))
+
+        with self.assertNumQueries(4):
+            plan = build_production_plan(self.day)
+
+        rows = {row['product_id']: (row['direct'], row['in_bundles'], row['in_ready_solutions'], row['quantity']) for row in plan}
+        self.assertEqual(rows, {
+            self.products[0].id: (4, 6, 0, 10),
+            self.products[1].id: (0, 3, 9, 12),
+            self.products[2].id: (0, 0, 3, 3),
+        })
+        self.assertEqual({row['date'] for row in build_production_plan(self.day, self.day + timedelta(days=1))},
+                         {self.day, self.day + timedelta(days=1)})
+
+    def test_csv_export(self):
+        self.add_lines(make_order(self.day))
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        response = self.client.get(reverse('admin:core_order_production_plan'), {'date_from': '2030-01-01', 'format': 'csv'})
+        lines = response.content.decode('utf-8-sig').splitlines()
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(lines[0].split(';')[0], 'Дата')
+        self.assertIn(f'2030-01-01;{self.products[0].id};Продукт 0;1;2;0;3', lines)
+
+    def test_admin_page_and_command(self):
+        self.add_lines(make_order(self.day))
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        self.assertContains(self.client.get(reverse('admin:core_order_production_plan'), {'date_from': '2030-01-01'}), 'Продукт 2')
+
+        out = StringIO()
+        call_command('production_plan', '--from=2030-01-01', stdout=out)
+        self.assertIn(f'2030-01-01;{self.products[2].id};Продукт 2;0;0;1;1', out.getvalue())
+
+    def test_admin_page_requires_order_view_permission(self):
+        staff = get_user_model().objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        self.client.force_login(staff)
+
+        for params in ({'date_from': '2030-01-01'}, {'date_from': '2030-01-01', 'format': 'csv'}):
+            self.assertEqual(self.client.get(reverse('admin:core_order_production_plan'), params).status_code, 403)
+
+
+@tag('benchmark')
+@skipUnless(BENCHMARKS, 'BENCHMARKS=1 для запуска')
+class ProductionPlanBenchmark(ProductionCatalogMixin, CacheIsolatedTestCase):
+    """Неделя с 10 000 заказов, в каждом товар, набор и готовое решение"""
+    orders = 10_000
+
+    def test_week_plan(self):
+        orders = Order.objects.bulk_create([
+            Order(customer_name='Тест', customer_phone='+79990000000', order_date=self.day + timedelta(days=i % 7),
+                  order_time=dt_time(12, 0), delivery_address='Ленина, 1', total_price=0)
+            for i in range(self.orders)
+        ], batch_size=500)
+        OrderItem.objects.bulk_create([
+            line
+            for i, order in enumerate(orders)
+            for line in (
+                OrderItem(order=order, product=self.products[i % 3], title='Продукт', quantity=1 + i % 4, price=100),
+                OrderItem(order=order, product=self.bundle, title='Набор', quantity=1, price=500),
+                OrderItem(order=order, item_type='ready_solution', title='Меню', components=self.components, quantity=1, price=1000),
+            )
+        ], batch_size=500)
+
+        started = time.perf_counter()
+        plan = build_production_plan(self.day, self.day + timedelta(days=6))
+        elapsed = time.perf_counter() - started
+
+        print(f'\nПлан на неделю, {self.orders} заказов: {elapsed * 1000:.0f} мс, строк плана {len(plan)}')
+        self.assertEqual(sum(row['in_bundles'] for row in plan), self.orders * 3)
+        self.assertLess(elapsed, 1)
+
+
+class DeliverySlotTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.products, _ = make_catalog(products_count=1)
+        self.day = date(2030, 1, 1)
+        self.slot = DeliverySlot.objects.create(date=self.day, start_time=dt_time(12), end_time=dt_time(13), capacity=2)
+        DeliverySlot.objects.create(date=self.day, start_time=dt_time(13), end_time=dt_time(14), capacity=1)
+
+    def order(self, order_time='12:30'):
+        set_client_cart(self.client, {str(self.products[0].id): {'quantity': 1}})
+        return self.client.post(reverse('create_order'), dict(ORDER_FORM_DATA, order_time=order_time))
+
+    def slots(self):
+        return self.client.get(reverse('delivery_slots'), {'from': '2030-01-01', 'to': '2030-01-02'}).json()['dates']
+
+    def test_reservation_stops_at_capacity(self):
+        self.assertEqual(reserve_slot(self.day, dt_time(12, 15)), self.slot.id)
+        self.assertEqual(reserve_slot(self.day, dt_time(12, 45)), self.slot.id)
+
+        with self.assertRaises(DeliverySlotError):
+            reserve_slot(self.day, dt_time(12, 30))
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.reserved, 2)
+
+    def test_time_outside_slots_is_rejected(self):
+        with self.assertRaises(DeliverySlotError):
+            reserve_slot(self.day, dt_time(9))
+        # На дату без окон доставка не ограничивается
+        self.assertIsNone(reserve_slot(self.day + timedelta(days=1), dt_time(9)))
+
+    def test_full_slot_rejects_order(self):
+        self.assertEqual(self.order('13:00').status_code, 302)
+
+        response = self.order('13:30')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('order_time', response.context['form'].errors)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_order_keeps_slot_free(self):
+        customer = {
+            'customer_name': 'Тест', 'customer_phone': '+79990000000', 'order_date': self.day,
+            'order_time': dt_time(12, 30), 'delivery_address': 'Ленина, 1',
+        }
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                place_order({str(self.products[0].id): {'quantity': 1}}, customer)
+
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.reserved, 0)
+
+    def test_availability_is_cached_and_invalidated(self):
+        self.assertEqual(self.slots(), {'2030-01-01': [
+            {'start': '12:00', 'end': '13:00', 'capacity': 2, 'remaining': 2, 'available': True},
+            {'start': '13:00', 'end': '14:00', 'capacity': 1, 'remaining': 1, 'available': True},
+        ]})
+        with self.assertNumQueries(0):
+            get_availability(self.day, self.day + timedelta(days=1))
+
+        self.order('13:10')
+        self.assertEqual(self.slots()['2030-01-01'][1]['available'], False)
+
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:core_order_changelist'), {
+            'action': 'mark_as_cancelled', '_selected_action': [Order.objects.get().id],
+        })
+        self.assertEqual(self.slots()['2030-01-01'][1]['remaining'], 1)
+        self.assertIsNone(Order.objects.get().delivery_slot_id)
+
+    def test_overlapping_slots_take_one_seat(self):
+        overlapping = DeliverySlot(date=self.day, start_time=dt_time(12, 30), end_time=dt_time(13, 30), capacity=5)
+        with self.assertRaises(ValidationError):
+            overlapping.clean()
+        # Мимо clean (bulk_create, shell) пересечение всё же можно завести
+        DeliverySlot.objects.bulk_create([overlapping])
+
+        self.assertEqual(reserve_slot(self.day, dt_time(12, 45)), self.slot.id)
+        self.assertEqual(
+            dict(DeliverySlot.objects.filter(date=self.day).values_list('start_time', 'reserved')),
+            {dt_time(12): 1, dt_time(12, 30): 0, dt_time(13): 0},
+        )
+
+    def test_deleting_orders_releases_slots(self):
+        self.order('12:10')
+        self.order('12:20')
+        self.order('13:10')
+        first, second, third = Order.objects.order_by('id')
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        self.client.post(reverse('admin:core_order_delete', args=[first.id]), {'post': 'yes'})
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.reserved, 1)
+
+        self.client.post(reverse('admin:core_order_changelist'), {
+            'action': 'delete_selected', '_selected_action': [second.id, third.id], 'post': 'yes',
+        })
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(list(DeliverySlot.objects.values_list('reserved', flat=True)), [0, 0])
+        self.assertEqual(self.slots()['2030-01-01'][0]['remaining'], 2)
+
+    def test_range_is_validated(self):
+        self.assertEqual(self.client.get(reverse('delivery_slots'), {'from': 'завтра'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('delivery_slots'), {'from': '2030-01-01', 'to': '2030-03-01'}).status_code, 400)
+
+
+
+class OrderExportTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.products, _ = make_catalog(products_count=2)
+        self.orders = []
+        for i in range(5):
+            order = make_order(date(2030, 1, 1 + i), status='cancelled' if i == 4 else 'new')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=self.products[0], title='Продукт 0', quantity=2, price=100),
+                OrderItem(order=order, item_type='ready_solution', title='Меню', quantity=1, price=1000,
+                          components=[{'product_id': self.products[1].id, 'title': 'Продукт 1', 'quantity': 3}]),
+            ])
+            self.orders.append(order)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def export(self, params=None):
+        response = self.client.get(reverse('admin:core_order_export'), params or {})
+        return response, list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines(), delimiter=';'))
+
+    def test_streams_orders_with_lines(self):
+        response, rows = self.export()
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(rows[0][0], 'Заказ')
+        self.assertEqual(len(rows), 1 + 10)
+        self.assertEqual(rows[2][9:], ['Готовое решение', 'Меню', 'Продукт 1 × 3', '1', '1000', '1000'])
+
+    def test_filters_match_changelist(self):
+        _, rows = self.export({'status__exact': 'new', 'order_date__gte': '2030-01-02', 'order_date__lt': '2030-01-04'})
+
+        self.assertEqual({row[0] for row in rows[1:]}, {str(self.orders[1].id), str(self.orders[2].id)})
+        self.assertEqual(self.client.get(reverse('admin:core_order_export'), {'order_date__gte': 'вчера'}).status_code, 400)
+
+    def test_search_matches_changelist(self):
+        Order.objects.filter(id=self.orders[3].id).update(customer_name='Мария Иванова')
+
+        _, rows = self.export({'q': 'Иванова', 'status__exact': 'new'})
+
+        self.assertEqual({row[0] for row in rows[1:]}, {str(self.orders[3].id)})
+
+    def test_formulas_are_escaped(self):
+        Order.objects.filter(id=self.orders[0].id).update(
+            customer_name='=HYPERLINK("http://example.com")', customer_phone='+cmd|/c calc', delivery_address='@SUM(A1)',
+        )
+        OrderItem.objects.filter(order=self.orders[0], item_type='product').update(title='-1+2')
+
+        _, rows = self.export({'order_date__lt': '2030-01-02'})
+
+        self.assertEqual(rows[1][5:8], ["'=HYPERLINK(\"http://example.com\")", "'+cmd|/c calc", "'@SUM(A1)"])
+        self.assertEqual(rows[1][10], "'-1+2")
+        self.assertEqual(rows[2][10], 'Меню')
+
+    def test_phone_numbers_are_not_escaped(self):
+        Order.objects.filter(id=self.orders[0].id).update(customer_phone='+7 (999) 123-45-67')
+        Order.objects.filter(id=self.orders[1].id).update(customer_phone='-1+2')
+
+        _, rows = self.export({'order_date__lt': '2030-01-03'})
+
+        self.assertEqual([row[6] for row in rows[1::2]], ['+7 (999) 123-45-67', "'-1+2"])
+
+    def test_prefetch_per_chunk(self):
+        # Пять заказов пачками по два: один курсор по заказам и запрос строк на каждую пачку
+        with self.assertNumQueries(4):
+            rows = list(iter_order_rows(Order.objects.all(), chunk_size=2))
+        self.assertEqual(len(rows), 10)
+
+    def test_header_is_sent_before_queries(self):
+        response = self.client.get(reverse('admin:core_order_export'))
+
+        with self.assertNumQueries(0):
+            first = next(iter(response.streaming_content))
+        self.assertIn('Заказ'.encode(), first)
+
+    def test_admin_action(self):
+        response = self.client.post(reverse('admin:core_order_changelist'), {
+            'action': 'export_csv', '_selected_action': [self.orders[0].id],
+        })
+
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()), 3)
+
+
+class OrderStatusTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+        self.day = date(2030, 1, 1)
+
+    def make_orders(self, count, status='new'):
+        Order.objects.bulk_create([
+            Order(customer_name='Тест', customer_phone='+79990000000', order_date=self.day, order_time=dt_time(12, 0),
+                  delivery_address='Ленина, 1', total_price=0, status=status)
+            for _ in range(count)
+        ])
+        return list(Order.objects.filter(status=status).order_by('id'))
+
+    def mark(self, action, orders, follow=False):
+        return self.client.post(reverse('admin:core_order_changelist'), {
+            'action': action, '_selected_action': [order.id for order in orders],
+        }, follow=follow)
+
+    def test_transitions_are_validated_and_audited(self):
+        new = make_order(self.day)
+        cancelled = make_order(self.day, 'cancelled')
+
+        result = apply_transitions({new.id: 'processing', cancelled.id: 'new'}, self.admin)
+
+        self.assertEqual(result.changed, [new.id])
+        self.assertEqual(result.rejected, [(cancelled.id, 'cancelled', 'new')])
+        self.assertEqual(Order.objects.get(id=cancelled.id).status, 'cancelled')
+        change = OrderStatusChange.objects.get()
+        self.assertEqual((change.order_id, change.from_status, change.to_status, change.changed_by), (new.id, 'new', 'processing', self.admin))
+        # Повторный перевод в тот же статус ничего не пишет
+        self.assertEqual(change_status(Order.objects.filter(id=new.id), 'processing'), ([], []))
+        self.assertEqual(OrderStatusChange.objects.count(), 1)
+
+    def test_action_queries_do_not_grow_with_orders(self):
+        few = self.make_orders(5)
+        with CaptureQueriesContext(connection) as small:
+            self.mark('mark_as_processing', few)
+        many = self.make_orders(500)
+        with CaptureQueriesContext(connection) as large:
+            self.mark('mark_as_completed', many)
+
+        def without_audit(queries):
+            return [q for q in queries if not q['sql'].startswith('INSERT INTO "order_status_change"')]
+
+        self.assertEqual(len(without_audit(large.captured_queries)), len(without_audit(small.captured_queries)))
+        self.assertEqual(Order.objects.filter(status='completed').count(), 500)
+        self.assertEqual(OrderStatusChange.objects.filter(to_status='completed', changed_by=self.admin).count(), 500)
+        writes = db_writes(large.captured_queries)
+        self.assertEqual(len([q for q in writes if q.startswith('UPDATE "order"')]), 1)
+        # bulk_create делит вставку только по лимиту SQLite в 999 параметров: 199 строк на INSERT
+        self.assertEqual(len([q for q in writes if q.startswith('INSERT INTO "order_status_change"')]), 3)
+
+    def test_cancel_releases_slots(self):
+        slots = [
+            DeliverySlot.objects.create(date=self.day, start_time=dt_time(hour), end_time=dt_time(hour + 1), capacity=5, reserved=2)
+            for hour in (12, 13)
+        ]
+        orders = self.make_orders(4)
+        for order, slot in zip(orders, [slots[0], slots[0], slots[1], None]):
+            Order.objects.filter(id=order.id).update(delivery_slot=slot)
+
+        self.mark('mark_as_cancelled', orders)
+
+        self.assertEqual([slot.reserved for slot in DeliverySlot.objects.order_by('start_time')], [0, 1])
+        self.assertFalse(Order.objects.filter(delivery_slot__isnull=False).exists())
+        # Отменённый заказ обратно не возвращается
+        response = self.mark('mark_as_new', orders[:1], follow=True)
+        self.assertContains(response, 'Переход статуса не разрешён для заказов: #')
+        self.assertEqual(Order.objects.get(id=orders[0].id).status, 'cancelled')
+
+    def test_list_editable_applies_transitions_at_once(self):
+        orders = self.make_orders(2) + self.make_orders(1, 'completed')
+        data = {'_save': 'Сохранить', 'form-TOTAL_FORMS': 3, 'form-INITIAL_FORMS': 3, 'form-MIN_NUM_FORMS': 0, 'form-MAX_NUM_FORMS': 1000}
+        for i, (order, status) in enumerate(zip(orders, ['processing', 'new', 'new'])):
+            data.update({f'form-{i}-id': order.id, f'form-{i}-status': status})
+
+        response = self.client.post(reverse('admin:core_order_changelist'), data, follow=True)
+
+        self.assertEqual([o.status for o in Order.objects.order_by('id')], ['processing', 'new', 'completed'])
+        self.assertContains(response, f'#{orders[2].id} (Завершен → Новый)')
+        self.assertEqual(list(OrderStatusChange.objects.values_list('order_id', 'to_status')), [(orders[0].id, 'processing')])
+
+    def test_history_survives_archive(self):
+        order = make_order(timezone.localdate() - timedelta(days=365))
+        change_status(Order.objects.filter(id=order.id), 'completed', self.admin)
+        archive_batch(timezone.localdate())
+
+        response = self.client.get(reverse('admin:core_archivedorder_change', args=[order.id]))
+
+        self.assertContains(response, 'Новый → Завершен (admin)')
+
+
+class OrderArchiveTests(ProductionCatalogMixin, CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        today = timezone.localdate()
+        self.cutoff = today - timedelta(days=180)
+        old_date = today - timedelta(days=200)
+        self.old = [make_order(old_date, status) for status in ('completed', 'cancelled', 'completed')]
+        for order in self.old:
+            self.add_lines(order)
+        # Свежий выполненный и старый незавершённый заказы остаются на месте
+        self.kept = [make_order(self.cutoff, 'completed'), make_order(old_date, 'processing')]
+
+    def test_moves_old_finished_orders_with_lines(self):
+        order = self.old[0]
+        batches = list(archive_orders(self.cutoff, batch_size=2))
+
+        self.assertEqual([(b['orders'], b['items']) for b in batches], [(2, 6), (1, 3)])
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {o.id for o in self.kept})
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[o.id for o in self.old]).exists())
+
+        archived = ArchivedOrder.objects.get(id=order.id)
+        self.assertEqual((archived.status, archived.created_at), (order.status, order.created_at))
+        solution = archived.items.get(item_type='ready_solution')
+        self.assertEqual((solution.title, solution.components), ('Меню', self.components))
+        self.assertEqual(archived.items.get(title='Набор').product_id, self.bundle.id)
+
+    def test_batch_rolls_back_on_error(self):
+        with mock.patch.object(ArchivedOrderItem.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                archive_batch(self.cutoff)
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self.assertEqual(OrderItem.objects.count(), 9)
+
+    def test_command_reports_batches(self):
+        out = StringIO()
+        call_command('archive_orders', '--dry-run', stdout=out)
+        self.assertIn('Будет перенесено заказов: 3, строк: 9', out.getvalue())
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+        out = StringIO()
+        with self.settings(ORDER_ARCHIVE_AFTER_DAYS=190):
+            call_command('archive_orders', '--batch-size=2', stdout=out)
+        self.assertIn('Пачка 1: заказов 2, строк 6', out.getvalue())
+        self.assertIn('Пачка 2: заказов 1, строк 3', out.getvalue())
+        self.assertIn('Перенесено заказов: 3, строк: 9', out.getvalue())
+
+    def test_admin_is_read_only(self):
+        archive_batch(self.cutoff)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+        order_id = self.old[0].id
+
+        response = self.client.get(reverse('admin:core_archivedorder_change', args=[order_id]))
+        self.assertContains(response, 'Продукт 1 × 3')
+        self.assertNotContains(response, 'name="_save"')
+        self.assertEqual(self.client.get(reverse('admin:core_archivedorder_add')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:core_archivedorder_delete', args=[order_id])).status_code, 403)
+
+
+def query_plan(queryset):
+    """EXPLAIN QUERY PLAN выборки: строки плана через ' | '"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return ' | '.join(row[-1] for row in cursor.fetchall())
+
+
+class QueryPlanTests(TestCase):
+    """
+    Горячие запросы витрины и админки не читают таблицы целиком.
+
+    Данных достаточно, чтобы после ANALYZE планировщик SQLite выбирал план по
+    статистике, а не по умолчанию для пустых таблиц.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(title=f'Категория {i}', slug=f'cat-{i}') for i in range(20)])
+        products = Product.objects.bulk_create([
+            Product(title=f'Продукт {i:05}', slug=f'product-{i}', price=100, category=categories[i % 20],
+                    is_published=i % 10 != 0, is_bundle=i % 25 == 0)
+            for i in range(4000)
+        ])
+        ReadySolution.objects.bulk_create([
+            ReadySolution(title=f'Меню {i}', slug=f'menu-{i}', price=1000, persons_count=(5, 10, 15, 20)[i % 4],
+                          is_published=i % 5 != 0)
+            for i in range(400)
+        ])
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        Order.objects.bulk_create([
+            Order(customer_name='Тест', customer_phone='+79990000000', order_date=date(2029, 1, 1) + timedelta(days=i % 730),
+                  order_time=dt_time(12, 0), delivery_address='Ленина, 1', total_price=100, status=statuses[i % 4])
+            for i in range(8000)
+        ])
+        orders = list(Order.objects.values_list('id', flat=True))
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=orders[i % len(orders)], product=products[i % 4000], title='Продукт', quantity=1, price=100)
+            for i in range(16000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def hot_queries(self):
+        storefront = Product.objects.filter(is_published=True, is_bundle=False)
+        published_solutions = ReadySolution.objects.filter(is_published=True)
+        changelist = Order.objects.order_by('-created_at', '-pk')
+        return {
+            'витрина': storefront.select_related('category'),
+            'API каталога': storefront.values('id', 'title').order_by('title', 'id')[:25],
+            'API каталога, следующая страница': storefront.filter(
+                Q(title__gt='Продукт 01000') | Q(title='Продукт 01000', id__gt=1000)
+            ).values('id', 'title').order_by('title', 'id')[:25],
+            'API каталога по категории': storefront.filter(category__slug='cat-3').values('id', 'title').order_by('title', 'id')[:25],
+            'меню готовых решений': published_solutions.order_by('persons_count', 'title'),
+            'API готовых решений по персонам': published_solutions.filter(persons_count=10).values('id', 'title').order_by('title', 'id')[:25],
+            'список заказов': changelist[:100],
+            'список заказов по статусу': changelist.filter(status='new')[:100],
+            'список заказов по дате доставки': changelist.filter(order_date__gte=date(2030, 1, 1), order_date__lt=date(2030, 1, 8))[:100],
+            'план производства': OrderItem.objects.filter(
+                order__order_date__range=(date(2030, 1, 1), date(2030, 1, 7)), order__status__in=PLAN_STATUSES,
+            ).values_list('order__order_date', 'product_id').annotate(quantity=Sum('quantity')).order_by(),
+            'архив': archivable_orders(date(2029, 3, 1)).order_by().values_list('id', flat=True)[:500],
+            'строки заказов': OrderItem.objects.filter(order_id__in=[1, 2, 3]).order_by('id'),
+        }
+
+    def test_hot_queries_do_not_scan_tables(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = query_plan(queryset)
+                # "SCAN <таблица>" без USING INDEX - чтение всей таблицы. Категорий
+                # два десятка, их перебор в JOIN витрины допустим
+                scanned = set(re.findall(r'SCAN (\w+)(?= \||$)', plan)) - {'category'}
+                self.assertFalse(scanned, plan)
+
+
+class SQLiteProfileTests(TestCase):
+    def test_pragmas_are_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            values = {}
+            for name in ('synchronous', 'cache_size', 'temp_store'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+
+        # NORMAL = 1, MEMORY = 2
+        self.assertEqual(values, {'synchronous': 1, 'cache_size': -20000, 'temp_store': 2})
+
+
+@mock.patch('core.db.time.sleep')
+class RetryOnLockedTests(SimpleTestCase):
+    def flaky(self, failures, error='database is locked'):
+        calls = []
+
+        @retry_on_locked(attempts=3)
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(error)
+            return 'ok'
+
+        return write, calls
+
+    def test_retries_with_growing_delay(self, sleep):
+        write, calls = self.flaky(failures=2)
+
+        self.assertEqual(write(), 'ok')
+        self.assertEqual(len(calls), 3)
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertLess(first, second)
+
+    def test_gives_up_after_attempts(self, sleep):
+        write, calls = self.flaky(failures=5)
+
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_are_not_retried(self, sleep):
+        write, calls = self.flaky(failures=1, error='no such table: order')
+
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_not_retried_inside_outer_transaction(self, sleep):
+        write, calls = self.flaky(failures=1)
+
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            with self.assertRaises(OperationalError):
+                write()
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICA_READS=True)
+class ReplicaRoutingTests(TransactionTestCase):
+    """В тестах replica - зеркало default (TEST MIRROR), маршрут виден по соединению"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        _, self.products, _ = make_catalog(products_count=3)
+        mark_replica_synced(get_catalog_version())
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def test_storefront_reads_from_replica(self):
+        for url in (reverse('catalog_products_api'), reverse('catalog_ready_solutions_api')):
+            primary, replica = self.get(url)
+            self.assertEqual(primary, 0)
+            self.assertGreater(replica, 0)
+        self.assertNotIn(STICKY_COOKIE_NAME, self.client.cookies)
+
+        # Снимок каталога главной кэшируется под версией и собирается из основной базы
+        primary, replica = self.get(reverse('index'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_client_reads_from_primary_after_write(self):
+        set_client_cart(self.client, {str(self.products[0].id): {'quantity': 1}})
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.post(reverse('create_order'), ORDER_FORM_DATA)
+
+        self.assertEqual(len(replica.captured_queries), 0)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.client.cookies[STICKY_COOKIE_NAME]['max-age'], 10)
+        self.assertEqual(self.get(reverse('catalog_products_api'))[1], 0)
+
+        # Другой клиент по-прежнему читает с реплики
+        self.client = Client()
+        self.assertEqual(self.get(reverse('catalog_products_api'))[0], 0)
+
+    def test_other_views_and_disabled_replica_use_primary(self):
+        self.assertEqual(self.get(reverse('delivery_slots'))[1], 0)
+        with self.settings(DATABASE_REPLICA_READS=False):
+            self.assertEqual(self.get(reverse('catalog_products_api'))[1], 0)
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICA_READS=True)
+class LaggingReplicaTests(TransactionTestCase):
+    """Реплика - отдельный файл, снятый до последних записей в default"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        _, self.products, _ = make_catalog(products_count=1)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.replica_path = f'{directory.name}/replica.sqlite3'
+        self.sync_replica()
+
+        replica = connections['replica']
+        mirror_settings = replica.settings_dict
+        replica.close()
+        replica.settings_dict = {**mirror_settings, 'NAME': self.replica_path}
+
+        def restore():
+            replica.close()
+            replica.settings_dict = mirror_settings
+        self.addCleanup(restore)
+
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def sync_replica(self):
+        """То же, что sync_replica: копия основной базы и отметка версии каталога"""
+        version = get_catalog_version()
+        connections['default'].ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connections['default'].connection.backup(target)
+        target.close()
+        mark_replica_synced(version)
+
+    def api_titles(self):
+        return [product['title'] for product in self.client.get(reverse('catalog_products_api')).json()['results']]
+
+    def test_catalog_is_read_from_replica(self):
+        # Изменение мимо сигналов не сдвигает версию: реплика считается свежей
+        Product.objects.filter(id=self.products[0].id).update(title='Новое название')
+
+        self.assertEqual(self.api_titles(), [self.products[0].title])
+
+    def test_catalog_edit_is_visible_before_and_after_sync(self):
+        old_title = self.products[0].title
+        self.client.get(reverse('index'))
+        api = self.client.get(reverse('catalog_products_api'))
+
+        product = Product.objects.get(id=self.products[0].id)
+        product.title = 'Новое название'
+        product.save()
+
+        # Реплика отстала: главная и API читают основную базу, 304 на старое не отдаётся
+        for _ in range(2):
+            self.assertContains(self.client.get(reverse('index')), 'Новое название')
+            self.assertNotContains(self.client.get(reverse('index')), old_title)
+            self.assertEqual(self.api_titles(), ['Новое название'])
+        response = self.client.get(reverse('catalog_products_api'), HTTP_IF_NONE_MATCH=api['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        self.sync_replica()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.api_titles(), ['Новое название'])
+        self.assertGreater(len(replica.captured_queries), 0)
+        self.assertContains(self.client.get(reverse('index')), 'Новое название')
+
+    def test_session_survives_storefront_request(self):
+        response = self.client.get(reverse('index'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(self.client.get(reverse('admin:index')).status_code, 200)
+
+
+class CopyDatabaseTests(SimpleTestCase):
+    def test_copies_consistent_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, target = f'{directory}/db.sqlite3', f'{directory}/replica.sqlite3'
+            db = sqlite3.connect(source)
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, title TEXT)')
+            db.executemany('INSERT INTO item (title) VALUES (?)', [(f'item {i}',) for i in range(1000)])
+            db.commit()
+
+            self.assertGreater(copy_database(source, target, pages=2), 0)
+            db.execute('DELETE FROM item WHERE id > 10')
+            db.commit()
+            db.close()
+
+            replica = sqlite3.connect(target)
+            self.assertEqual(replica.execute('SELECT count(*) FROM item').fetchone()[0], 1000)
+            replica.close()
+
+
+def make_image_file(name, size, mode='RGB', image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 100, 50, 128)[:len(mode)]).save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageVariantTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.category = Category.objects.create(title='Закуски', slug='zakuski')
+
+    def make_product(self, image):
+        return Product.objects.create(title='Тарталетки', slug='tartaletki', price=300, category=self.category, imageMain=image)
+
+    def render(self, product):
+        template = Template('{% load images %}{% responsive_image product.imageMain alt=product.title sizes="50vw" %}')
+        return template.render(Context({'product': product}))
+
+    def test_upload_builds_variants(self):
+        product = self.make_product(make_image_file('photo.jpg', (1500, 1000)))
+        name = product.imageMain.name
+
+        for width in (320, 640, 1024):
+            for extension in ('webp', 'jpg'):
+                with default_storage.open(variant_name(name, width, extension)) as file:
+                    self.assertEqual(Image.open(file).size, (width, round(1000 * width / 1500)))
+
+        html = self.render(product)
+        self.assertIn('<source type="image/webp" srcset="/media/product_images/tartaletki/photo.w320.webp 320w', html)
+        self.assertIn('.w1024.webp 1024w, /media/product_images/tartaletki/photo.jpg 1500w" sizes="50vw">', html)
+        self.assertIn('.w1024.jpg 1024w, /media/product_images/tartaletki/photo.jpg 1500w" sizes="50vw" alt="Тарталетки" loading="lazy"', html)
+        self.assertIn('src="/media/product_images/tartaletki/photo.w1024.jpg"', html)
+
+    def test_transparent_image_is_not_upscaled(self):
+        product = self.make_product(make_image_file('logo.png', (400, 200), 'RGBA', 'PNG'))
+
+        self.assertEqual(build_variants(product.imageMain.name), [320])
+        with default_storage.open(variant_name(product.imageMain.name, 320, 'jpg')) as file:
+            image = Image.open(file)
+            self.assertEqual((image.size, image.mode), ((320, 160), 'RGB'))
+        self.assertFalse(default_storage.exists(variant_name(product.imageMain.name, 640, 'webp')))
+        self.assertIn('logo.w320.webp 320w, /media/product_images/tartaletki/logo.png 400w"', self.render(product))
+
+    def test_image_narrower_than_variants_is_shown_as_is(self):
+        product = self.make_product(make_image_file('icon.png', (200, 100), 'RGBA', 'PNG'))
+
+        self.assertEqual(build_variants(product.imageMain.name), [])
+        self.assertFalse(default_storage.exists(variant_name(product.imageMain.name, 320, 'jpg')))
+        # Фото обработано, хотя копий нет: повторные сохранения его не открывают
+        with mock.patch('core.images.Image.open') as image_open:
+            product.save()
+            call_command('build_image_variants', '--workers=1', stdout=StringIO())
+        image_open.assert_not_called()
+        self.assertEqual(
+            self.render(product),
+            '<img src="/media/product_images/tartaletki/icon.png" alt="Тарталетки" loading="lazy" decoding="async">',
+        )
+
+    def test_original_until_backfill(self):
+        name = default_storage.save('product_images/tartaletki/old.jpg', make_image_file('old.jpg', (800, 600)))
+        product = Product.objects.bulk_create([
+            Product(title='Тарталетки', slug='tartaletki', price=300, category=self.category, imageMain=name),
+        ])[0]
+        self.assertEqual(
+            self.render(product),
+            '<img src="/media/product_images/tartaletki/old.jpg" alt="Тарталетки" loading="lazy" decoding="async">',
+        )
+
+        out = StringIO()
+        call_command('build_image_variants', '--workers=2', stdout=out)
+
+        self.assertIn('Готово: 1, с ошибками: 0', out.getvalue())
+        self.assertTrue(default_storage.exists(variant_name(name, 640, 'webp')))
+        self.assertIn('old.w640.jpg 640w, /media/product_images/tartaletki/old.jpg 800w"', self.render(product))
+
+
+@tag('benchmark')
+@skipUnless(BENCHMARKS, 'BENCHMARKS=1 для запуска')
+@override_settings(CACHES=TEST_CACHES)
+class DeliverySlotConcurrencyBenchmark(TransactionTestCase):
+    """Параллельные оформления на одно окно не занимают больше мест, чем есть"""
+    threads = 16
+    capacity = 5
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        _, products, _ = make_catalog(products_count=1)
+        slot = DeliverySlot.objects.create(date=date(2030, 1, 1), start_time=dt_time(12), end_time=dt_time(13), capacity=self.capacity)
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def checkout():
+            client = Client()
+            set_client_cart(client, {str(products[0].id): {'quantity': 1}})
+            barrier.wait()
+            try:
+                statuses.append(client.post(reverse('create_order'), dict(ORDER_FORM_DATA, order_time='12:30')).status_code)
+            except Exception as e:
+                # Блокировка SQLite под нагрузкой - отказ, но не перебронирование
+                statuses.append(type(e).__name__)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=checkout) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        slot.refresh_from_db()
+        print(f'\nОформлений: {self.threads}, мест: {self.capacity}, ответы: {dict(Counter(map(str, statuses)))}')
+        self.assertEqual(Order.objects.count(), slot.reserved)
+        self.assertLessEqual(slot.reserved, self.capacity)
+
+@tag('benchmark')
+@skipUnless(BENCHMARKS, 'BENCHMARKS=1 для запуска')
+@override_settings(CACHES=TEST_CACHES)
+class CartStorageLoadBenchmark(TransactionTestCase):
+    """
+    Задержка оформления заказа, пока параллельно идёт поток изменений корзины.
+
+    Потоки корзины кликают с постоянной частотой, чтобы оба хранилища получали
+    одинаковую нагрузку: иначе быстрые запросы cookie-хранилища просто
+    кликают чаще и отнимают GIL у оформления.
+    """
+    cart_threads = 8
+    clicks_per_second = 20
+    orders = 40
+
+    def run_load(self):
+        _, products, _ = make_catalog(products_count=20)
+        stop = threading.Event()
+        errors = []
+        clicks = []
+        writes = []
+
+        def count_writes(execute, sql, params, many, context):
+            if sql.split()[0] in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+                writes.append(sql)
+            return execute(sql, params, many, context)
+
+        def cart_traffic():
+            client = Client()
+            interval = 1 / self.clicks_per_second
+            next_click = time.perf_counter()
+            try:
+                with connection.execute_wrapper(count_writes):
+                    while not stop.is_set():
+                        client.post(reverse('add_to_cart', args=[products[len(clicks) % 20].id]))
+                        clicks.append(1)
+                        next_click += interval
+                        time.sleep(max(0, next_click - time.perf_counter()))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=cart_traffic) for _ in range(self.cart_threads)]
+        for thread in threads:
+            thread.start()
+
+        timings = []
+        client = Client()
+        try:
+            for i in range(self.orders):
+                client.post(reverse('add_to_cart', args=[products[i % 20].id]))
+                started = time.perf_counter()
+                client.post(reverse('create_order'), ORDER_FORM_DATA)
+                timings.append(time.perf_counter() - started)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Order.objects.count(), self.orders)
+        return {
+            'median': statistics.median(timings),
+            'p95': statistics.quantiles(timings, n=20)[18],
+            'max': max(timings),
+            'clicks': len(clicks),
+            'writes': len(writes),
+        }
+
+    def test_order_latency_under_cart_traffic(self):
+        with override_settings(CART_STORAGE='core.cart_storage.SessionCartStorage'):
+            session = self.run_load()
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        cookie = self.run_load()
+
+        def describe(result):
+            return (
+                'медиана {:.1f} мс, p95 {:.1f} мс, максимум {:.1f} мс; '.format(*(result[key] * 1000 for key in ('median', 'p95', 'max')))
+                + f'кликов {result["clicks"]}, записей в базу {result["writes"]}'
+            )
+
+        print(f'\nЗаказ при {self.cart_threads} потоках корзины по {self.clicks_per_second} кликов в секунду:\n'
+              f'  сессия: {describe(session)}\n'
+              f'  cookie: {describe(cookie)}\n'
+              f'  медиана cookie / сессия: {cookie["median"] / session["median"]:.2f}')
+        # Выигрыш cookie-хранилища - клики корзины не пишут в базу и не
+        # занимают блокировку SQLite; задержка зависит от машины и только печатается
+        self.assertGreaterEqual(session['writes'], session['clicks'])
+        self.assertEqual(cookie['writes'], 0)
+
+
+@tag('benchmark')
+@skipUnless(BENCHMARKS, 'BENCHMARKS=1 для запуска')
+@override_settings(CACHES=TEST_CACHES)
+class CheckoutConcurrencyBenchmark(TransactionTestCase):
+    """
+    Много потоков, как у gunicorn --threads, одновременно оформляют заказы.
+
+    С WAL, ожиданием блокировки и повтором place_order ни одно оформление не
+    должно упасть с "database is locked". Отдельно от
+    DeliverySlotConcurrencyBenchmark: там проверяется перебронирование окна.
+    """
+    threads = 32
+    orders_per_thread = 5
+
+    def test_concurrent_checkouts_succeed(self):
+        _, products, _ = make_catalog(products_count=10)
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def checkout(n):
+            client = Client()
+            barrier.wait()
+            try:
+                for i in range(self.orders_per_thread):
+                    set_client_cart(client, {str(products[(n + i) % 10].id): {'quantity': 1}})
+                    started = time.perf_counter()
+                    try:
+                        status = client.post(reverse('create_order'), ORDER_FORM_DATA).status_code
+                    except Exception as e:
+                        status = type(e).__name__
+                    results.append((status, time.perf_counter() - started))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=checkout, args=(n,)) for n in range(self.threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        timings = [t for _, t in results]
+        print(f'\nПотоков: {self.threads}, заказов: {len(results)} за {elapsed:.2f} с '
+              f'({len(results) / elapsed:.0f} в секунду), ответы: {dict(Counter(str(s) for s, _ in results))}\n'
+              f'  медиана {statistics.median(timings) * 1000:.1f} мс, '
+              f'p95 {statistics.quantiles(timings, n=20)[18] * 1000:.1f} мс, максимум {max(timings) * 1000:.1f} мс')
+        self.assertEqual(Counter(s for s, _ in results), {302: self.threads * self.orders_per_thread})
+        self.assertEqual(Order.objects.count(), self.threads * self.orders_per_thread)
@@ -10,6 +10,11 @@ urlpatterns = [
     path('cart/add-solution/<int:solution_id>/', views.add_ready_solution_to_cart_view, name='add_ready_solution_to_cart'),
     path('cart/remove-solution/<int:solution_id>/', views.remove_ready_solution_from_cart_view, name='remove_ready_solution_from_cart'),
     path('cart/update-solution/<int:solution_id>/', views.update_ready_solution_cart_item_view, name='update_ready_solution_cart_item'),
+    path('cart/batch/', views.cart_batch_view, name='cart_batch'),
     path('cart/info/', views.get_cart_info, name='cart_info'),
     path('cart/order/', views.create_order, name='create_order'),
+    path('delivery/slots/', views.delivery_slots_view, name='delivery_slots'),
+    path('search/', views.search_view, name='search'),
+    path('api/catalog/products/', views.catalog_products_api, name='catalog_products_api'),
+    path('api/catalog/ready-solutions/', views.catalog_ready_solutions_api, name='catalog_ready_solutions_api'),
 ]
\ No newline at end of file
@@ -1,73 +1,69 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.contrib import messages
-from django.core.mail import send_mail, EmailMessage
-from django.conf import settings
-from django.template.loader import render_to_string
+from datetime import date, timedelta
 from decimal import Decimal
 import json
 
-from .models import Product, Category, Order, OrderItem, ReadySolution
+from .models import Product, ReadySolution, ReadySolutionItem
+from .ingredients import filter_by_ingredients
+from .outbox import notify_admin
+from .search import search_products
+from .services import EmptyCartError, place_order
 from .forms import OrderForm, ContactForm
 from .cart_utils import (
     add_to_cart, remove_from_cart, update_cart_item,
     add_ready_solution_to_cart, remove_ready_solution_from_cart, update_ready_solution_cart_item,
-    get_cart_items, get_cart_total_quantity, clear_cart
+    get_cart, get_cart_items, get_cart_total_quantity, get_cart_total_price, clear_cart,
+    apply_cart_operations, InvalidCartOperation,
+)
+from .catalog import InvalidCursor, get_catalog_snapshot, paginate_keyset, use_catalog_replica
+from .delivery import AVAILABILITY_MAX_DAYS, DeliverySlotError, get_availability
+from .conditional import (
+    cart_info_etag, cart_info_last_modified, index_etag, index_last_modified,
+    catalog_api_etag, catalog_api_last_modified,
 )
 
-from django.db.models.functions import Length
 
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=index_etag, last_modified_func=index_last_modified)
 def index(request):
-    # Исключаем категорию "Готовые решения", если она есть, чтобы избежать дублирования
-    categories = Category.objects.annotate(name_length=Length('title')).exclude(title='Готовые решения').order_by('name_length')
-    products = Product.objects.filter(is_published=True, is_bundle=False).select_related('category')
-    ready_solutions = ReadySolution.objects.filter(is_published=True).prefetch_related('items__product').order_by('persons_count')
+    # Каталог берётся из кэшированного снимка, который сбрасывается сигналами при изменениях
+    catalog = get_catalog_snapshot()
     
     form = ContactForm()
     
     if request.method == 'POST':
         form = ContactForm(request.POST)
         if form.is_valid():
-            # Отправить email
-            try:
-                admin_email = getattr(settings, 'ADMIN_EMAIL', settings.DEFAULT_FROM_EMAIL)
-                if admin_email:
-                    subject = 'Новая заявка с сайта Maria Br'
-                    question_text = form.cleaned_data.get('question', '').strip() or 'Не указан'
-                    message = f"""
+            # Письмо уходит через очередь email_outbox, SMTP в запросе не нужен
+            question_text = form.cleaned_data.get('question', '').strip() or 'Не указан'
+            message = f"""
 Новая заявка с формы обратной связи:
 
 Имя: {form.cleaned_data['name']}
 Телефон: {form.cleaned_data['phone']}
 Вопрос: {question_text}
 """
-                    send_mail(
-                        subject,
-                        message,
-                        settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
-                        [admin_email],
-                        fail_silently=False,
-                    )
-                    messages.success(request, 'Спасибо! Ваша заявка отправлена. Мы свяжемся с вами в ближайшее время.')
-                    form = ContactForm()  # Очистить форму после отправки
-                else:
-                    messages.error(request, 'Извините, произошла ошибка. Попробуйте позже.')
-            except Exception as e:
-                messages.error(request, 'Извините, произошла ошибка при отправке заявки. Попробуйте позже.')
+            if notify_admin('Новая заявка с сайта Maria Br', message):
+                messages.success(request, 'Спасибо! Ваша заявка отправлена. Мы свяжемся с вами в ближайшее время.')
+                form = ContactForm()  # Очистить форму после отправки
+            else:
+                messages.error(request, 'Извините, произошла ошибка. Попробуйте позже.')
         else:
             messages.error(request, 'Пожалуйста, исправьте ошибки в форме.')
 
-    # Группируем готовые решения по количеству персон
-    ready_solutions_10 = ready_solutions.filter(persons_count=10)
-    ready_solutions_15 = ready_solutions.filter(persons_count=15)
+    # Готовые решения уже сгруппированы по количеству персон в снимке каталога
+    ready_solution_menu = catalog['ready_solution_menu']
     
     context = {
-        'categories': categories,
-        'products': products,
-        'ready_solutions': ready_solutions,
-        'ready_solutions_10': ready_solutions_10,
-        'ready_solutions_15': ready_solutions_15,
+        'categories': catalog['categories'],
+        'products': catalog['products'],
+        'ready_solutions': catalog['ready_solutions'],
+        'ready_solutions_10': ready_solution_menu.get(10, []),
+        'ready_solutions_15': ready_solution_menu.get(15, []),
         'form': form,
     }
 
@@ -115,7 +111,7 @@ def remove_from_cart_view(request, product_id):
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         cart_total = get_cart_total_quantity(request)
-        cart_items, total_price = get_cart_items(request)
+        total_price = get_cart_total_price(request)
         return JsonResponse({
             'success': True,
             'cart_total': cart_total,
@@ -132,8 +128,8 @@ def update_cart_item_view(request, product_id):
     update_cart_item(request, product_id, quantity)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        cart_total = get_cart_total_quantity(request)
         cart_items, total_price = get_cart_items(request)
+        cart_total = get_cart_total_quantity(request)
         
         # Найти обновленный товар
         item_total = Decimal('0')
@@ -179,7 +175,7 @@ def remove_ready_solution_from_cart_view(request, solution_id):
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         cart_total = get_cart_total_quantity(request)
-        cart_items, total_price = get_cart_items(request)
+        total_price = get_cart_total_price(request)
         return JsonResponse({
             'success': True,
             'cart_total': cart_total,
@@ -196,8 +192,8 @@ def update_ready_solution_cart_item_view(request, solution_id):
     update_ready_solution_cart_item(request, solution_id, quantity)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        cart_total = get_cart_total_quantity(request)
         cart_items, total_price = get_cart_items(request)
+        cart_total = get_cart_total_quantity(request)
         
         # Найти обновленное готовое решение
         item_total = Decimal('0')
@@ -216,10 +212,43 @@ def update_ready_solution_cart_item_view(request, solution_id):
     return redirect('cart')
 
 
+@require_POST
+def cart_batch_view(request):
+    """
+    Применить пачку изменений корзины одним запросом.
+
+    Тело запроса - JSON {"operations": [{"op", "type", "id", "quantity"}, ...]}.
+    В ответе новые суммы по строкам и по корзине.
+    """
+    try:
+        payload = json.loads(request.body)
+        operations = payload['operations']
+        if not isinstance(operations, list):
+            raise InvalidCartOperation('operations должен быть списком')
+        cart_items, total_price = apply_cart_operations(request, operations)
+    except (ValueError, KeyError, TypeError) as e:
+        # InvalidCartOperation и ошибки разбора JSON - наследники ValueError
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'cart_total': get_cart_total_quantity(request),
+        'total_price': str(total_price),
+        'items': [{
+            'type': item['type'],
+            'id': item[item['type']].id,
+            'quantity': item['quantity'],
+            'item_total': str(item['total']),
+        } for item in cart_items],
+    })
+
+
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=cart_info_etag, last_modified_func=cart_info_last_modified)
 def get_cart_info(request):
     """Получить информацию о корзине для AJAX"""
     cart_total = get_cart_total_quantity(request)
-    cart_items, total_price = get_cart_items(request)
+    total_price = get_cart_total_price(request)
     
     return JsonResponse({
         'cart_total': cart_total,
@@ -230,93 +259,29 @@ def get_cart_info(request):
 def create_order(request):
     """Создать заказ"""
     if request.method == 'POST':
-        cart_items, total_price = get_cart_items(request)
+        cart = get_cart(request)
         
-        if not cart_items:
+        if not cart:
             messages.error(request, 'Ваша корзина пуста')
             return redirect('cart')
         
         form = OrderForm(request.POST)
         
         if form.is_valid():
-            # Создать заказ
-            order = Order.objects.create(
-                customer_name=form.cleaned_data['customer_name'],
-                customer_phone=form.cleaned_data['customer_phone'],
-                order_date=form.cleaned_data['order_date'],
-                order_time=form.cleaned_data['order_time'],
-                delivery_address=form.cleaned_data['delivery_address'],
-                total_price=total_price,
-                status='new'
-            )
-            
-            # Создать товары заказа
-            order_items_text = []
-            for item in cart_items:
-                if item.get('type') == 'ready_solution':
-                    # Для готового решения создаем запись с фиксированной ценой
-                    # Можно создать отдельную модель OrderReadySolution или использовать продукт с ценой готового решения
-                    # Для упрощения используем Product с is_bundle=True или создаем запись напрямую
-                    ready_solution = item['ready_solution']
-                    # Создаем запись в OrderItem с ценой готового решения
-                    # Временно используем первый продукт из решения для хранения в OrderItem
-                    # В идеале нужно создать отдельную модель OrderReadySolutionItem
-                    if ready_solution.get_items():
-                        first_product = ready_solution.get_items()[0].product
-                        OrderItem.objects.create(
-                            order=order,
-                            product=first_product,
-                            quantity=item['quantity'],
-                            price=ready_solution.price
-                        )
-                        order_items_text.append(f"- {ready_solution.title} (готовое решение) x{item['quantity']} = {item['total']} ₽")
-                else:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item['product'],
-                        quantity=item['quantity'],
-                        price=item['product'].price
-                    )
-                    order_items_text.append(f"- {item['product'].title} x{item['quantity']} = {item['total']} ₽")
-            
-            # Отправить email с заказом
             try:
-                admin_email = getattr(settings, 'ADMIN_EMAIL', settings.DEFAULT_FROM_EMAIL)
-                if admin_email:
-                    subject = f'Новый заказ #{order.id} с сайта Maria Br'
-                    message = f"""
-Новый заказ с сайта:
-
-Номер заказа: #{order.id}
-Имя клиента: {order.customer_name}
-Телефон: {order.customer_phone}
-Дата заказа: {order.order_date}
-Время заказа: {order.order_time}
-Адрес доставки: {order.delivery_address}
-
-Товары:
-{chr(10).join(order_items_text)}
-
-Общая сумма: {order.total_price} ₽
-
-Статус: {order.get_status_display()}
-"""
-                    send_mail(
-                        subject,
-                        message,
-                        settings.DEFAULT_FROM_EMAIL or settings.EMAIL_HOST_USER,
-                        [admin_email],
-                        fail_silently=False,
-                    )
-            except Exception as e:
-                # Логируем ошибку, но не прерываем создание заказа
-                pass
-            
-            # Очистить корзину
-            clear_cart(request)
-            
-            messages.success(request, f'Заказ #{order.id} успешно оформлен! Мы свяжемся с вами в ближайшее время.')
-            return redirect('index')
+                order = place_order(cart, form.cleaned_data)
+            except EmptyCartError:
+                messages.error(request, 'Ваша корзина пуста')
+                return redirect('cart')
+            except DeliverySlotError as e:
+                form.add_error('order_time', str(e))
+                messages.error(request, str(e))
+            else:
+                # Очистить корзину
+                clear_cart(request)
+                
+                messages.success(request, f'Заказ #{order.id} успешно оформлен! Мы свяжемся с вами в ближайшее время.')
+                return redirect('index')
         else:
             messages.error(request, 'Пожалуйста, исправьте ошибки в форме')
     else:
@@ -334,4 +299,175 @@ def create_order(request):
         'form': form,
     }
     
-    return render(request, 'core/cart.html', context)
\ No newline at end of file
+    return render(request, 'core/cart.html', context)
+
+
+CATALOG_API_PAGE_SIZE = 24
+CATALOG_API_MAX_PAGE_SIZE = 100
+
+PRODUCT_API_FIELDS = (
+    'id', 'title', 'slug', 'price', 'priceAdditional', 'priceFor', 'availableFrom',
+    'description', 'ingredients', 'ingredientsList', 'imageMain', 'category__slug',
+)
+READY_SOLUTION_API_FIELDS = ('id', 'title', 'slug', 'price', 'persons_count', 'description', 'image_main')
+
+
+def _api_page_size(request):
+    try:
+        limit = int(request.GET.get('limit', CATALOG_API_PAGE_SIZE))
+    except ValueError:
+        limit = CATALOG_API_PAGE_SIZE
+    return max(1, min(limit, CATALOG_API_MAX_PAGE_SIZE))
+
+
+def _image_url(field_file_name, field):
+    if not field_file_name:
+        return None
+    return field.storage.url(field_file_name)
+
+
+def _decimal_or_none(value):
+    return str(value) if value is not None else None
+
+
+@use_catalog_replica
+@require_GET
+@cache_control(public=True, max_age=60)
+@condition(etag_func=catalog_api_etag, last_modified_func=catalog_api_last_modified)
+def catalog_products_api(request):
+    """
+    Опубликованные продукты постранично (keyset по title, id).
+
+    Фильтры: category - slug категории, with / without - ингредиенты,
+    которые должны быть или не должны быть в составе (можно повторять).
+    """
+    products = Product.objects.filter(is_published=True, is_bundle=False)
+    category = request.GET.get('category')
+    if category:
+        products = products.filter(category__slug=category)
+    products = filter_by_ingredients(products, request.GET.getlist('with'), request.GET.getlist('without'))
+
+    try:
+        rows, next_cursor = paginate_keyset(
+            products.values(*PRODUCT_API_FIELDS), request.GET.get('cursor'), _api_page_size(request)
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+    image_field = Product._meta.get_field('imageMain')
+    results = [{
+        'id': row['id'],
+        'title': row['title'],
+        'slug': row['slug'],
+        'category': row['category__slug'],
+        'price': str(row['price']),
+        'price_additional': _decimal_or_none(row['priceAdditional']),
+        'price_for_one': row['priceFor'],
+        'available_from': _decimal_or_none(row['availableFrom']),
+        'description': row['description'],
+        'ingredients': row['ingredients'],
+        'ingredients_list': [i.strip() for i in row['ingredientsList'].split(';')] if row['ingredientsList'] else [],
+        'image': _image_url(row['imageMain'], image_field),
+    } for row in rows]
+
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
+
+@use_catalog_replica
+@require_GET
+@cache_control(public=True, max_age=60)
+@condition(etag_func=catalog_api_etag, last_modified_func=catalog_api_last_modified)
+def catalog_ready_solutions_api(request):
+    """Опубликованные готовые решения постранично, с фильтром по количеству персон"""
+    solutions = ReadySolution.objects.filter(is_published=True)
+    persons = request.GET.get('persons')
+    if persons:
+        if not persons.isdigit():
+            return JsonResponse({'error': 'Некорректное количество персон'}, status=400)
+        solutions = solutions.filter(persons_count=int(persons))
+
+    try:
+        rows, next_cursor = paginate_keyset(
+            solutions.values(*READY_SOLUTION_API_FIELDS), request.GET.get('cursor'), _api_page_size(request)
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Некорректный курсор'}, status=400)
+
+    # Состав всех решений страницы одним запросом
+    items = {}
+    for item in ReadySolutionItem.objects.filter(ready_solution__in=[row['id'] for row in rows]).values(
+        'ready_solution_id', 'product_id', 'product__title', 'quantity'
+    ).order_by('order', 'product__title'):
+        items.setdefault(item['ready_solution_id'], []).append({
+            'product_id': item['product_id'],
+            'title': item['product__title'],
+            'quantity': item['quantity'],
+        })
+
+    image_field = ReadySolution._meta.get_field('image_main')
+    results = [{
+        'id': row['id'],
+        'title': row['title'],
+        'slug': row['slug'],
+        'persons_count': row['persons_count'],
+        'price': str(row['price']),
+        'description': row['description'],
+        'image': _image_url(row['image_main'], image_field),
+        'items': items.get(row['id'], []),
+    } for row in rows]
+
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
+
+SEARCH_RESULTS_LIMIT = 20
+
+
+@require_GET
+def search_view(request):
+    """Поиск продуктов на витрине"""
+    query = request.GET.get('q', '').strip()
+    products = search_products(query, limit=SEARCH_RESULTS_LIMIT) if query else []
+
+    return JsonResponse({
+        'query': query,
+        'results': [{
+            'id': product.id,
+            'title': product.title,
+            'slug': product.slug,
+            'category': product.category.slug,
+            'price': str(product.price),
+        } for product in products],
+    })
+
+
+DELIVERY_SLOTS_DEFAULT_DAYS = 14
+
+
+@require_GET
+@cache_control(public=True, max_age=30)
+def delivery_slots_view(request):
+    """
+    Окна доставки для выбора даты и времени в форме заказа.
+
+    Параметры from и to (ГГГГ-ММ-ДД, включительно), не больше
+    AVAILABILITY_MAX_DAYS дней. Даты без окон в ответ не попадают:
+    на них время выбирается свободно.
+    """
+    try:
+        date_from = date.fromisoformat(request.GET['from']) if 'from' in request.GET else date.today()
+        date_to = (
+            date.fromisoformat(request.GET['to']) if 'to' in request.GET
+            else date_from + timedelta(days=DELIVERY_SLOTS_DEFAULT_DAYS - 1)
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Даты ожидаются в формате ГГГГ-ММ-ДД'}, status=400)
+    if date_to < date_from or (date_to - date_from).days >= AVAILABILITY_MAX_DAYS:
+        return JsonResponse({'error': f'Диапазон должен быть от 1 до {AVAILABILITY_MAX_DAYS} дней'}, status=400)
+
+    availability = get_availability(date_from, date_to)
+    return JsonResponse({
+        'dates': {
+            day.isoformat(): [dict(slot, available=slot['remaining'] > 0) for slot in slots]
+            for day, slots in availability.items()
+        },
+    })
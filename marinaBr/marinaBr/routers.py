@@ -0,0 +1,142 @@
+"""
+Маршрутизация запросов между основной базой (default) и репликой (replica).
+
+Все записи и по умолчанию все чтения идут в default. На реплику уходят
+только чтения моделей каталога (REPLICA_MODELS) внутри replica_reads(): их
+включают представления витрины (API каталога, см. core.catalog.use_catalog_replica)
+и отчётов. Сессии, пользователи, заказы и остальные модели и там читаются
+из default: сессия, которой ещё нет на отставшей реплике, разлогинила бы
+клиента. Выгрузка заказов выбирает реплику явно (read_alias).
+
+Реплика отстаёт от основной базы, поэтому запрос, который уже что-то
+записал, дальше читает из default, а StickyPrimaryMiddleware ставит клиенту
+cookie на REPLICA_STICKY_SECONDS: его следующие запросы тоже читают из
+default и видят собственный заказ.
+
+Чтение с реплики включается настройкой DATABASE_REPLICA_READS. Локально
+репликой служит копия db.sqlite3, которую обновляет команда sync_replica.
+"""
+import functools
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+
+REPLICA_STICKY_SECONDS = 10
+STICKY_COOKIE_NAME = 'db_primary'
+
+# Модели, чтения которых внутри replica_reads() уходят на реплику
+REPLICA_MODELS = {
+    'core.category', 'core.product', 'core.productbundleitem', 'core.ingredient', 'core.productingredient',
+    'core.readysolution', 'core.readysolutionitem',
+}
+
+_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Состояние маршрутизации на время одного запроса"""
+
+    def __init__(self, sticky=False):
+        self.sticky = sticky  # клиент недавно писал, реплика может отставать
+        self.replica_reads = False
+        self.wrote = False
+
+
+def replica_enabled():
+    return getattr(settings, 'DATABASE_REPLICA_READS', False) and REPLICA in settings.DATABASES
+
+
+def read_alias(prefer_replica=False):
+    """
+    База для чтения в текущем запросе.
+
+    prefer_replica - для выборок, которые выполняются уже после выхода из
+    представления (потоковая выгрузка) и потому выбирают базу явно.
+    """
+    state = _routing.get()
+    if state is None:
+        use_replica = prefer_replica
+    else:
+        use_replica = (prefer_replica or state.replica_reads) and not (state.sticky or state.wrote)
+    return REPLICA if use_replica and replica_enabled() else PRIMARY
+
+
+@contextmanager
+def routing_scope(sticky=False):
+    """Отдельное состояние маршрутизации (на запрос)"""
+    state = RoutingState(sticky)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """Чтения внутри блока идут на реплику, пока в запросе не было записи"""
+    current = _routing.get()
+    with (nullcontext(current) if current is not None else routing_scope()) as state:
+        previous = state.replica_reads
+        state.replica_reads = True
+        try:
+            yield state
+        finally:
+            state.replica_reads = previous
+
+
+def use_replica(view):
+    """Декоратор представления только для чтения: читать с реплики"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Связанные объекты читаются из той же базы, что и исходный
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if model._meta.label_lower not in REPLICA_MODELS:
+            return PRIMARY
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия той же базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приезжает вместе с копией базы
+        if db == REPLICA:
+            return False
+        return None
+
+
+class StickyPrimaryMiddleware:
+    """После записи клиент несколько секунд читает из основной базы"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sticky = request.COOKIES.get(STICKY_COOKIE_NAME) == '1'
+        with routing_scope(sticky) as state:
+            response = self.get_response(request)
+        if state.wrote:
+            seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', REPLICA_STICKY_SECONDS)
+            response.set_cookie(STICKY_COOKIE_NAME, '1', max_age=seconds, httponly=True, samesite='Lax')
+        return response
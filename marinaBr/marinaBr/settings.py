@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'marinaBr.routers.StickyPrimaryMiddleware',
+    'core.middleware.CartMiddleware',
 ]
 
 ROOT_URLCONF = 'marinaBr.urls'
@@ -76,10 +79,73 @@ WSGI_APPLICATION = 'marinaBr.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Соединения переиспользуются воркером CONN_MAX_AGE секунд; PRAGMA (WAL и др.)
+# выставляет core.db.configure_sqlite при открытии соединения. timeout -
+# сколько секунд ждать, пока другой процесс держит блокировку на запись.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Реплика для чтения витрины и отчётов (см. marinaBr.routers). Локально -
+# копия db.sqlite3, которую обновляет команда sync_replica; чтение с неё
+# включается переменной окружения DB_REPLICA_READS=1, когда копия заведена.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': BASE_DIR / 'db_replica.sqlite3',
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['marinaBr.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_READS = os.environ.get('DB_REPLICA_READS') == '1'
+# Сколько секунд после записи клиент читает из основной базы
+REPLICA_STICKY_SECONDS = 10
+
+# PRAGMA для каждого нового соединения SQLite (core.db.configure_sqlite).
+# journal_mode=WAL сохраняется в самом файле базы: рядом с ним появляются
+# db.sqlite3-wal и db.sqlite3-shm. db.sqlite3 в репозитории уже переведён в WAL,
+# чтобы запуск команд не менял отслеживаемый файл
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,  # в КиБ, около 20 МБ
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Нагрузочным бенчмаркам (BENCHMARKS=1) нужна тестовая база в файле:
+# общая in-memory база SQLite блокирует таблицы при работе из нескольких потоков.
+if os.environ.get('BENCHMARKS') == '1':
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_benchmark.sqlite3'}
+
+
+# Корзина хранится в подписанной cookie, чтобы её изменения не писали в базу.
+# core.cart_storage.SessionCartStorage - хранение в сессии, как раньше.
+CART_STORAGE = 'core.cart_storage.CookieCartStorage'
+
+# Выполненные и отменённые заказы старше стольких дней (по дате доставки)
+# команда archive_orders переносит в архивные таблицы
+ORDER_ARCHIVE_AFTER_DAYS = 180
+
+
+# Cache
+# Файловый кэш общий для всех воркеров gunicorn на сервере,
+# поэтому сброс снимка каталога в одном воркере виден остальным.
+# MAX_ENTRIES с запасом: в кэше лежит по фрагменту на каждую карточку товара.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
@@ -87,139 +87,116 @@ function addReadySolutionToCart(solutionId, quantity = 1) {
     });
 }
 
-// Удалить готовое решение из корзины
-function removeReadySolutionFromCart(solutionId) {
-    const formData = new FormData();
-    formData.append('csrfmiddlewaretoken', csrftoken);
+// Изменения корзины на странице корзины копятся и уходят одним запросом
+const CART_BATCH_DELAY = 400;
+const pendingCartOperations = new Map();
+let cartBatchTimer = null;
+let cartBatchRequest = null;
 
-    fetch(`/cart/remove-solution/${solutionId}/`, {
-        method: 'POST',
-        headers: {
-            'X-Requested-With': 'XMLHttpRequest',
-        },
-        body: formData
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.success) {
-            updateCartBadge(data.cart_total);
-            // Удалить элемент из DOM
-            const cartItem = document.querySelector(`.cart-item[data-ready-solution-id="${solutionId}"]`);
-            if (cartItem) {
-                cartItem.remove();
-                // Обновить общую сумму
-                updateTotalPrice(data.total_price);
-                // Проверить, пуста ли корзина
-                checkEmptyCart();
-            }
-        }
-    })
-    .catch(error => {
-        console.error('Error:', error);
-        showNotification('Ошибка при удалении готового решения', 'error');
+// Найти строку корзины в DOM
+function getCartItemElement(type, id) {
+    if (type === 'ready_solution') {
+        return document.querySelector(`.cart-item[data-ready-solution-id="${id}"]`);
+    }
+    return document.querySelector(`.cart-item[data-product-id="${id}"]`);
+}
+
+// Поставить операцию в очередь: для одной строки важна только последняя
+function queueCartOperation(type, id, op, quantity = 0) {
+    pendingCartOperations.set(`${type}:${id}`, {
+        op: op,
+        type: type,
+        id: parseInt(id),
+        quantity: quantity,
     });
+    clearTimeout(cartBatchTimer);
+    cartBatchTimer = setTimeout(flushCartOperations, CART_BATCH_DELAY);
 }
 
-// Обновить количество готового решения
-function updateReadySolutionCartItem(solutionId, quantity) {
-    const formData = new FormData();
-    formData.append('quantity', quantity);
-    formData.append('csrfmiddlewaretoken', csrftoken);
+// Отправить накопленные операции. Одновременно идёт не больше одного запроса
+function flushCartOperations(keepalive = false) {
+    clearTimeout(cartBatchTimer);
+    if (cartBatchRequest) {
+        return cartBatchRequest.then(() => flushCartOperations(keepalive));
+    }
+    if (pendingCartOperations.size === 0) {
+        return Promise.resolve();
+    }
+
+    const operations = Array.from(pendingCartOperations.values());
+    pendingCartOperations.clear();
 
-    fetch(`/cart/update-solution/${solutionId}/`, {
+    cartBatchRequest = fetch('/cart/batch/', {
         method: 'POST',
         headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrftoken,
             'X-Requested-With': 'XMLHttpRequest',
         },
-        body: formData
+        body: JSON.stringify({ operations: operations }),
+        keepalive: keepalive,
     })
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            updateCartBadge(data.cart_total);
-            // Обновить отображение количества
-            const quantityDisplay = document.querySelector(`.cart-item[data-ready-solution-id="${solutionId}"] .quantity-display`);
-            if (quantityDisplay) {
-                quantityDisplay.textContent = quantity;
-            }
-            // Обновить общую сумму
-            updateTotalPrice(data.total_price);
+            applyCartState(data);
+        } else {
+            showNotification('Ошибка при обновлении корзины', 'error');
         }
     })
     .catch(error => {
         console.error('Error:', error);
-        showNotification('Ошибка при обновлении количества', 'error');
+        showNotification('Ошибка при обновлении корзины', 'error');
+    })
+    .finally(() => {
+        cartBatchRequest = null;
     });
+
+    return cartBatchRequest;
 }
 
-// Удалить товар из корзины
-function removeFromCart(productId) {
-    const formData = new FormData();
-    formData.append('csrfmiddlewaretoken', csrftoken);
+// Показать состояние корзины из ответа сервера
+function applyCartState(data) {
+    updateCartBadge(data.cart_total);
+    updateTotalPrice(data.total_price);
 
-    fetch(`/cart/remove/${productId}/`, {
-        method: 'POST',
-        headers: {
-            'X-Requested-With': 'XMLHttpRequest',
-        },
-        body: formData
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.success) {
-            updateCartBadge(data.cart_total);
-            // Удалить элемент из DOM
-            const cartItem = document.querySelector(`.cart-item[data-product-id="${productId}"]`);
-            if (cartItem) {
-                cartItem.remove();
-                // Обновить общую сумму
-                updateTotalPrice(data.total_price);
-                // Проверить, пуста ли корзина
-                checkEmptyCart();
-            }
+    data.items.forEach(item => {
+        const cartItem = getCartItemElement(item.type, item.id);
+        if (!cartItem) {
+            return;
+        }
+        // Количество не трогаем, если по строке уже есть новые клики
+        const quantityDisplay = cartItem.querySelector('.quantity-display');
+        if (quantityDisplay && !pendingCartOperations.has(`${item.type}:${item.id}`)) {
+            quantityDisplay.textContent = item.quantity;
+        }
+        const itemTotal = cartItem.querySelector('.item-total');
+        if (itemTotal) {
+            itemTotal.textContent = item.item_total + ' ₽';
         }
-    })
-    .catch(error => {
-        console.error('Error:', error);
-        showNotification('Ошибка при удалении товара', 'error');
     });
 }
 
-// Обновить количество товара
-function updateCartItem(productId, quantity) {
-    const formData = new FormData();
-    formData.append('quantity', quantity);
-    formData.append('csrfmiddlewaretoken', csrftoken);
+// Изменить количество в строке корзины
+function changeCartItemQuantity(type, id, delta) {
+    const cartItem = getCartItemElement(type, id);
+    const quantityDisplay = cartItem.querySelector('.quantity-display');
+    const quantity = parseInt(quantityDisplay.textContent) + delta;
+    if (quantity < 1) {
+        return;
+    }
+    quantityDisplay.textContent = quantity;
+    queueCartOperation(type, id, 'update', quantity);
+}
 
-    fetch(`/cart/update/${productId}/`, {
-        method: 'POST',
-        headers: {
-            'X-Requested-With': 'XMLHttpRequest',
-        },
-        body: formData
-    })
-    .then(response => response.json())
-    .then(data => {
-        if (data.success) {
-            updateCartBadge(data.cart_total);
-            // Обновить отображение количества
-            const quantityDisplay = document.querySelector(`.cart-item[data-product-id="${productId}"] .quantity-display`);
-            if (quantityDisplay) {
-                quantityDisplay.textContent = quantity;
-            }
-            // Обновить сумму товара
-            const itemTotal = document.querySelector(`.cart-item[data-product-id="${productId}"] .item-total`);
-            if (itemTotal) {
-                itemTotal.textContent = data.item_total + ' ₽';
-            }
-            // Обновить общую сумму
-            updateTotalPrice(data.total_price);
-        }
-    })
-    .catch(error => {
-        console.error('Error:', error);
-        showNotification('Ошибка при обновлении количества', 'error');
-    });
+// Удалить строку корзины
+function removeCartItem(type, id) {
+    const cartItem = getCartItemElement(type, id);
+    if (cartItem) {
+        cartItem.remove();
+    }
+    queueCartOperation(type, id, 'remove');
+    checkEmptyCart();
 }
 
 // Обновить общую сумму
@@ -234,13 +211,19 @@ function updateTotalPrice(totalPrice) {
     }
 }
 
-// Проверить, пуста ли корзина
+// Проверить, пуста ли корзина, и показать пустое состояние без перезагрузки
 function checkEmptyCart() {
-    const cartItems = document.querySelectorAll('.cart-item');
-    if (cartItems.length === 0) {
-        // Перезагрузить страницу для показа пустой корзины
-        window.location.reload();
+    const cartSection = document.querySelector('.cart');
+    if (!cartSection || document.querySelectorAll('.cart-item').length > 0) {
+        return;
     }
+    cartSection.querySelectorAll('.cart__divider, .cart__items, .cart__summary-top, .cart__order-form').forEach(element => {
+        element.remove();
+    });
+    const empty = document.createElement('div');
+    empty.className = 'cart__empty';
+    empty.innerHTML = '<p>Ваша корзина пуста</p><a href="/" class="button-continue">Вернуться к покупкам</a>';
+    cartSection.appendChild(empty);
 }
 
 // Показать уведомление
@@ -330,79 +313,63 @@ document.addEventListener('DOMContentLoaded', function() {
 // Обработчики для страницы корзины
 document.addEventListener('DOMContentLoaded', function() {
     // Кнопки увеличения количества
-    const increaseButtons = document.querySelectorAll('.increase-btn');
-    increaseButtons.forEach(button => {
+    document.querySelectorAll('.increase-btn').forEach(button => {
         button.addEventListener('click', function() {
-            const productId = this.getAttribute('data-product-id');
-            const quantitySpan = this.parentElement.querySelector('.quantity-display');
-            let quantity = parseInt(quantitySpan.textContent);
-            quantity++;
-            updateCartItem(productId, quantity);
+            changeCartItemQuantity('product', this.getAttribute('data-product-id'), 1);
         });
     });
     
     // Кнопки уменьшения количества
-    const decreaseButtons = document.querySelectorAll('.decrease-btn');
-    decreaseButtons.forEach(button => {
+    document.querySelectorAll('.decrease-btn').forEach(button => {
         button.addEventListener('click', function() {
-            const productId = this.getAttribute('data-product-id');
-            const quantitySpan = this.parentElement.querySelector('.quantity-display');
-            let quantity = parseInt(quantitySpan.textContent);
-            if (quantity > 1) {
-                quantity--;
-                updateCartItem(productId, quantity);
-            }
+            changeCartItemQuantity('product', this.getAttribute('data-product-id'), -1);
         });
     });
     
     // Кнопки увеличения количества для готовых решений
-    const increaseSolutionButtons = document.querySelectorAll('.increase-btn-solution');
-    increaseSolutionButtons.forEach(button => {
+    document.querySelectorAll('.increase-btn-solution').forEach(button => {
         button.addEventListener('click', function() {
-            const solutionId = this.getAttribute('data-ready-solution-id');
-            const quantitySpan = this.parentElement.querySelector('.quantity-display');
-            let quantity = parseInt(quantitySpan.textContent);
-            quantity++;
-            updateReadySolutionCartItem(solutionId, quantity);
+            changeCartItemQuantity('ready_solution', this.getAttribute('data-ready-solution-id'), 1);
         });
     });
     
     // Кнопки уменьшения количества для готовых решений
-    const decreaseSolutionButtons = document.querySelectorAll('.decrease-btn-solution');
-    decreaseSolutionButtons.forEach(button => {
+    document.querySelectorAll('.decrease-btn-solution').forEach(button => {
         button.addEventListener('click', function() {
-            const solutionId = this.getAttribute('data-ready-solution-id');
-            const quantitySpan = this.parentElement.querySelector('.quantity-display');
-            let quantity = parseInt(quantitySpan.textContent);
-            if (quantity > 1) {
-                quantity--;
-                updateReadySolutionCartItem(solutionId, quantity);
-            }
+            changeCartItemQuantity('ready_solution', this.getAttribute('data-ready-solution-id'), -1);
         });
     });
     
     // Кнопки удаления для продуктов
-    const removeButtons = document.querySelectorAll('.remove-btn');
-    removeButtons.forEach(button => {
+    document.querySelectorAll('.remove-btn').forEach(button => {
         button.addEventListener('click', function() {
-            const productId = this.getAttribute('data-product-id');
             if (confirm('Удалить товар из корзины?')) {
-                removeFromCart(productId);
+                removeCartItem('product', this.getAttribute('data-product-id'));
             }
         });
     });
     
     // Кнопки удаления для готовых решений
-    const removeSolutionButtons = document.querySelectorAll('.remove-btn-solution');
-    removeSolutionButtons.forEach(button => {
+    document.querySelectorAll('.remove-btn-solution').forEach(button => {
         button.addEventListener('click', function() {
-            const solutionId = this.getAttribute('data-ready-solution-id');
             if (confirm('Удалить готовое решение из корзины?')) {
-                removeReadySolutionFromCart(solutionId);
+                removeCartItem('ready_solution', this.getAttribute('data-ready-solution-id'));
             }
         });
     });
     
+    // Перед оформлением заказа корзина на сервере должна совпадать с экраном
+    const orderForm = document.getElementById('order-form');
+    if (orderForm) {
+        orderForm.addEventListener('submit', function(event) {
+            if (pendingCartOperations.size === 0 && !cartBatchRequest) {
+                return;
+            }
+            event.preventDefault();
+            flushCartOperations().then(() => orderForm.submit());
+        });
+    }
+    
     // Кнопка оформления заказа
     const orderBtn = document.getElementById('order-btn');
     if (orderBtn) {
@@ -412,4 +379,9 @@ document.addEventListener('DOMContentLoaded', function() {
             alert('Для оформления заказа свяжитесь с нами по телефону +7(953)596-55-20 или через форму обратной связи на главной странице.');
         });
     }
+    
+    // Не терять изменения при уходе со страницы
+    window.addEventListener('pagehide', function() {
+        flushCartOperations(true);
+    });
 });
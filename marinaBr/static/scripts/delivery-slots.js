@@ -0,0 +1,94 @@
+// Выбор окна доставки в форме заказа
+document.addEventListener('DOMContentLoaded', function() {
+    const orderForm = document.getElementById('order-form');
+    const dateInput = document.getElementById('id_order_date');
+    const timeInput = document.getElementById('id_order_time');
+    const slotSelect = document.getElementById('id_order_slot');
+
+    if (!orderForm || !dateInput || !timeInput || !slotSelect) {
+        return;
+    }
+
+    const slotsUrl = orderForm.dataset.slotsUrl;
+    // Окна загружаются на две недели вперёд и подгружаются, если дата дальше
+    const loadedDates = new Map();
+    const loadedRanges = [];
+
+    function isoDate(date) {
+        return date.toISOString().slice(0, 10);
+    }
+
+    function loadSlots(day) {
+        if (loadedRanges.some(range => range.from <= day && day <= range.to)) {
+            return Promise.resolve();
+        }
+        const to = new Date(day);
+        to.setDate(to.getDate() + 13);
+        const range = {from: day, to: isoDate(to)};
+
+        return fetch(`${slotsUrl}?from=${range.from}&to=${range.to}`)
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(data => {
+                Object.entries(data.dates).forEach(([date, slots]) => loadedDates.set(date, slots));
+                loadedRanges.push(range);
+            });
+    }
+
+    // Окон на дату нет: время выбирается свободно
+    function showTimeInput() {
+        slotSelect.hidden = true;
+        slotSelect.required = false;
+        timeInput.hidden = false;
+        timeInput.required = true;
+    }
+
+    function showSlots(slots) {
+        const current = timeInput.value;
+        slotSelect.innerHTML = '<option value="">Выберите время</option>';
+
+        slots.forEach(slot => {
+            const option = document.createElement('option');
+            option.value = slot.start;
+            option.disabled = !slot.available;
+            option.textContent = slot.available
+                ? `${slot.start}–${slot.end}`
+                : `${slot.start}–${slot.end} (мест нет)`;
+            if (slot.available && current >= slot.start && current < slot.end) {
+                option.selected = true;
+            }
+            slotSelect.appendChild(option);
+        });
+
+        timeInput.value = slotSelect.value;
+        timeInput.hidden = true;
+        timeInput.required = false;
+        slotSelect.hidden = false;
+        slotSelect.required = true;
+    }
+
+    function updateSlots() {
+        const day = dateInput.value;
+        if (!day) {
+            showTimeInput();
+            return;
+        }
+
+        loadSlots(day)
+            .then(() => {
+                const slots = loadedDates.get(day);
+                if (slots && slots.length) {
+                    showSlots(slots);
+                } else {
+                    showTimeInput();
+                }
+            })
+            .catch(() => showTimeInput());
+    }
+
+    slotSelect.addEventListener('change', function() {
+        timeInput.value = slotSelect.value;
+    });
+
+    dateInput.addEventListener('change', updateSlots);
+    updateSlots();
+});